@@ -5,43 +5,201 @@ Created on Fri Mar 18 15:18:23 2022
 @author: jnevin
 """
 import networkx as nx
-from ndlib.viz.mpl.DiffusionTrend import DiffusionTrend
-from ndlib.viz.mpl.DiffusionPrevalence import DiffusionPrevalence
-from ndlib.viz.mpl.TrendComparison import DiffusionTrendComparison
 import future.utils
 import numpy as np
 import pandas as pd
+from nidmod.parallel import get_pool_context, split_into_chunks
+from nidmod.stagecache import graph_fingerprint, hash_inputs
+from nidmod.analyser.trendstore import TrendStore
+
+# the graph used by pool workers computing exact metrics, set once per worker process
+_worker_graph = None
+
+def _init_metric_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+def _betweenness_chunk(sources):
+    return nx.betweenness_centrality_subset(_worker_graph, sources, list(_worker_graph.nodes()),
+                                            normalized = False)
+
+def _closeness_chunk(nodes):
+    return {node: nx.closeness_centrality(_worker_graph, u = node) for node in nodes}
+
+# computes exact betweenness centrality with the source nodes split over a process pool
+def parallel_betweenness_centrality(graph, n_workers):
+    nodes = list(graph.nodes())
+    betweenness = dict.fromkeys(nodes, 0.0)
+    with get_pool_context().Pool(processes = n_workers, initializer = _init_metric_worker,
+                                 initargs = (graph,)) as pool:
+        for partial_betweenness in pool.imap_unordered(_betweenness_chunk,
+                                                       split_into_chunks(nodes, 4 * n_workers)):
+            for node, value in partial_betweenness.items():
+                betweenness[node] += value
+    
+    # same normalisation as nx.betweenness_centrality
+    num_nodes = len(nodes)
+    if num_nodes > 2:
+        scale = 1 / ((num_nodes - 1) * (num_nodes - 2))
+        if not graph.is_directed():
+            scale *= 2
+        betweenness = {node: value * scale for node, value in betweenness.items()}
+    return betweenness
+
+# computes exact closeness centrality with the nodes split over a process pool
+def parallel_closeness_centrality(graph, n_workers):
+    closeness = {}
+    with get_pool_context().Pool(processes = n_workers, initializer = _init_metric_worker,
+                                 initargs = (graph,)) as pool:
+        for partial_closeness in pool.imap_unordered(_closeness_chunk,
+                                                     split_into_chunks(list(graph.nodes()), 4 * n_workers)):
+            closeness.update(partial_closeness)
+    return {node: closeness[node] for node in graph.nodes()}
+
+# returns the Hoeffding bound on the error of a mean of num_samples values in [0, value_range],
+# holding for all num_nodes estimates at once with the given confidence
+def sampling_error_bound(num_samples, num_nodes, confidence, value_range = 1):
+    return value_range * np.sqrt(np.log(2 * max(num_nodes, 1) / (1 - confidence)) / (2 * num_samples))
+
+# estimates closeness centrality from shortest path lengths to a sample of pivot nodes
+# returns the estimates and a bound on their error (in closeness, for connected graphs)
+def sampled_closeness_centrality(graph, num_samples, confidence = 0.95, seed = None):
+    nodes = list(graph.nodes())
+    num_nodes = len(nodes)
+    num_samples = min(num_samples, num_nodes)
+    rng = np.random.default_rng(seed)
+    pivots = [nodes[i] for i in rng.choice(num_nodes, num_samples, replace = False)]
+    
+    distance_sums = dict.fromkeys(nodes, 0)
+    reached_counts = dict.fromkeys(nodes, 0)
+    eccentricities = []
+    for pivot in pivots:
+        # distances from the pivot are the incoming distances nx.closeness_centrality uses
+        path_lengths = nx.single_source_shortest_path_length(graph, pivot)
+        for node, length in path_lengths.items():
+            if node != pivot:
+                distance_sums[node] += length
+                reached_counts[node] += 1
+        eccentricities.append(max(path_lengths.values()))
+    
+    closeness = {}
+    for node in nodes:
+        if distance_sums[node] > 0 and num_nodes > 1:
+            reached_fraction = reached_counts[node] / num_samples
+            estimated_distance_sum = distance_sums[node] * (num_nodes - 1) / num_samples
+            closeness[node] = reached_fraction * reached_fraction * (num_nodes - 1) / estimated_distance_sum
+        else:
+            closeness[node] = 0.0
+    
+    # any pivot's eccentricity bounds the diameter to within a factor of two when connected
+    if graph.is_directed() or not nx.is_connected(graph):
+        diameter_bound = max(eccentricities)
+    else:
+        diameter_bound = 2 * min(eccentricities)
+    distance_error = sampling_error_bound(num_samples, num_nodes, confidence, diameter_bound)
+    
+    # closeness is one over the average distance, which is at least 1 and within distance_error
+    # of the estimated average distance, so converting the bound to closeness units
+    closeness_error = 0.0
+    for node in nodes:
+        if closeness[node] > 0:
+            estimated_distance = 1 / closeness[node]
+            closeness_error = max(closeness_error,
+                                  1 / max(1, estimated_distance - distance_error) - closeness[node])
+    return closeness, closeness_error
+
+# returns a dictionary of graph properties
+# betweenness and closeness are estimated from the given numbers of sampled source nodes,
+# with '_error' entries bounding the error at the given confidence, otherwise they are exact
+# and computed over n_workers processes
+def get_graph_properties(graph, metrics, betweenness_samples = None, closeness_samples = None,
+                         confidence = 0.95, n_workers = None, seed = None):
+    num_nodes = graph.number_of_nodes()
+    parallel = n_workers is not None and n_workers > 1
+    properties_dict = {}
+    for metric in metrics:
+        if metric == 'num_nodes':
+            properties_dict['num_nodes'] = num_nodes
+        elif metric == 'num_edges':
+            properties_dict['num_edges'] = graph.number_of_edges()
+        elif metric == 'connected':
+            properties_dict['connected'] = nx.is_connected(graph)
+        elif metric == 'degree_cent':
+            properties_dict['degree_cent'] = nx.degree_centrality(graph)
+        elif metric == 'betweenness':
+            if betweenness_samples is not None and betweenness_samples < num_nodes:
+                properties_dict['betweenness'] = nx.betweenness_centrality(graph, k = betweenness_samples,
+                                                                           seed = seed)
+                properties_dict['betweenness_error'] = sampling_error_bound(betweenness_samples, num_nodes,
+                                                                            confidence)
+            elif parallel:
+                properties_dict['betweenness'] = parallel_betweenness_centrality(graph, n_workers)
+            else:
+                properties_dict['betweenness'] = nx.betweenness_centrality(graph)
+        elif metric == 'closeness':
+            if closeness_samples is not None and closeness_samples < num_nodes:
+                properties_dict['closeness'], properties_dict['closeness_error'] = sampled_closeness_centrality(
+                    graph, closeness_samples, confidence, seed)
+            elif parallel:
+                properties_dict['closeness'] = parallel_closeness_centrality(graph, n_workers)
+            else:
+                properties_dict['closeness'] = nx.closeness_centrality(graph)
+        else:
+            raise ValueError('Unknown graph property: ' + str(metric))
+    
+    return properties_dict
 
 class ResultsAnalyser:
     '''
     Class for analysing diffusion results and the graph itself
+    
+    Trends can be given in ndlib's format or as a TrendStore
+    
+    Graph properties are cached under a structural fingerprint of the graph, and the cache
+    can be shared between analysers so duplicate graphs are only analysed once
     '''
-    def __init__(self, model, graph, trends):
+    available_graph_properties = ['num_nodes', 'num_edges', 'connected', 'degree_cent',
+                                  'betweenness', 'closeness']
+    
+    def __init__(self, model, graph, trends, property_cache = None):
         self.model = model
         self.graph = graph
-        self.trends = trends
+        if isinstance(trends, TrendStore):
+            self.trend_store = trends
+            self._trends = None
+        else:
+            self.trend_store = None
+            self._trends = trends
         statuses = model.available_statuses
         self.srev = {v: k for k, v in future.utils.iteritems(statuses)}
         self.num_nodes = self.graph.number_of_nodes()
         self.num_sims = len(trends)
+        self.property_cache = property_cache if property_cache is not None else {}
+        self.graph_fingerprint = None
      
-    # returns a dictionary of graph properties
-    def get_graph_properties(self):
-        num_nodes = len(self.graph.nodes())
-        num_edges = len(self.graph.edges())
-        connected = nx.is_connected(self.graph)
-        degree_cent = nx.degree_centrality(self.graph)
-        betweenness = nx.betweenness_centrality(self.graph)
-        closeness = nx.closeness_centrality(self.graph)
+    # returns a dictionary of graph properties (see get_graph_properties), cached by graph fingerprint
+    def get_graph_properties(self, metrics = None, betweenness_samples = None, 
+                             closeness_samples = None, confidence = 0.95, n_workers = None,
+                             seed = None):
+        if metrics is None:
+            metrics = self.available_graph_properties
         
-        properties_dict = {'num_nodes': num_nodes, 'num_edges': num_edges,
-                           'connected': connected, 'degree_cent': degree_cent,
-                           'betweenness': betweenness, 'closeness': closeness}
+        if self.graph_fingerprint is None:
+            self.graph_fingerprint = graph_fingerprint(self.graph)
+        cache_key = hash_inputs(self.graph_fingerprint, list(metrics), betweenness_samples,
+                                closeness_samples, confidence, seed)
+        if cache_key in self.property_cache:
+            return dict(self.property_cache[cache_key])
         
-        return properties_dict
+        properties_dict = get_graph_properties(self.graph, metrics, betweenness_samples, closeness_samples,
+                                               confidence, n_workers, seed)
+        self.property_cache[cache_key] = properties_dict
+        return dict(properties_dict)
     
     # plots the diffusion trends
+    # (plotting backends are only imported here, keeping matplotlib out of non-plotting processes)
     def plot_diff_trend(self, plot_params = None):
+        from ndlib.viz.mpl.DiffusionTrend import DiffusionTrend
         viz = DiffusionTrend(self.model, self.trends)
         if plot_params is not None:
             viz.plot(*plot_params)
@@ -50,70 +208,69 @@ class ResultsAnalyser:
     
     # plots the diffusion prevalence (derivative)
     def plot_diff_prevalence(self, plot_params = None):
+        from ndlib.viz.mpl.DiffusionPrevalence import DiffusionPrevalence
         viz = DiffusionPrevalence(self.model, self.trends)
         if plot_params is not None:
             viz.plot(*plot_params)
         else:
             viz.plot()        
     
+    # the trends in ndlib's format, converted from the trend store on first use
+    @property
+    def trends(self):
+        if self._trends is None:
+            self._trends = self.trend_store.to_trends()
+        return self._trends
+    
+    # returns the trends as a TrendStore, converting them on first use
+    def get_trend_store(self):
+        if self.trend_store is None:
+            self.trend_store = TrendStore.from_trends(self.trends, self.model.available_statuses,
+                                                      self.num_nodes)
+        return self.trend_store
+    
     # returns a dictionary of statistics from the trends
+    # peaks and finals are fractions of nodes, peak and stable times are in iterations
     def get_average_statistics(self):
-        # calculate aggregate statistics (peaks, final, times to peak and stable)
-        #stability_rand.append([trends[j]['trends']['node_count'][0].index(trends[j]['trends']['node_count'][0][-1]) for j in range(10)])
-        #peak_time_rand.append([trends[j]['trends']['node_count'][1].index(max(trends[j]['trends']['node_count'][1])) for j in range(10)])
-        
-        final_vals = []
-        peak_vals = []
-        
-        for i in range(self.num_sims):
-            final_vals.append([self.trends[i]['trends']['node_count'][j][-1] 
-                                   for j in self.srev])
-            peak_vals.append([max(self.trends[i]['trends']['node_count'][j]) 
-                                   for j in self.srev])
-        peak_vals = np.mean(np.array(peak_vals)/self.num_nodes, axis = 0)
-        final_vals = np.mean(np.array(final_vals)/self.num_nodes, axis = 0)
-        
-        
-        peak_state_names = [x + '_peak' for x in list(self.srev.values())]
-        final_state_names = [x + '_final' for x in list(self.srev.values())]
-        
-        measurement_names = peak_state_names + final_state_names
-        measurement_values = np.concatenate((peak_vals, final_vals))
-        average_measurements = dict(zip(measurement_names, 
-                                          measurement_values))
-        
-        return average_measurements
+        return self.get_trend_store().get_average_statistics()
     
 class MultiResultsAnalyser:
     '''
     Class for jointly analysing multiple graphs and diffusion results
+    
+    The analysers share one graph property cache, so duplicate graphs are only analysed once
     '''
     def __init__(self, results_analysers):
         self.results_analysers = results_analysers
+        self.property_cache = {}
+        for results_analyser in results_analysers:
+            results_analyser.property_cache = self.property_cache
     
     # returns a dataframe of average trend statistics for the indexed graphs
+    # analysers shared by several indices (e.g. for duplicate graphs) are only measured once
     def get_average_stat_comparison(self, indices = None):
-        stat_compare_df = pd.DataFrame()
         if indices is None:
             indices = np.arange(len(self.results_analysers))
+        average_statistics = {}
         for idx in indices:
-            stat_compare_df = stat_compare_df.append(self.results_analysers[idx].get_average_statistics(),
-                                   ignore_index = True)
-        stat_compare_df.index = indices
+            results_analyser = self.results_analysers[idx]
+            if id(results_analyser) not in average_statistics:
+                average_statistics[id(results_analyser)] = results_analyser.get_average_statistics()
+        stat_compare_df = pd.DataFrame([average_statistics[id(self.results_analysers[idx])]
+                                        for idx in indices], index = indices)
         return stat_compare_df
     
     # returns a dataframe of graph statistics for the indexed graphs
-    def get_graph_prop_comparison(self, indices = None):
-        graph_compare_df = pd.DataFrame()
+    # property_options are passed on to each analyser's get_graph_properties
+    def get_graph_prop_comparison(self, indices = None, **property_options):
         if indices is None:
             indices = np.arange(len(self.results_analysers))
-        for idx in indices:
-            graph_compare_df = graph_compare_df.append(self.results_analysers[idx].get_graph_properties(),
-                                   ignore_index = True)
-        graph_compare_df.index = indices
+        graph_compare_df = pd.DataFrame([self.results_analysers[idx].get_graph_properties(**property_options)
+                                         for idx in indices], index = indices)
         return graph_compare_df
         
     def plot_trend_comparison(self, indices, statuses = 'Infected'):
+        from ndlib.viz.mpl.TrendComparison import DiffusionTrendComparison
         # plot sets of models and trends, haven't implemented plotting parms yet
         viz = DiffusionTrendComparison([self.results_analysers[i].model for i in indices],
                                        [self.results_analysers[i].trends for i in indices],
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:52:30 2026
+
+@author: jnevin
+"""
+
+import json
+import numpy as np
+
+class TrendStore:
+    '''
+    Class for storing diffusion trends as a single (sims x statuses x iterations) count array
+
+    Statuses are indexed by their model status code, and statuses maps codes to status names
+
+    Statistics are computed with vectorised operations over all simulations at once, and the
+    store can be saved to a .npy file (plus a .json file of metadata) and reopened memory-mapped
+    
+    Stopping iterations of early stopped runs are kept alongside the counts when available
+    '''
+    def __init__(self, node_counts, statuses, num_nodes = None, stopping_iterations = None):
+        self.node_counts = node_counts
+        self.statuses = statuses
+        self.stopping_iterations = stopping_iterations
+        if num_nodes is None:
+            num_nodes = int(node_counts[:, :, 0].sum(axis = 1).max()) if node_counts.size else 0
+        self.num_nodes = num_nodes
+
+    def __len__(self):
+        return self.node_counts.shape[0]
+
+    # creates a store from trends in ndlib's format, runs shorter than the longest are padded with their final value
+    @classmethod
+    def from_trends(cls, trends, available_statuses, num_nodes = None):
+        statuses = {v: k for k, v in available_statuses.items()}
+        codes = sorted(statuses)
+        num_iterations = max([len(trend['trends']['node_count'][codes[0]]) for trend in trends], default = 0)
+        if num_nodes is None and num_iterations > 0:
+            num_nodes = sum(trends[0]['trends']['node_count'][code][0] for code in codes)
+
+        node_counts = np.zeros((len(trends), len(codes), num_iterations),
+                               dtype = np.min_scalar_type(max(num_nodes or 0, 1)))
+        for i, trend in enumerate(trends):
+            for j, code in enumerate(codes):
+                counts = trend['trends']['node_count'][code]
+                node_counts[i, j, :len(counts)] = counts
+                if 0 < len(counts) < num_iterations:
+                    node_counts[i, j, len(counts):] = counts[-1]
+        stopping_iterations = None
+        if len(trends) > 0 and all('stopping_iteration' in trend for trend in trends):
+            stopping_iterations = np.array([trend['stopping_iteration'] for trend in trends])
+        return cls(node_counts, dict((j, statuses[code]) for j, code in enumerate(codes)), num_nodes,
+                   stopping_iterations)
+
+    # returns the trends in ndlib's format, e.g. for the ndlib plotting functions
+    def to_trends(self):
+        trends = []
+        for i in range(len(self)):
+            node_count = np.asarray(self.node_counts[i], dtype = np.int64)
+            status_delta = np.zeros_like(node_count)
+            status_delta[:, 1:] = np.diff(node_count, axis = 1)
+            trends.append({'trends': {'node_count': dict(zip(self.statuses, node_count.tolist())),
+                                      'status_delta': dict(zip(self.statuses, status_delta.tolist()))}})
+            if self.stopping_iterations is not None:
+                trends[-1]['stopping_iteration'] = int(self.stopping_iterations[i])
+        return trends
+
+    # returns a dictionary of (sims x statuses) arrays of peak and final counts, and times to peak and stable
+    # the time to stable is the first iteration from which the count stays at its final value
+    def get_statistics(self):
+        node_counts = self.node_counts
+        final_vals = node_counts[:, :, -1]
+        changed = node_counts != final_vals[:, :, np.newaxis]
+        last_changed = node_counts.shape[2] - 1 - np.argmax(changed[:, :, ::-1], axis = 2)
+        stable_times = np.where(changed.any(axis = 2), last_changed + 1, 0)
+        return {'peak': node_counts.max(axis = 2), 'final': final_vals,
+                'peak_time': node_counts.argmax(axis = 2), 'stable_time': stable_times}
+
+    # returns a dictionary of statistics averaged over simulations, with counts as fractions of nodes
+    def get_average_statistics(self):
+        statistics = self.get_statistics()
+        names = [self.statuses[j] for j in sorted(self.statuses)]
+        average_measurements = {}
+        for statistic in ['peak', 'final', 'peak_time', 'stable_time']:
+            values = np.mean(statistics[statistic], axis = 0)
+            if statistic in ['peak', 'final']:
+                values = values / self.num_nodes
+            average_measurements.update(zip([name + '_' + statistic for name in names], values))
+        if self.stopping_iterations is not None:
+            average_measurements['stopping_iteration'] = np.mean(self.stopping_iterations)
+        return average_measurements
+
+    # saves the counts to filename.npy and the metadata to filename.json
+    def save(self, filename):
+        np.save(filename + '.npy', self.node_counts)
+        with open(filename + '.json', 'w') as metadata_file:
+            json.dump({'statuses': [self.statuses[j] for j in sorted(self.statuses)],
+                       'num_nodes': self.num_nodes,
+                       'stopping_iterations': None if self.stopping_iterations is None
+                       else np.asarray(self.stopping_iterations).tolist()}, metadata_file)
+
+    # reopens a saved store, memory-mapping the counts unless mmap_mode is None
+    @classmethod
+    def load(cls, filename, mmap_mode = 'r'):
+        with open(filename + '.json') as metadata_file:
+            metadata = json.load(metadata_file)
+        node_counts = np.load(filename + '.npy', mmap_mode = mmap_mode)
+        stopping_iterations = metadata.get('stopping_iterations')
+        if stopping_iterations is not None:
+            stopping_iterations = np.array(stopping_iterations)
+        return cls(node_counts, dict(enumerate(metadata['statuses'])), metadata['num_nodes'],
+                   stopping_iterations)
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:31:09 2026
+
+@author: jnevin
+"""
+
+'''
+Point for benchmarking the pipeline stages on synthetic attributed networks.
+
+Each stage is timed (and optionally memory-profiled with tracemalloc, which slows the
+stage down, so traced times should only be compared with traced times). Results are
+saved as JSON and can be compared against a baseline run, e.g.
+
+    python -m nidmod.benchmarking.benchmarks --sizes 500 1000 2000 --output results.json
+    python -m nidmod.benchmarking.benchmarks --sizes 500 1000 2000 --baseline results.json
+
+Import times of the main modules can also be checked against a budget in seconds, e.g.
+
+    python -m nidmod.benchmarking.benchmarks --import-budget 2.5
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+from nidmod.datahandling.dataintegration import FeatureSetup, MatchClassifier, SourceLinker, NetworkIntegrator
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel
+from nidmod.analyser.networkanalysis import ResultsAnalyser
+
+# returns the result of calling function, and a dictionary of its wall time in seconds
+# and (if trace_memory) the peak memory allocated while it ran in bytes
+def measure_stage(function, trace_memory = False):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        elapsed = time.perf_counter() - start
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    measurements = {'time': elapsed}
+    if trace_memory:
+        measurements['peak_memory'] = peak_memory
+    return result, measurements
+
+# modules whose import time is checked, and the optional dependencies they should not import
+IMPORT_MODULES = ['nidmod.parameter_sweeper', 'nidmod.integration_pipeline', 'nidmod.analyser.networkanalysis',
+                  'nidmod.datahandling.dataintegration']
+DEFERRED_MODULES = ['cdlib', 'ndlib.viz', 'matplotlib.pyplot', 'ndlib.models', 'recordlinkage', 'sklearn']
+
+# returns {module: {'time': seconds, 'deferred_loaded': [...]}}, importing each module in a fresh
+# interpreter and keeping the fastest of the repeats
+def measure_import_times(modules = IMPORT_MODULES, repeats = 3):
+    code = ('import sys, time, json; start = time.perf_counter(); import {module}; '
+            'elapsed = time.perf_counter() - start; '
+            'print(json.dumps([elapsed, [name for name in {deferred!r} if name in sys.modules]]))')
+    import_times = {}
+    for module in modules:
+        times = []
+        for repeat in range(repeats):
+            output = subprocess.run([sys.executable, '-c', code.format(module = module, deferred = DEFERRED_MODULES)],
+                                    capture_output = True, text = True, check = True).stdout
+            elapsed, deferred_loaded = json.loads(output.strip().splitlines()[-1])
+            times.append(elapsed)
+        import_times[module] = {'time': min(times), 'deferred_loaded': deferred_loaded}
+    return import_times
+
+# returns a list of messages for modules over the import time budget (in seconds), or that
+# import any of the deferred optional dependencies
+def check_import_budget(budget, modules = IMPORT_MODULES, repeats = 3):
+    violations = []
+    for module, measurements in measure_import_times(modules, repeats).items():
+        if measurements['time'] > budget:
+            violations.append('%s imports in %.2fs, over the %.2fs budget' % (module, measurements['time'], budget))
+        if len(measurements['deferred_loaded']) > 0:
+            violations.append('%s imports %s' % (module, ', '.join(measurements['deferred_loaded'])))
+    return violations
+
+# returns the precision and recall of predicted matches against the true matches, in either order
+def match_accuracy(pred_matches, true_matches):
+    true_pairs = set(true_matches) | set((v, u) for u, v in true_matches)
+    num_correct = sum(pair in true_pairs for pair in pred_matches)
+    return {'precision': num_correct / len(pred_matches) if len(pred_matches) > 0 else 1.0,
+            'recall': num_correct / len(true_matches) if len(true_matches) > 0 else 1.0}
+
+class PipelineBenchmark:
+    '''
+    Class for benchmarking every stage of the pipeline on a set of graphs
+
+    Inputs are the graphs and true matches (e.g. from a SyntheticNetworkGenerator), plus the
+    integration setup, custom diffusion model and simulation parameters
+
+    Stages are indexing and comparison (FeatureSetup), fit and predict (MatchClassifier),
+    integration (NetworkIntegrator), initialisation and diffusion (InitialisedDiffusionModel)
+    and analysis (ResultsAnalyser). With more than two graphs the first four stages are
+    measured together as a single linkage stage (SourceLinker)
+    '''
+    def __init__(self, graphs, true_matches = None, blocks = BLOCKS, compares = COMPARES,
+                 classifier_name = 'KMeansClassifier', clustering_alg = 'connected_components_integration',
+                 custom_diffusion_model = None, simulation_parameters = (10, 50), backend = 'ndlib',
+                 graph_metrics = ('num_nodes', 'num_edges', 'degree_cent', 'closeness'),
+                 closeness_samples = 100):
+        self.graphs = graphs
+        self.true_matches = true_matches
+        self.blocks = blocks
+        self.compares = compares
+        self.classifier_name = classifier_name
+        self.clustering_alg = clustering_alg
+        if custom_diffusion_model is None:
+            custom_diffusion_model = CustomDiffusionModel.SIR(0.05, 0.1, 0.05)
+        self.custom_diffusion_model = custom_diffusion_model
+        self.simulation_parameters = simulation_parameters
+        self.backend = backend
+        self.graph_metrics = list(graph_metrics)
+        self.closeness_samples = closeness_samples
+
+    # returns a dictionary of stage measurements, with the sizes going in and out of each stage
+    def run(self, trace_memory = False):
+        stages = {}
+        dfs = [pd.DataFrame.from_dict(dict(graph.nodes(data = True)), orient = 'index') for graph in self.graphs]
+
+        if len(self.graphs) > 2:
+            source_linker = SourceLinker(self.blocks, self.compares, self.classifier_name, dfs)
+            pred_matches, stages['linkage'] = measure_stage(source_linker.link_sources, trace_memory)
+            stages['linkage']['features'] = len(source_linker.features) if source_linker.features is not None else 0
+        else:
+            feature_setup, stages['indexing'] = measure_stage(lambda: FeatureSetup(self.blocks, self.compares, *dfs),
+                                                              trace_memory)
+            stages['indexing']['candidate_links'] = len(feature_setup.candidate_links)
+            features, stages['comparison'] = measure_stage(feature_setup.calculate_features, trace_memory)
+            stages['comparison']['features'] = len(features)
+
+            match_classifier = MatchClassifier(self.classifier_name, features)
+            fit_model, stages['fit'] = measure_stage(match_classifier.fit_model, trace_memory)
+            pred_matches, stages['predict'] = measure_stage(lambda: match_classifier.predict(features), trace_memory)
+        stages[list(stages)[-1]]['matches'] = len(pred_matches)
+        if self.true_matches is not None:
+            stages[list(stages)[-1]].update(match_accuracy(pred_matches, self.true_matches))
+
+        graphs = self.graphs[0] if len(self.graphs) == 1 else self.graphs
+        network_integrator = NetworkIntegrator(graphs, pred_matches)
+        integrated_network, stages['integration'] = measure_stage(
+            lambda: network_integrator.integrate_network(self.clustering_alg), trace_memory)
+        stages['integration'].update({
+            'nodes_before': sum(graph.number_of_nodes() for graph in self.graphs),
+            'edges_before': sum(graph.number_of_edges() for graph in self.graphs),
+            'nodes_after': integrated_network.number_of_nodes(),
+            'edges_after': integrated_network.number_of_edges()})
+
+        diffusion_model, stages['initialisation'] = measure_stage(
+            lambda: InitialisedDiffusionModel(integrated_network, self.custom_diffusion_model, self.backend),
+            trace_memory)
+        trends, stages['diffusion'] = measure_stage(
+            lambda: diffusion_model.run_diffusion_model(self.simulation_parameters), trace_memory)
+        stages['diffusion'].update({'executions': self.simulation_parameters[0],
+                                    'iterations': self.simulation_parameters[1]})
+
+        def analyse():
+            results_analyser = ResultsAnalyser(diffusion_model.model, integrated_network, trends)
+            results_analyser.get_average_statistics()
+            return results_analyser.get_graph_properties(self.graph_metrics,
+                                                         closeness_samples = self.closeness_samples, seed = 0)
+        graph_properties, stages['analysis'] = measure_stage(analyse, trace_memory)
+        return stages
+
+# returns a list of benchmark records, one per graph size (number of entities) and repeat
+# generator_options and benchmark_options are passed to SyntheticNetworkGenerator and PipelineBenchmark
+# with warm_up, the pipeline is first run untimed on the smallest size, so the first measured size
+# does not pay for imports and first-call set up, which would skew the fitted scaling exponents
+def scaling_benchmark(sizes, num_graphs = 2, repeats = 1, trace_memory = False, seed = 0,
+                      generator_options = None, benchmark_options = None, warm_up = True):
+    generator_options = generator_options or {}
+    benchmark_options = benchmark_options or {}
+    if warm_up and len(sizes) > 0:
+        graphs, true_matches = SyntheticNetworkGenerator(min(sizes), seed = seed, **generator_options).generate(num_graphs)
+        PipelineBenchmark(graphs, true_matches, **benchmark_options).run()
+    records = []
+    for size in sizes:
+        for repeat in range(repeats):
+            generator = SyntheticNetworkGenerator(size, seed = seed + repeat, **generator_options)
+            graphs, true_matches = generator.generate(num_graphs)
+            stages = PipelineBenchmark(graphs, true_matches, **benchmark_options).run(trace_memory)
+            records.append({'num_entities': size, 'num_graphs': num_graphs, 'repeat': repeat,
+                            'trace_memory': trace_memory, 'stages': stages})
+    return records
+
+# returns the scaling curve of each stage as {stage: [(num_entities, median time)]}
+def get_scaling_curves(records):
+    times = {}
+    for record in records:
+        for stage, measurements in record['stages'].items():
+            times.setdefault(stage, {}).setdefault(record['num_entities'], []).append(measurements['time'])
+    return dict((stage, [(size, float(np.median(stage_times[size]))) for size in sorted(stage_times)])
+                for stage, stage_times in times.items())
+
+# returns the fitted exponent b of time ~ a * size^b for each stage's scaling curve
+def get_scaling_exponents(curves):
+    exponents = {}
+    for stage, curve in curves.items():
+        sizes, times = zip(*curve) if len(curve) > 0 else ((), ())
+        if len(curve) > 1 and min(times) > 0:
+            exponents[stage] = float(np.polyfit(np.log(sizes), np.log(times), 1)[0])
+    return exponents
+
+# returns the metadata recorded with benchmark results
+def get_metadata():
+    metadata = {'timestamp': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+                'platform': platform.platform()}
+    for package in ['numpy', 'pandas', 'networkx', 'recordlinkage', 'ndlib']:
+        try:
+            metadata[package] = __import__(package).__version__
+        except (ImportError, AttributeError):
+            metadata[package] = None
+    return metadata
+
+# saves benchmark records, scaling curves and metadata as JSON
+def save_results(records, filename):
+    curves = get_scaling_curves(records)
+    results = {'metadata': get_metadata(), 'records': records, 'scaling_curves': curves,
+               'scaling_exponents': get_scaling_exponents(curves)}
+    with open(filename, 'w') as results_file:
+        json.dump(results, results_file, indent = 2, default = float)
+    return results
+
+def load_results(filename):
+    with open(filename) as results_file:
+        return json.load(results_file)
+
+# returns a dataframe comparing median stage times against a baseline (as loaded by load_results)
+# stages slower than the baseline by more than the tolerance (as a fraction) are flagged as regressions
+def compare_results(records, baseline, tolerance = 0.2):
+    baseline_times = {}
+    for record in baseline['records']:
+        for stage, measurements in record['stages'].items():
+            baseline_times.setdefault((record['num_entities'], record['num_graphs'], stage), []).append(measurements['time'])
+    times = {}
+    for record in records:
+        for stage, measurements in record['stages'].items():
+            times.setdefault((record['num_entities'], record['num_graphs'], stage), []).append(measurements['time'])
+
+    rows = []
+    for key in sorted(set(times) & set(baseline_times)):
+        time_now = float(np.median(times[key]))
+        time_before = float(np.median(baseline_times[key]))
+        ratio = time_now / time_before if time_before > 0 else np.inf
+        rows.append({'num_entities': key[0], 'num_graphs': key[1], 'stage': key[2],
+                     'baseline_time': time_before, 'time': time_now, 'ratio': ratio,
+                     'regression': ratio > 1 + tolerance})
+    return pd.DataFrame(rows)
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the nidmod pipeline on synthetic networks')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [250, 500, 1000])
+    parser.add_argument('--num-graphs', type = int, default = 2)
+    parser.add_argument('--repeats', type = int, default = 1)
+    parser.add_argument('--degree-distribution', default = 'powerlaw', choices = ['powerlaw', 'poisson'])
+    parser.add_argument('--mean-degree', type = float, default = 4)
+    parser.add_argument('--duplicate-rate', type = float, default = 0.2)
+    parser.add_argument('--attribute-noise', type = float, default = 0.1)
+    parser.add_argument('--backend', default = 'ndlib', choices = ['ndlib', 'compiled', 'batched'])
+    parser.add_argument('--trace-memory', action = 'store_true')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', default = None)
+    parser.add_argument('--baseline', default = None)
+    parser.add_argument('--tolerance', type = float, default = 0.2)
+    parser.add_argument('--import-budget', type = float, default = None,
+                        help = 'only check module import times against this budget in seconds')
+    args = parser.parse_args(args)
+
+    if args.import_budget is not None:
+        violations = check_import_budget(args.import_budget)
+        for violation in violations:
+            print(violation)
+        return 1 if len(violations) > 0 else 0
+
+    generator_options = {'degree_distribution': args.degree_distribution, 'mean_degree': args.mean_degree,
+                         'duplicate_rate': args.duplicate_rate, 'attribute_noise': args.attribute_noise}
+    records = scaling_benchmark(args.sizes, args.num_graphs, args.repeats, args.trace_memory, args.seed,
+                                generator_options, {'backend': args.backend})
+
+    curves = get_scaling_curves(records)
+    exponents = get_scaling_exponents(curves)
+    for stage, curve in curves.items():
+        print(stage.ljust(16) + '  '.join('%d: %.3fs' % point for point in curve)
+              + ('  (exponent %.2f)' % exponents[stage] if stage in exponents else ''))
+    regression = False
+    if args.baseline is not None:
+        comparison = compare_results(records, load_results(args.baseline), args.tolerance)
+        print(comparison.to_string(index = False))
+        regression = len(comparison) > 0 and comparison['regression'].any()
+    if args.output is not None:
+        save_results(records, args.output)
+    return 1 if regression else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
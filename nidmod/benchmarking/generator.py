@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:41 2026
+
+@author: jnevin
+"""
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+GIVEN_NAMES = ['james', 'mary', 'john', 'patricia', 'robert', 'jennifer', 'michael', 'linda',
+               'william', 'elizabeth', 'david', 'barbara', 'richard', 'susan', 'joseph', 'jessica',
+               'thomas', 'sarah', 'charles', 'karen', 'daniel', 'nancy', 'matthew', 'lisa']
+SURNAMES = ['smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis',
+            'rodriguez', 'martinez', 'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson',
+            'thomas', 'taylor', 'moore', 'jackson', 'martin', 'lee', 'perez', 'thompson', 'white']
+SUBURBS = ['ashfield', 'belmont', 'carlton', 'dalkeith', 'elwood', 'fairfield', 'glenroy',
+           'hawthorn', 'ivanhoe', 'jindalee', 'kew', 'leichhardt', 'mosman', 'newtown']
+STATES = ['nsw', 'vic', 'qld', 'wa', 'sa', 'tas', 'act', 'nt']
+STREETS = ['high', 'station', 'church', 'park', 'victoria', 'george', 'king', 'queen', 'elizabeth']
+LETTERS = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+
+# attributes of the synthetic records, matching the febrl dataset used in the experiments
+ATTRIBUTES = ['given_name', 'surname', 'date_of_birth', 'suburb', 'state', 'address_1']
+
+# standard blocks and comparisons for the synthetic attributes
+BLOCKS = {'Block': [['surname', 'surname']]}
+COMPARES = {'Exact': [['given_name', 'given_name'], ['date_of_birth', 'date_of_birth'],
+                      ['suburb', 'suburb'], ['state', 'state']],
+            'String': [['surname', 'surname', 'jarowinkler', 0.85],
+                       ['address_1', 'address_1', 'levenshtein', 0.85]]}
+
+class SyntheticNetworkGenerator:
+    '''
+    Class for generating synthetic attributed networks with known duplicates
+
+    Inputs are the number of entities, the degree distribution ('powerlaw' or 'poisson') and
+    mean degree of the entity network, the duplicate rate, the attribute noise and a seed
+
+    A set of num_graphs graphs is generated by assigning each entity to one graph, and copying
+    a duplicate_rate fraction of the entities into a second (random) graph. With a single graph
+    the copies are added to the same graph. Each copy's attribute values are corrupted with
+    probability attribute_noise, by a random character insertion, deletion or substitution.
+    Edges of the entity network are added between one (random) copy of each entity per graph
+
+    Nodes are named 'g<graph>_<entity>_<copy>', and the true matches are all pairs of nodes
+    that are copies of the same entity
+    '''
+    def __init__(self, num_entities, degree_distribution = 'powerlaw', mean_degree = 4,
+                 duplicate_rate = 0.2, attribute_noise = 0.1, seed = None):
+        self.num_entities = num_entities
+        self.degree_distribution = degree_distribution
+        self.mean_degree = mean_degree
+        self.duplicate_rate = duplicate_rate
+        self.attribute_noise = attribute_noise
+        self.seed = seed
+
+    # returns the entity network for the degree distribution
+    def get_entity_network(self, rng):
+        seed = int(rng.integers(2**31))
+        if self.degree_distribution == 'powerlaw':
+            num_edges = max(int(round(self.mean_degree / 2)), 1)
+            return nx.barabasi_albert_graph(self.num_entities, min(num_edges, self.num_entities - 1), seed = seed)
+        if self.degree_distribution == 'poisson':
+            return nx.gnm_random_graph(self.num_entities, int(self.num_entities * self.mean_degree / 2), seed = seed)
+        raise ValueError('Unknown degree distribution: ' + str(self.degree_distribution))
+
+    # returns a dataframe of entity attributes
+    def get_entity_attributes(self, rng):
+        n = self.num_entities
+        birth_dates = pd.Timestamp('1940-01-01') + pd.to_timedelta(rng.integers(0, 365 * 60, n), unit = 'D')
+        return pd.DataFrame({
+            'given_name': rng.choice(GIVEN_NAMES, n),
+            'surname': rng.choice(SURNAMES, n),
+            'date_of_birth': birth_dates.strftime('%Y%m%d'),
+            'suburb': rng.choice(SUBURBS, n),
+            'state': rng.choice(STATES, n),
+            'address_1': [str(number) + ' ' + street + ' street' for number, street
+                          in zip(rng.integers(1, 400, n), rng.choice(STREETS, n))]})
+
+    # returns the value with a random character inserted, deleted or substituted
+    def _corrupt(self, value, rng):
+        position = int(rng.integers(len(value) + 1))
+        letter = str(rng.choice(LETTERS))
+        edit = rng.integers(3)
+        if edit == 0 or len(value) == 0:
+            return value[:position] + letter + value[position:]
+        position = min(position, len(value) - 1)
+        if edit == 1:
+            return value[:position] + value[position + 1:]
+        return value[:position] + letter + value[position + 1:]
+
+    # returns a list of graphs and a pandas MultiIndex of true matches
+    def generate(self, num_graphs = 2):
+        rng = np.random.default_rng(self.seed)
+        entity_network = self.get_entity_network(rng)
+        entity_attributes = self.get_entity_attributes(rng).to_dict(orient = 'records')
+
+        # (graph, entity) observations, with a second copy for duplicated entities
+        home_graphs = rng.integers(num_graphs, size = self.num_entities)
+        observations = [(int(home), entity) for entity, home in enumerate(home_graphs)]
+        for entity in np.flatnonzero(rng.random(self.num_entities) < self.duplicate_rate):
+            if num_graphs > 1:
+                other = (home_graphs[entity] + rng.integers(1, num_graphs)) % num_graphs
+            else:
+                other = 0
+            observations.append((int(other), int(entity)))
+
+        graphs = [nx.Graph() for i in range(num_graphs)]
+        copies = {}
+        for graph_index, entity in observations:
+            entity_copies = copies.setdefault((graph_index, entity), [])
+            node = 'g' + str(graph_index) + '_' + str(entity) + '_' + str(len(entity_copies))
+            attributes = dict(entity_attributes[entity])
+            for attribute in ATTRIBUTES:
+                if rng.random() < self.attribute_noise:
+                    attributes[attribute] = self._corrupt(attributes[attribute], rng)
+            graphs[graph_index].add_node(node, **attributes)
+            entity_copies.append(node)
+
+        for u, v in entity_network.edges():
+            for graph_index in range(num_graphs):
+                if (graph_index, u) in copies and (graph_index, v) in copies:
+                    u_copies = copies[(graph_index, u)]
+                    v_copies = copies[(graph_index, v)]
+                    graphs[graph_index].add_edge(u_copies[rng.integers(len(u_copies))],
+                                                 v_copies[rng.integers(len(v_copies))])
+
+        entity_nodes = {}
+        for (graph_index, entity), nodes in sorted(copies.items()):
+            entity_nodes.setdefault(entity, []).extend(nodes)
+        true_matches = [(nodes[i], nodes[j]) for nodes in entity_nodes.values()
+                        for i in range(len(nodes)) for j in range(i + 1, len(nodes))]
+        return graphs, pd.MultiIndex.from_tuples(true_matches) if len(true_matches) > 0 else \
+            pd.MultiIndex.from_arrays([[], []])
@@ -12,43 +12,247 @@ These algorithms should be functions that take as input a graph or list of graph
 and a pandas MultiIndex representing matches based on attributes for nodes in the graph.
 
 The algorithm should return a single, integrated graph.
+
+Algorithms that cluster each component of the match graph separately also have a function
+returning the communities of a set of matches, listed in COMMUNITY_ALGORITHMS, so parts of the
+match graph can be re-clustered when an integration is updated (see patch_communities).
 '''
 
+import itertools
 import networkx as nx
-import numpy as np
-from cdlib import algorithms
 
-def walktrap_integration(graph, matches):
+class _DisjointSet:
     '''
-    An algorithm based on clustering matches based on walktrap communities.
+    Disjoint-set (union-find) structure mapping every clustered node to a representative
     
-    A graph is built based on the matches and community detection is run on this graph.
-    Nodes within the same community are taken to represent the same entity.
-    Same entity nodes are combined into a single node.
+    The root of the first argument to union is kept as the representative
+    '''
+    def __init__(self):
+        self.parents = {}
+    
+    # returns the representative of the node, compressing the path to it
+    def find(self, node):
+        root = self.parents.setdefault(node, node)
+        while root != self.parents[root]:
+            root = self.parents[root]
+        while node != root:
+            self.parents[node], node = root, self.parents[node]
+        return root
+    
+    # merges the set containing other_node into the set containing node
+    def union(self, node, other_node):
+        root = self.find(node)
+        other_root = self.find(other_node)
+        if root != other_root:
+            self.parents[other_root] = root
+
+def _contract_communities(graph, communities):
+    '''
+    Contracts each community into its first node.
+    
+    Gives the same graph as repeatedly calling nx.contracted_nodes(graph, community[0], node,
+    self_loops = False) for the other nodes in the community, in community order. The graph is
+    copied once and contracted in place, so each merge costs the degree of the merged node
+    rather than a copy of the graph. The representative keeps its attributes and the attributes
+    of the merged nodes are stored under 'contraction'. Edges that end up parallel keep the
+    data of the edge that was there first, with the others stored under the edge's
+    'contraction' keyed by their endpoints when they were merged. Community nodes that are not
+    in the graph are ignored.
     '''
     adj_graph = graph.copy()
+    for community in communities:
+        for node in community[1:]:
+            if node in adj_graph and community[0] in adj_graph:
+                nx.contracted_nodes(adj_graph, community[0], node, self_loops = False, copy = False)
+    return adj_graph
+
+def patch_communities(adj_graph, graphs, representatives, communities, nodes, edges = ()):
+    '''
+    Updates a graph contracted by _contract_communities in place, for new communities of some nodes.
+    
+    graphs are the (updated) graphs that were contracted, and representatives maps each merged
+    node to the node it was contracted into, which is updated. nodes must include every member
+    of their old communities, and communities are their new communities. The representatives of
+    the nodes are rebuilt from the graphs with all their edges, and edges lists any other added
+    edges ((u, v, key) for multigraphs), so the cost follows the number of nodes and edges
+    changed rather than the size of the graph. Where several graphs hold the same node or edge,
+    their attributes are combined as in compose_graphs. The partition and the edges match a full
+    contraction, but where patched edges end up parallel the data kept on the edge (and the
+    keys under its 'contraction') can differ from it, as they depend on the order of merging.
+    '''
+    graphs = graphs if isinstance(graphs, (list, tuple)) else [graphs]
+    nodes = set(nodes)
+    
+    # removing the old representatives of the nodes along with their edges
+    for node in nodes:
+        old_rep = representatives.pop(node, node)
+        if old_rep in adj_graph:
+            adj_graph.remove_node(old_rep)
+    
+    def in_graphs(node):
+        return any(node in graph for graph in graphs)
+    
+    def node_data(node):
+        data = {}
+        for graph in graphs:
+            if node in graph:
+                data.update(graph.nodes[node])
+        return data
+    
+    for community in communities:
+        if not in_graphs(community[0]):
+            continue
+        for node in community[1:]:
+            if node in nodes and in_graphs(node):
+                representatives[node] = community[0]
+    
+    # representatives and unmatched nodes keep their data, merged nodes are stored on their representative
+    present_nodes = [node for node in nodes if in_graphs(node)]
+    for node in present_nodes:
+        if representatives.get(node, node) == node:
+            adj_graph.add_node(node, **node_data(node))
+    for node in present_nodes:
+        rep = representatives.get(node, node)
+        if rep != node:
+            adj_graph.nodes[rep].setdefault('contraction', {})[node] = node_data(node)
+    
+    # edges of the nodes (and the other added edges), combined over the graphs
+    edge_data = {}
+    def add_edge_data(graph, edge):
+        data = graph.edges[edge]
+        if not graph.is_directed():
+            edge = tuple(sorted(edge[:2], key = repr)) + tuple(edge[2:])
+        edge_data.setdefault(edge, {}).update(data)
+    for graph in graphs:
+        graph_nodes = [node for node in present_nodes if node in graph]
+        if graph.is_multigraph():
+            incident_edges = list(graph.edges(graph_nodes, keys = True))
+            if graph.is_directed():
+                incident_edges.extend(graph.in_edges(graph_nodes, keys = True))
+        else:
+            incident_edges = list(graph.edges(graph_nodes))
+            if graph.is_directed():
+                incident_edges.extend(graph.in_edges(graph_nodes))
+        for edge in incident_edges:
+            add_edge_data(graph, edge)
+        for edge in edges:
+            if edge[0] not in nodes and edge[1] not in nodes and graph.has_edge(*edge):
+                add_edge_data(graph, tuple(edge))
+    
+    for edge, data in edge_data.items():
+        u, v = edge[:2]
+        rep_u = representatives.get(u, u)
+        rep_v = representatives.get(v, v)
+        if rep_u == rep_v and u != v:
+            continue
+        if adj_graph.is_multigraph() or not adj_graph.has_edge(rep_u, rep_v):
+            adj_graph.add_edge(rep_u, rep_v, **data)
+        else:
+            adj_graph.edges[rep_u, rep_v].setdefault('contraction', {})[(u, v)] = data
+    return adj_graph
+
+def compose_graphs(graphs):
+    '''
+    Combines a list of graphs into one graph in a single bulk construction.
+    
+    Gives the same graph as chaining nx.compose over the list (attributes of nodes and edges
+    in later graphs take precedence), without copying the growing graph at every step.
+    '''
+    adj_graph = graphs[0].__class__()
+    for graph in graphs:
+        adj_graph.graph.update(graph.graph)
+    adj_graph.add_nodes_from(itertools.chain.from_iterable(graph.nodes(data = True) for graph in graphs))
+    if adj_graph.is_multigraph():
+        adj_graph.add_edges_from(itertools.chain.from_iterable(graph.edges(keys = True, data = True)
+                                                               for graph in graphs))
+    else:
+        adj_graph.add_edges_from(itertools.chain.from_iterable(graph.edges(data = True) for graph in graphs))
+    return adj_graph
+
+def _as_graph(graph):
+    if isinstance(graph, (list, tuple)):
+        return compose_graphs(graph)
+    return graph
+
+def _match_components(matches):
+    '''
+    Builds the match graph and lists its connected components, flagging the trivial ones.
+    
+    Components that are cliques without self loops (including pairs and triangles) are trivial,
+    as every clustering algorithm here puts them in a single community. The nodes of each
+    component are listed in the order of their reprs, so the graphs community detection runs on
+    and the representatives (first nodes) of the communities do not depend on the order of the
+    matches, and an updated integration keeps the same nodes as a full one.
+    '''
     match_graph = nx.Graph()
     match_graph.add_edges_from(list(matches))
+    loop_nodes = set(nx.nodes_with_selfloops(match_graph))
     
-    S = [match_graph.subgraph(c).copy() for c in nx.connected_components(match_graph)]
-    S_com = []
-    for s_subgraph in S:
-        node_names = list(s_subgraph.nodes())
+    components = []
+    for component in nx.connected_components(match_graph):
+        component_nodes = sorted(component, key = repr)
+        num_nodes = len(component_nodes)
+        trivial = all(match_graph.degree(node) == num_nodes - 1 and node not in loop_nodes for node in component_nodes)
+        components.append((component_nodes, trivial))
+    return match_graph, components
 
-        rename = dict(zip((node_names), np.arange(len(node_names))))
-        rev_rename = { v:k for k,v in rename.items()}
+def _split_match_components(matches):
+    '''
+    Builds the match graph and splits its connected components into trivial and non-trivial ones.
+    '''
+    match_graph, components = _match_components(matches)
+    trivial_components = [component for component, trivial in components if trivial]
+    return match_graph, trivial_components, [component for component, trivial in components if not trivial]
+
+def _batch_components(match_graph, components):
+    '''
+    Combines components of the match graph into a single graph with integer node labels.
+    
+    Returns the combined graph and the list mapping each label back to its node. Edges are
+    added in label order, so the graph does not depend on the order of the matches.
+    '''
+    node_names = [node for component in components for node in component]
+    rename = dict(zip(node_names, range(len(node_names))))
+    batch_graph = nx.Graph()
+    batch_graph.add_nodes_from(range(len(node_names)))
+    batch_graph.add_edges_from(sorted(tuple(sorted((rename[u], rename[v])))
+                                      for u, v in match_graph.edges(node_names)))
+    return batch_graph, node_names
 
-        s_subgraph = nx.relabel_nodes(s_subgraph, rename)
+def walktrap_communities(matches):
+    '''
+    Returns the walktrap communities of each component of the match graph.
+    
+    Components of the match graph that are cliques (e.g. pairs and triangles) form a single
+    community without running walktrap, which gives them the same communities. Communities
+    are listed in component order, as the order of contraction decides which edge data is
+    kept where edges between communities end up parallel.
+    '''
+    # cdlib is only imported when a community detection algorithm is used, as it is slow to import
+    from cdlib import algorithms
+    
+    match_graph, components = _match_components(matches)
+    
+    S_com = []
+    for node_names, trivial in components:
+        if trivial:
+            S_com.append(node_names)
+            continue
+        s_subgraph, node_names = _batch_components(match_graph, [node_names])
         communities = algorithms.walktrap(s_subgraph).communities
         for community in communities:
-            S_com.append([rev_rename.get(item,item)  for item in community])
+            S_com.append([node_names[item] for item in sorted(community)])
+    return S_com
 
-    for component in S_com:
-        for node in component[1:]:
-            if node in adj_graph.nodes() and component[0] in adj_graph.nodes():
-                adj_graph = nx.contracted_nodes(adj_graph, component[0], node, self_loops = False)
-
-    return adj_graph
+def walktrap_integration(graph, matches):
+    '''
+    An algorithm based on clustering matches based on walktrap communities.
+    
+    A graph is built based on the matches and community detection is run on this graph.
+    Nodes within the same community are taken to represent the same entity.
+    Same entity nodes are combined into a single node.
+    '''
+    return _contract_communities(_as_graph(graph), walktrap_communities(matches))
 
 def multigraph_walktrap_integration(graphs, matches):
     '''
@@ -57,8 +261,137 @@ def multigraph_walktrap_integration(graphs, matches):
     Graphs are first all combined into one large graph, and then the walktrap integration
     is applied.
     '''
-    adj_graph = graphs[0]
-    for graph in graphs[1:]:
-        adj_graph = nx.compose(adj_graph,graph)
+    return walktrap_integration(compose_graphs(graphs), matches)
+
+def connected_components_communities(matches):
+    '''
+    Returns the connected components of the match graph as communities.
+    '''
+    match_graph, trivial_components, components = _split_match_components(matches)
+    return trivial_components + components
+
+def connected_components_integration(graph, matches):
+    '''
+    An algorithm taking each connected component of the match graph as a single entity.
+    
+    Runs in linear time in the number of matches. Graph can be a single graph or a list of
+    graphs, which are combined first.
+    '''
+    return _contract_communities(_as_graph(graph), connected_components_communities(matches))
+
+def _center_communities(match_graph, components, merge):
+    '''
+    Runs center (or merge-center) clustering on components of the match graph.
+    
+    Matches are visited from the highest to the lowest combined degree of their nodes, as
+    matches carry no similarity scores. The first time a match is seen between two unassigned
+    nodes, the node with the higher degree becomes a center and the other joins its cluster,
+    and unassigned nodes matched with a center join that center's cluster. With merge, two
+    clusters are merged whenever a match joins a center to a node of the other cluster.
+    Centers are listed first in their communities.
+    
+    Ties in degree are broken by the order of the nodes' reprs rather than the order the
+    matches were added in, so an updated integration picks the same centers as a full one.
+    '''
+    degree = match_graph.degree
+    nodes = [node for component in components for node in component]
+    rank = dict((node, i) for i, node in enumerate(sorted(nodes, key = repr)))
+    edges = [(u, v) if (degree(u), rank[v]) >= (degree(v), rank[u]) else (v, u)
+             for u, v in match_graph.edges(nodes) if u != v]
+    edges.sort(key = lambda edge: (-degree(edge[0]) - degree(edge[1]), rank[edge[0]], rank[edge[1]]))
+    
+    center_of = {}
+    disjoint_set = _DisjointSet()
+    for u, v in edges:
+        if u not in center_of and v not in center_of:
+            center_of[u] = u
+            center_of[v] = u
+        elif v not in center_of:
+            if center_of[u] == u:
+                center_of[v] = u
+        elif u not in center_of:
+            if center_of[v] == v:
+                center_of[u] = v
+        elif merge and (center_of[u] == u or center_of[v] == v):
+            disjoint_set.union(center_of[u], center_of[v])
     
-    return walktrap_integration(adj_graph, matches)
\ No newline at end of file
+    communities = {}
+    for component in components:
+        for node in component:
+            if node not in center_of:
+                communities[node] = [node]
+                continue
+            root = disjoint_set.find(center_of[node])
+            community = communities.setdefault(root, [root])
+            if node != root:
+                community.append(node)
+    return list(communities.values())
+
+def center_communities(matches):
+    '''
+    Returns the center clustering communities of the match graph.
+    '''
+    # every node of a clique ties, so its center is its first node, as ties are broken in repr order
+    match_graph, S_com, components = _split_match_components(matches)
+    S_com.extend(_center_communities(match_graph, components, merge = False))
+    return S_com
+
+def center_integration(graph, matches):
+    '''
+    An algorithm based on center clustering of the match graph.
+    
+    Each cluster is a center node and the nodes matched to it, found in a single pass over the
+    matches (after sorting them). Graph can be a single graph or a list of graphs.
+    '''
+    return _contract_communities(_as_graph(graph), center_communities(matches))
+
+def merge_center_communities(matches):
+    '''
+    Returns the merge-center clustering communities of the match graph.
+    '''
+    # every node of a clique ties, so its center is its first node, as ties are broken in repr order
+    match_graph, S_com, components = _split_match_components(matches)
+    S_com.extend(_center_communities(match_graph, components, merge = True))
+    return S_com
+
+def merge_center_integration(graph, matches):
+    '''
+    An algorithm based on merge-center clustering of the match graph.
+    
+    As center clustering, but clusters whose centers are linked through a match are merged.
+    Graph can be a single graph or a list of graphs.
+    '''
+    return _contract_communities(_as_graph(graph), merge_center_communities(matches))
+
+def leiden_communities(matches):
+    '''
+    Returns the Leiden communities of the match graph.
+    
+    Trivial components (cliques) form a single community, and all the other components are
+    combined into one graph so Leiden only runs once. Leiden communities are connected, so they
+    never span components.
+    '''
+    from cdlib import algorithms
+    
+    match_graph, S_com, components = _split_match_components(matches)
+    if len(components) > 0:
+        batch_graph, node_names = _batch_components(match_graph, components)
+        for community in algorithms.leiden(batch_graph).communities:
+            S_com.append([node_names[item] for item in sorted(community)])
+    return S_com
+
+def leiden_integration(graph, matches):
+    '''
+    An algorithm based on clustering matches based on Leiden communities.
+    
+    Graph can be a single graph or a list of graphs.
+    '''
+    return _contract_communities(_as_graph(graph), leiden_communities(matches))
+
+# the community function of each integration algorithm
+COMMUNITY_ALGORITHMS = {'walktrap_integration': walktrap_communities,
+                        'multigraph_walktrap_integration': walktrap_communities,
+                        'connected_components_integration': connected_components_communities,
+                        'center_integration': center_communities,
+                        'merge_center_integration': merge_center_communities,
+                        'leiden_integration': leiden_communities}
@@ -6,10 +6,42 @@ Created on Wed Mar 16 16:36:59 2022
 
 """
 
-import recordlinkage
-import recordlinkage.index
-import recordlinkage.compare
+import networkx as nx
+import numpy as np
+import pandas as pd
 import nidmod.datahandling.clustering_algorithms as clustering_algorithms
+from nidmod.parallel import get_pool_context, imap_bounded
+from nidmod.stagecache import frame_fingerprint, hash_inputs
+
+# the feature setup and match filter used by pool workers, set once per worker process
+_worker_feature_setup = None
+_worker_match_filter = None
+
+def _init_feature_worker(feature_setup, match_filter):
+    global _worker_feature_setup, _worker_match_filter
+    _worker_feature_setup = feature_setup
+    _worker_match_filter = match_filter
+
+def _compute_feature_task(task):
+    return _worker_feature_setup.compute_task(task, _worker_match_filter)
+
+# the fit model and features used by pool workers predicting matches, set once per worker process
+_worker_model = None
+_worker_features = None
+
+def _init_predict_worker(model, features):
+    global _worker_model, _worker_features
+    _worker_model = model
+    _worker_features = features
+
+def _predict_chunk(chunk):
+    start, stop = chunk
+    return predict_matches(_worker_model, _worker_features.iloc[start:stop])
+
+# returns the matches a fit model predicts for features, which are given to the model as float64
+# as the classifiers need the same dtype they were fit on
+def predict_matches(model, features):
+    return model.predict(features.astype(np.float64, copy = False))
 
     
 class FeatureSetup:
@@ -21,14 +53,39 @@ class FeatureSetup:
     Can calculate a set of comparison features to be used in a match classifier
     
     Blocks and attribute comparisons need to be provided in a format accepted by recordlinkage
+    
+    Previously computed candidate links for the same blocks can be provided to skip indexing
+    
+    If a chunk_size is given, candidate pairs are compared in batches of at most chunk_size pairs
+    (optionally over a pool of workers), with features stored as float32 or filtered straight
+    to matches. Match filters are given the features as computed (float64), so a model fit on
+    either kind of features can be used as the filter. When linking two dataframes with only Full and Block indexing, candidate links are
+    also generated per batch of records instead of all at once
+    
+    If a delta is given (the index labels of added or changed records, or a pair of them for
+    network A and network B), only the candidate links that touch the delta are generated, so
+    features for an update can be computed without comparing all the records again. With only
+    Full and Block indexing the delta records are indexed against the others directly, and
+    other indexing is run in full and filtered to the links touching the delta. Indexing such
+    as SortedNeighbourhood can also change links between records outside the delta, which
+    are not updated
     '''
-    def __init__(self, blocks, compares, network_A_df, network_B_df = None):
+    partitionable_blocks = ['Full', 'Block']
+    
+    def __init__(self, blocks, compares, network_A_df, network_B_df = None,
+                 candidate_links = None, chunk_size = None, delta = None):
         self.blocks = blocks
         self.compares = compares
+        self.chunk_size = chunk_size
         self.network_A_df = network_A_df
         if network_B_df is not None:
             self.network_B_df = network_B_df
         
+        # recordlinkage (and scikit-learn with it) is only imported once linkage is set up, as it is slow to import
+        import recordlinkage
+        import recordlinkage.index
+        import recordlinkage.compare
+        
         # create the indexer object based on the blocks provided
         indexer = recordlinkage.Index()
         for block_type in blocks:
@@ -46,17 +103,132 @@ class FeatureSetup:
         self.comparer = comparer
 
         # create the candidate links based on whether there are two dataframes
-        if network_B_df is not None:
+        if candidate_links is not None:
+            self.candidate_links = candidate_links
+        elif delta is not None:
+            self.candidate_links = self.get_delta_links(delta)
+        elif chunk_size is not None and self.is_partitionable():
+            self.candidate_links = None
+        elif network_B_df is not None:
             self.candidate_links = indexer.index(network_A_df, network_B_df)
         else:
             self.candidate_links = indexer.index(network_A_df)
     
-    # calculate comparison features 
-    def calculate_features(self):
+    # returns whether candidate links can be generated separately for batches of network A records
+    def is_partitionable(self):
+        return hasattr(self, 'network_B_df') and all(block_type in self.partitionable_blocks
+                                                     for block_type in self.blocks)
+    
+    # returns the candidate links touching the delta records
+    def get_delta_links(self, delta):
         if hasattr(self, 'network_B_df'):
-            return(self.comparer.compute(self.candidate_links, self.network_A_df, self.network_B_df))
+            delta_A, delta_B = [list(delta_records) if delta_records is not None else [] for delta_records in delta]
         else:
-            return(self.comparer.compute(self.candidate_links, self.network_A_df))
+            delta_A = delta_B = list(delta)
+        
+        if not all(block_type in self.partitionable_blocks for block_type in self.blocks):
+            if hasattr(self, 'network_B_df'):
+                candidate_links = self.indexer.index(self.network_A_df, self.network_B_df)
+            else:
+                candidate_links = self.indexer.index(self.network_A_df)
+            return candidate_links[candidate_links.get_level_values(0).isin(delta_A) |
+                                   candidate_links.get_level_values(1).isin(delta_B)]
+        
+        if hasattr(self, 'network_B_df'):
+            links = [self.indexer.index(self.network_A_df.loc[delta_A], self.network_B_df),
+                     self.indexer.index(self.network_A_df, self.network_B_df.loc[delta_B])]
+            return links[0].append(links[1]).drop_duplicates()
+        
+        # pairs within one dataframe are ordered with the later record first, as when indexing in full
+        links = self.indexer.index(self.network_A_df.loc[delta_A], self.network_A_df)
+        first = links.get_level_values(0)
+        second = links.get_level_values(1)
+        first_positions = self.network_A_df.index.get_indexer(first)
+        second_positions = self.network_A_df.index.get_indexer(second)
+        swap = first_positions < second_positions
+        links = pd.MultiIndex.from_arrays([np.where(swap, second, first), np.where(swap, first, second)],
+                                          names = links.names)
+        return links[first_positions != second_positions].drop_duplicates()
+    
+    # computes comparison features for a set of candidate links
+    def compute_links(self, candidate_links):
+        if hasattr(self, 'network_B_df'):
+            return self.comparer.compute(candidate_links, self.network_A_df, self.network_B_df)
+        return self.comparer.compute(candidate_links, self.network_A_df)
+    
+    # returns the number of network A records whose candidate links should make up about one chunk
+    def _estimate_rows_per_task(self):
+        sample_df = self.network_A_df.iloc[:1000]
+        sample_links = len(self.indexer.index(sample_df, self.network_B_df))
+        links_per_row = max(sample_links / max(len(sample_df), 1), 1 / max(len(self.network_A_df), 1))
+        return max(int(self.chunk_size / links_per_row), 1)
+    
+    # returns the tasks for chunked computation, either network A record ranges or candidate link ranges
+    def get_tasks(self):
+        if self.candidate_links is None:
+            rows_per_task = self._estimate_rows_per_task()
+            return [('rows', start, start + rows_per_task)
+                    for start in range(0, len(self.network_A_df), rows_per_task)]
+        return [('links', start, start + self.chunk_size)
+                for start in range(0, len(self.candidate_links), self.chunk_size)]
+    
+    # yields the candidate links of a task in chunks of at most chunk_size pairs
+    def iter_task_links(self, task):
+        task_type, start, stop = task
+        if task_type == 'links':
+            yield self.candidate_links[start:stop]
+            return
+        task_links = self.indexer.index(self.network_A_df.iloc[start:stop], self.network_B_df)
+        for chunk_start in range(0, len(task_links), self.chunk_size):
+            yield task_links[chunk_start:chunk_start + self.chunk_size]
+    
+    # returns a list of float32 feature frames (or of matches, if a match filter is given) for a task
+    def compute_task(self, task, match_filter = None):
+        results = []
+        for candidate_links in self.iter_task_links(task):
+            features = self.compute_links(candidate_links)
+            results.append(match_filter(features) if match_filter is not None else features.astype(np.float32))
+        return results
+    
+    # yields the results of each chunk in order, over a pool of n_workers if given
+    def _iter_chunk_results(self, match_filter, n_workers):
+        tasks = self.get_tasks()
+        if n_workers is None or n_workers <= 1:
+            for task in tasks:
+                for result in self.compute_task(task, match_filter):
+                    yield result
+            return
+        with get_pool_context().Pool(processes = n_workers, initializer = _init_feature_worker,
+                                     initargs = (self, match_filter)) as pool:
+            for results in imap_bounded(pool, _compute_feature_task, tasks, 2 * n_workers):
+                for result in results:
+                    yield result
+    
+    # returns all the candidate links, generating them if they are produced per chunk
+    def get_candidate_links(self):
+        if self.candidate_links is None:
+            links = [candidate_links for task in self.get_tasks() for candidate_links in self.iter_task_links(task)]
+            self.candidate_links = links[0].append(links[1:]) if len(links) > 0 else pd.MultiIndex.from_arrays([[], []])
+        return self.candidate_links
+    
+    # calculate comparison features 
+    def calculate_features(self, n_workers = None):
+        if self.chunk_size is None:
+            return self.compute_links(self.candidate_links)
+        feature_chunks = list(self._iter_chunk_results(None, n_workers))
+        if len(feature_chunks) == 0:
+            return self.compute_links(self.get_candidate_links()).astype(np.float32)
+        return pd.concat(feature_chunks)
+    
+    # calculates the matches, applying match_filter (e.g. a fit model's predict) to each chunk of
+    # features so only the matched pairs are kept
+    def calculate_matches(self, match_filter, n_workers = None):
+        if self.chunk_size is None:
+            return match_filter(self.calculate_features())
+        match_chunks = list(self._iter_chunk_results(match_filter, n_workers))
+        if len(match_chunks) == 0:
+            return match_filter(self.compute_links(self.get_candidate_links()))
+        return match_chunks[0].append(match_chunks[1:])
 
 class MatchClassifier:
     '''
@@ -67,23 +239,203 @@ class MatchClassifier:
     Classifier needs to be a valid recordlinkage classifier
     
     Returns a fit match classifier model
+    
+    If a sample_size is given, the model is fit on a 'random' or 'stratified' sample of the
+    features of that size. Stratified samples are drawn proportionally from groups of identical
+    (rounded) comparison vectors and match labels, with at least one vector from every group,
+    and never hold more than sample_size vectors.
+    Samples are drawn with the given seed (0 by default), so the same features always give the
+    same sample. Fit models are stored in the (optional) model_cache under a hash of the
+    classifier, features and sampling options, so the same fit is never repeated and a cached
+    fit skips the sampling too. With seed = None every sample is new, and is only reused if it
+    happens to be drawn again
+    
+    Models are fit and predict on float64 features, so float32 features from a chunked
+    FeatureSetup and float64 features can be mixed
     '''
-    def __init__(self, match_classifier_name, training_features, training_matches = None):
+    def __init__(self, match_classifier_name, training_features, training_matches = None,
+                 sample_size = None, sampling = 'stratified', seed = 0, model_cache = None):
         self.training_features = training_features
         self.match_classifier_name = match_classifier_name
         if training_matches is not None:
             self.training_matches = training_matches
+        self.sample_size = sample_size
+        self.sampling = sampling
+        self.seed = seed
+        self.model_cache = model_cache
+    
+    # returns the features the model is fit on, sampled if a sample size is given
+    def get_training_sample(self):
+        features = self.training_features
+        if self.sample_size is None or len(features) <= self.sample_size:
+            return features
+        rng = np.random.default_rng(self.seed)
+        
+        strata = features.round(1)
+        if hasattr(self, 'training_matches'):
+            strata = strata.assign(match = features.index.isin(self.training_matches))
+        group_ids = strata.groupby(list(strata.columns), sort = False, dropna = False).ngroup().values
+        num_groups = group_ids.max() + 1 if len(group_ids) > 0 else 0
+        if self.sampling == 'random' or num_groups > self.sample_size:
+            positions = rng.choice(len(features), self.sample_size, replace = False)
+            return features.iloc[np.sort(positions)]
+        
+        # proportional allocation, taking the first rows of each group in a random order
+        group_sizes = np.bincount(group_ids)
+        allocation = np.maximum(np.floor(group_sizes * self.sample_size / len(features)), 1).astype(int)
+        order = rng.permutation(len(features))
+        order = order[np.argsort(group_ids[order], kind = 'stable')]
+        group_starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+        ranks = np.arange(len(order)) - group_starts[group_ids[order]]
+        selected = ranks < allocation[group_ids[order]]
+        positions = order[selected]
+        
+        # every group keeps at least one row, so the allocation can go over the sample size, in
+        # which case each group drops the same fraction of its last rows
+        if len(positions) > self.sample_size:
+            fractions = ranks[selected] / allocation[group_ids[positions]]
+            positions = positions[np.argsort(fractions, kind = 'stable')[:self.sample_size]]
+        return features.iloc[np.sort(positions)]
     
     # fits the model
     def fit_model(self):
+        if self.model_cache is None:
+            self.model = self._fit(self.get_training_sample())
+            return self.model
+        # seeded samples are keyed on the features they are drawn from, unseeded ones on the sample itself
+        if self.sample_size is None:
+            sample_key = frame_fingerprint(self.training_features)
+        elif self.seed is not None:
+            sample_key = (frame_fingerprint(self.training_features), self.sample_size, self.sampling, self.seed)
+        else:
+            sample_key = frame_fingerprint(self.get_training_sample())
+        cache_key = hash_inputs('fit_model', self.match_classifier_name, list(self.training_features.columns),
+                                sample_key,
+                                frame_fingerprint(self.training_matches) if hasattr(self, 'training_matches') else None)
+        self.model = self.model_cache.get_or_compute(cache_key, lambda: self._fit(self.get_training_sample()))
+        return self.model
+    
+    def _fit(self, training_sample):
+        import recordlinkage
         model = getattr(recordlinkage, self.match_classifier_name)()
         if hasattr(self, 'training_matches'): 
-            model.fit(self.training_features, self.training_matches)
+            model.fit(training_sample.astype(np.float64, copy = False), self.training_matches)
         else:
-            model.fit(self.training_features)
+            model.fit(training_sample.astype(np.float64, copy = False))
         return model
+    
+    # predicts matches with the fit model, in chunks of chunk_size features over n_workers processes if given
+    def predict(self, features, chunk_size = None, n_workers = None):
+        if not hasattr(self, 'model'):
+            self.fit_model()
+        if chunk_size is None or len(features) <= chunk_size:
+            return predict_matches(self.model, features)
         
+        chunks = [(start, start + chunk_size) for start in range(0, len(features), chunk_size)]
+        if n_workers is None or n_workers <= 1:
+            match_chunks = [predict_matches(self.model, features.iloc[start:stop]) for start, stop in chunks]
+        else:
+            with get_pool_context().Pool(processes = n_workers, initializer = _init_predict_worker,
+                                         initargs = (self.model, features)) as pool:
+                match_chunks = list(imap_bounded(pool, _predict_chunk, chunks, 2 * n_workers))
+        return match_chunks[0].append(match_chunks[1:])
+
+
+class SourceLinker:
+    '''
+    A class for linking any number of source dataframes into a set of matches
+
+    Inputs are dictionaries for blocks and attribute comparisons, a classifier name and a list
+    of dataframes, plus (optionally) training matches and the MatchClassifier/FeatureSetup options
+    (fit_seed is the seed of the MatchClassifier samples)
+
+    Sources are linked one at a time against a running canonical entity index, which holds one
+    record per entity found so far. Each source is compared only with the index (using the
+    configured blocking), a classifier is fit and matches predicted, and the unmatched records of
+    the source are added to the index as new entities. With blocking, the cost of each step depends
+    on the size of the index rather than on all the sources seen, so total cost grows roughly
+    linearly in the number of sources
+
+    Matches are pairs of (canonical record, source record), and can be passed to a clustering
+    algorithm along with the sources' graphs. Node names need to be unique across sources
+
+    Records are only compared with the index, never with records of their own source, so
+    duplicates within a source are not linked to each other. They only end up in the same entity
+    if they both match a record of an earlier source (sources with internal duplicates can be
+    deduplicated first, e.g. by linking them with a FeatureSetup of the source alone)
+    '''
+    def __init__(self, blocks, compares, classifier_name, network_dfs, training_matches = None,
+                 fit_sample_size = None, predict_chunk_size = None, chunk_size = None, model_cache = None,
+                 fit_seed = 0):
+        self.blocks = blocks
+        self.compares = compares
+        self.classifier_name = classifier_name
+        self.network_dfs = network_dfs
+        # training pairs can appear in either order relative to the canonical index
+        if training_matches is not None:
+            training_matches = training_matches.append(training_matches.swaplevel()).unique()
+        self.training_matches = training_matches
+        self.fit_sample_size = fit_sample_size
+        self.predict_chunk_size = predict_chunk_size
+        self.chunk_size = chunk_size
+        self.model_cache = model_cache
+        self.fit_seed = fit_seed
+
+    # links a single source against the canonical index, returning its features, fit model and matches
+    def link_source(self, canonical_df, source_df):
+        feature_setup = FeatureSetup(self.blocks, self.compares, canonical_df, source_df,
+                                     chunk_size = self.chunk_size)
+        features = feature_setup.calculate_features()
+        if len(features) == 0:
+            return features, None, features.index
+        match_classifier = MatchClassifier(self.classifier_name, features, self.training_matches,
+                                           sample_size = self.fit_sample_size, seed = self.fit_seed,
+                                           model_cache = self.model_cache)
+        fit_model = match_classifier.fit_model()
+        return features, fit_model, match_classifier.predict(features, self.predict_chunk_size)
+
+    # links all the sources, storing the features, fit models (one per linked source) and matches
+    def link_sources(self):
+        canonical_df = self.network_dfs[0]
+        entity_index = pd.Series(canonical_df.index, index = canonical_df.index)
+        features_list = []
+        self.fit_models = []
+        matches_list = []
+        for source_df in self.network_dfs[1:]:
+            features, fit_model, matches = self.link_source(canonical_df, source_df)
+            features_list.append(features)
+            self.fit_models.append(fit_model)
+            matches_list.append(matches)
+
+            # matched records join the entity of their first canonical match, the rest are new entities
+            source_entities = pd.Series(source_df.index, index = source_df.index)
+            first_matches = pd.Series(matches.get_level_values(0), index = matches.get_level_values(1))
+            first_matches = first_matches[~first_matches.index.duplicated()]
+            source_entities.update(entity_index.reindex(first_matches.values).set_axis(first_matches.index))
+            entity_index = pd.concat([entity_index, source_entities])
+            canonical_df = pd.concat([canonical_df, source_df[~source_df.index.isin(first_matches.index)]])
+
+        self.canonical_df = canonical_df
+        self.entity_index = entity_index
+        self.features = pd.concat(features_list) if len(features_list) > 0 else None
+        self.matches = matches_list[0].append(matches_list[1:]) if len(matches_list) > 0 else None
+        return self.matches
+
+
+class IntegrationState:
+    '''
+    A class storing what is needed to update an integrated network
     
+    Holds the integrated network, the name of the clustering algorithm, the graph of all matches
+    and a dictionary mapping each merged node to the node it was contracted into
+    '''
+    def __init__(self, integrated_network, clustering_alg, match_graph, representatives):
+        self.integrated_network = integrated_network
+        self.clustering_alg = clustering_alg
+        self.match_graph = match_graph
+        self.representatives = representatives
+
+
 class NetworkIntegrator:
     '''
     A class for integrating a network with matches and a graph
@@ -93,6 +445,13 @@ class NetworkIntegrator:
     Clustering algorithm needs to receive a list of graphs, a set of matches, and return a single graph
     
     Can return the integrated network based on the matches
+    
+    An integration can be updated when the graphs gain or change nodes and edges. get_state
+    returns an IntegrationState after integrate_network, and update_network is run on an
+    integrator of the updated graphs and the matches among the candidate links touching the
+    changed nodes (e.g. from a FeatureSetup with a delta and the fit model). Only the match
+    components holding the changed nodes are clustered again, and the integrated network is
+    patched in place. This needs a clustering algorithm in clustering_algorithms.COMMUNITY_ALGORITHMS
     '''
     def __init__(self, graphs, matches):
         self.graphs = graphs
@@ -101,7 +460,53 @@ class NetworkIntegrator:
     # integrates the network based on matches and the clustering algorithm
     def integrate_network(self, clustering_alg):
         used_clustering_alg = getattr(clustering_algorithms, clustering_alg)
-        return used_clustering_alg(self.graphs, self.matches)
+        self.clustering_alg = clustering_alg
+        self.integrated_network = used_clustering_alg(self.graphs, self.matches)
+        return self.integrated_network
+    
+    # returns the state of the last integration, for updating it later
+    def get_state(self):
+        match_graph = nx.Graph()
+        match_graph.add_edges_from(list(self.matches))
+        representatives = {}
+        for node, contraction in self.integrated_network.nodes(data = 'contraction'):
+            if contraction is not None:
+                for merged_node in contraction:
+                    representatives[merged_node] = node
+        return IntegrationState(self.integrated_network, self.clustering_alg, match_graph, representatives)
+    
+    # updates the integrated network of a state in place for added or changed nodes and added
+    # edges (between other nodes), with self.matches holding the matches of the changed nodes
+    def update_network(self, state, nodes, edges = ()):
+        community_alg = clustering_algorithms.COMMUNITY_ALGORITHMS.get(state.clustering_alg)
+        if community_alg is None:
+            raise ValueError('Clustering algorithm ' + str(state.clustering_alg) + ' cannot be updated incrementally')
+        nodes = list(dict.fromkeys(nodes))
+        match_graph = state.match_graph
+        
+        def get_components(start_nodes):
+            component_nodes = set()
+            for node in start_nodes:
+                if node in match_graph and node not in component_nodes:
+                    component_nodes.update(nx.node_connected_component(match_graph, node))
+            return component_nodes
+        
+        # the old matches of changed nodes are replaced, and every match component holding them
+        # (before or after) is clustered again
+        affected = get_components(nodes)
+        match_graph.remove_edges_from(list(match_graph.edges(nodes)))
+        new_matches = list(self.matches)
+        match_graph.add_edges_from(new_matches)
+        affected.update(get_components(affected.union(node for match in new_matches for node in match)))
+        affected.update(nodes)
+        match_graph.remove_nodes_from([node for node in affected if node in match_graph and match_graph.degree(node) == 0])
+        
+        communities = community_alg(list(match_graph.subgraph(affected).edges()))
+        clustering_algorithms.patch_communities(state.integrated_network, self.graphs, state.representatives,
+                                                communities, affected, edges)
+        self.clustering_alg = state.clustering_alg
+        self.integrated_network = state.integrated_network
+        return self.integrated_network
         
         
         
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:02:41 2026
+
+@author: jnevin
+-Only supports NodeStochastic and NodeThreshold compartments
+"""
+
+import networkx as nx
+import numpy as np
+
+# returns whether no rule can fire given the status counts (statuses, or statuses x runs)
+# rules are (status from, status to, compartment type, value, trigger) tuples of status codes
+def is_absorbed(node_count, rules):
+    node_count = np.asarray(node_count)
+    can_transition = np.zeros(node_count.shape[1:], dtype = bool)
+    for status_from, status_to, kind, value, trigger in rules:
+        can_fire = node_count[status_from] > 0
+        if trigger is not None:
+            can_fire = can_fire & (node_count[trigger] > 0)
+        can_transition |= can_fire
+    return ~can_transition
+
+# returns whether the rules always give the same next state, so an unchanged state is final
+def is_deterministic(rules):
+    return all(rule[2] == 'NodeThreshold' for rule in rules)
+
+# converts a (statuses x iterations) count array to ndlib's trend format
+# the stopping iteration of an early stopped run is added alongside the trends
+def build_trends(node_count, codes, stopping_iteration = None):
+    status_delta = np.zeros_like(node_count)
+    status_delta[:, 1:] = np.diff(node_count, axis = 1)
+    trends = {'trends': {'node_count': dict(zip(codes, node_count.tolist())),
+                         'status_delta': dict(zip(codes, status_delta.tolist()))}}
+    if stopping_iteration is not None:
+        trends['stopping_iteration'] = int(stopping_iteration)
+    return trends
+
+class CompiledDiffusionModel:
+    '''
+    Class for running a custom diffusion model as vectorised NumPy operations
+
+    The graph is compiled once into a CSR adjacency matrix (rows are nodes, columns are
+    the neighbours they listen to) and the statuses into integer codes, matching the
+    codes given by the ndlib CompositeModel
+
+    Compartments are evaluated for all nodes at once, with neighbour counts coming
+    from a sparse matrix-vector product
+
+    Output of multi_runs is in the same trend format as ndlib's multi_runs
+    
+    With early stopping, a run stops once no rule can fire (or, when all rules are deterministic,
+    once an iteration changes nothing), its trend is padded with its final counts, and the
+    iteration from which its counts stay final is recorded as its stopping iteration
+    (iteration_number if it never converges)
+    
+    batched_runs advances all realisations together as a (nodes x runs) state matrix,
+    so each iteration needs a single sparse neighbour count product
+    
+    grid_runs also advances a grid of compartment values (and fractions infected) together, as
+    a (nodes x grid x runs) state array with rule values of shape (grid x 1). Random draws are
+    shared along the grid dimension (common random numbers), so each grid point's runs are the
+    same as batched_runs with that point's model and the same seed
+    '''
+    supported_compartments = ['NodeStochastic', 'NodeThreshold']
+
+    def __init__(self, graph, custom_diffusion_model):
+        self.graph = graph
+        self.nodes = list(graph.nodes())
+        self.num_nodes = len(self.nodes)
+        self.node_index = dict(zip(self.nodes, range(self.num_nodes)))
+
+        # compiling the graph, ndlib listens to predecessors for directed graphs
+        adjacency = nx.to_scipy_sparse_array(graph, nodelist = self.nodes, weight = None,
+                                             format = 'csr')
+        if graph.is_directed():
+            adjacency = adjacency.T.tocsr()
+        adjacency.data[:] = 1
+        self.adjacency = adjacency
+        self.degree = np.asarray(adjacency.sum(axis = 1)).ravel()
+
+        # compiling the statuses into codes, in the order ndlib would assign them
+        self.available_statuses = {}
+        for status in custom_diffusion_model.statuses:
+            if status not in self.available_statuses:
+                self.available_statuses[status] = len(self.available_statuses)
+        self.status_dtype = np.min_scalar_type(len(self.available_statuses))
+
+        self.rules = self._compile_rules(custom_diffusion_model)
+        self.triggers = sorted(set(rule[4] for rule in self.rules if rule[4] is not None))
+        self.deterministic = is_deterministic(self.rules)
+        self.model_parameters = self._get_model_parameters(custom_diffusion_model)
+
+    # compiles the compartments and the rules that use them
+    def _compile_rules(self, custom_diffusion_model):
+        set_compartments = {}
+        for compartment_type in custom_diffusion_model.compartments:
+            if compartment_type not in self.supported_compartments:
+                raise ValueError('Compartment type ' + compartment_type +
+                                 ' is not supported by the compiled model')
+            for compartment in custom_diffusion_model.compartments[compartment_type]:
+                set_compartments[compartment] = self._compile_compartment(compartment_type,
+                                                *custom_diffusion_model.compartments[compartment_type][compartment])
+
+        rules = []
+        for rule in custom_diffusion_model.transition_rules:
+            kind, value, trigger = set_compartments[rule[2]]
+            rules.append((self.available_statuses[rule[0]],
+                          self.available_statuses[rule[1]], kind, value, trigger))
+        return rules
+
+    # returns the initial status parameters
+    def _get_model_parameters(self, custom_diffusion_model):
+        model_parameters = dict((parameter[0], parameter[1])
+                                for parameter in custom_diffusion_model.parameters)
+        if 'percentage_infected' in model_parameters:
+            model_parameters['fraction_infected'] = model_parameters['percentage_infected']
+        model_parameters.setdefault('fraction_infected', 0.05)
+        return model_parameters
+
+    # converts compartment arguments into a (kind, rate or threshold, trigger code) tuple
+    def _compile_compartment(self, compartment_type, value = None, triggering_status = None):
+        if compartment_type == 'NodeThreshold' and value is None:
+            raise ValueError('Threshold not specified')
+        if triggering_status is not None:
+            triggering_status = self.available_statuses[triggering_status]
+        return (compartment_type, value, triggering_status)
+
+    # returns the number of nodes infected at the start of each run
+    def get_num_initial_infected(self, model_parameters = None):
+        if model_parameters is None:
+            model_parameters = self.model_parameters
+        number_of_initial_infected = int(self.num_nodes * float(model_parameters['fraction_infected']))
+        return max(number_of_initial_infected, 1)
+
+    # returns the rules with each value replaced by a (grid x 1) array of the values in a list of
+    # custom diffusion models with the same statuses and transition rules, and an array of the
+    # number of nodes initially infected for each model
+    def compile_grid(self, custom_diffusion_models):
+        grid_rules = []
+        num_initial_infected = []
+        for custom_diffusion_model in custom_diffusion_models:
+            if list(dict.fromkeys(custom_diffusion_model.statuses)) != list(self.available_statuses):
+                raise ValueError('Grid models need the same statuses as the compiled model')
+            rules = self._compile_rules(custom_diffusion_model)
+            if [rule[:3] + rule[4:] for rule in rules] != [rule[:3] + rule[4:] for rule in self.rules]:
+                raise ValueError('Grid models need the same transition rules as the compiled model')
+            grid_rules.append(rules)
+            num_initial_infected.append(self.get_num_initial_infected(self._get_model_parameters(custom_diffusion_model)))
+        rules = [rule[:3] + (np.array([rules[k][3] for rules in grid_rules], dtype = np.float64).reshape(-1, 1),) + rule[4:]
+                 for k, rule in enumerate(self.rules)]
+        return rules, np.array(num_initial_infected)
+
+    # returns an initial state vector, either from a given infection set or sampled at random
+    def initial_state(self, rng, infected_nodes = None, num_infected = None):
+        state = np.zeros(self.num_nodes, dtype = self.status_dtype)
+        if infected_nodes is not None:
+            infected_idx = [self.node_index[node] for node in infected_nodes]
+        else:
+            if num_infected is None:
+                num_infected = self.get_num_initial_infected()
+            infected_idx = rng.choice(self.num_nodes, num_infected, replace = False)
+        state[infected_idx] = self.available_statuses['Infected']
+        return state
+
+    # returns a (nodes x runs) state matrix, with each run's initial set drawn from its own generator
+    def initial_states(self, rngs, infection_sets = None):
+        states = np.zeros((self.num_nodes, len(rngs)), dtype = self.status_dtype)
+        for i, rng in enumerate(rngs):
+            infected_nodes = infection_sets[i] if infection_sets is not None else None
+            states[:, i] = self.initial_state(rng, infected_nodes)
+        return states
+
+    # advances the state (a vector, a nodes x runs matrix or a nodes x grid x runs array) by one
+    # synchronous iteration, with the given rules (the model's rules by default)
+    def step(self, state, rng, rules = None):
+        if rules is None:
+            rules = self.rules
+        # neighbour counts of each triggering status, computed once per iteration
+        flat_state = state.reshape(self.num_nodes, -1)
+        trigger_counts = {trigger: (self.adjacency @ (flat_state == trigger).astype(np.float64)).reshape(state.shape)
+                          for trigger in self.triggers}
+        # grid points share their draws
+        draw_shape = state.shape if state.ndim < 3 else (state.shape[0], 1) + state.shape[2:]
+
+        new_state = state.copy()
+        pending = np.ones(state.shape, dtype = bool)
+        for status_from, status_to, kind, value, trigger in rules:
+            candidates = pending & (state == status_from)
+            if kind == 'NodeStochastic':
+                draws = rng.random(draw_shape)
+                fire = candidates & (draws < value)
+                if trigger is not None:
+                    fire &= trigger_counts[trigger] > 0
+            else:
+                if trigger is not None:
+                    counts = trigger_counts[trigger]
+                else:
+                    counts = np.zeros(state.shape)
+                degree = self.degree.reshape((-1,) + (1,) * (state.ndim - 1))
+                ratio = np.divide(counts, degree, out = np.zeros(state.shape),
+                                  where = degree > 0)
+                fire = candidates & (degree > 0) & (ratio >= value)
+            new_state[fire] = status_to
+            pending &= ~fire
+        return new_state
+
+    # returns the number of nodes in each status, indexed by status code
+    def count_statuses(self, state):
+        return np.array([(state == code).sum(axis = 0)
+                         for code in self.available_statuses.values()])
+
+    # yields (iteration, statuses x runs counts, stopping iterations) as a batch of runs advances together
+    # with early stopping, only the runs that have not converged are advanced
+    def iter_batch_counts(self, iteration_number, rng, initial_rngs, infection_sets = None,
+                          early_stopping = False):
+        states = self.initial_states(initial_rngs, infection_sets)
+        stopping_iterations = np.full(len(initial_rngs), iteration_number)
+        active = np.ones(len(initial_rngs), dtype = bool)
+        node_count = self.count_statuses(states)
+        for i in range(iteration_number):
+            if i > 0 and not early_stopping:
+                states = self.step(states, rng)
+                node_count = self.count_statuses(states)
+            elif i > 0 and active.any():
+                active_runs = np.flatnonzero(active)
+                active_states = states[:, active_runs]
+                new_states = self.step(active_states, rng)
+                states[:, active_runs] = new_states
+                node_count[:, active_runs] = self.count_statuses(new_states)
+                if self.deterministic:
+                    unchanged = active_runs[(new_states == active_states).all(axis = 0)]
+                    stopping_iterations[unchanged] = i - 1
+                    active[unchanged] = False
+            if early_stopping:
+                absorbed = active & is_absorbed(node_count, self.rules)
+                stopping_iterations[absorbed] = i
+                active &= ~absorbed
+            yield i, node_count, stopping_iterations
+
+    # yields (run indices, iteration, statuses x runs counts, stopping iterations) for all runs,
+    # in batches of batch_size runs
+    def iter_batched_counts(self, execution_number = 1, iteration_number = 50, infection_sets = None,
+                            seed = None, batch_size = None, early_stopping = False):
+        if infection_sets is not None and len(infection_sets) != execution_number:
+            raise ValueError('Number of infection sets provided does not match the number of executions required')
+        if batch_size is None:
+            batch_size = execution_number
+        batch_size = max(batch_size, 1)
+
+        seed_sequence = np.random.SeedSequence(seed)
+        initial_rngs = [np.random.default_rng(s) for s in seed_sequence.spawn(execution_number)]
+        rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+
+        for start in range(0, execution_number, batch_size):
+            stop = min(start + batch_size, execution_number)
+            runs = np.arange(start, stop)
+            batch_sets = infection_sets[start:stop] if infection_sets is not None else None
+            for i, counts, stopping_iterations in self.iter_batch_counts(iteration_number, rng, initial_rngs[start:stop],
+                                                                         batch_sets, early_stopping):
+                yield runs, i, counts, stopping_iterations
+
+    # yields (run indices, iteration, statuses x grid x runs counts) for all runs of a grid from
+    # compile_grid, in batches of batch_size runs, seeded as in iter_batched_counts
+    def iter_grid_counts(self, grid_rules, num_initial_infected, execution_number = 1, iteration_number = 50,
+                         infection_sets = None, seed = None, batch_size = None):
+        if infection_sets is not None and len(infection_sets) != execution_number:
+            raise ValueError('Number of infection sets provided does not match the number of executions required')
+        if batch_size is None:
+            batch_size = execution_number
+        batch_size = max(batch_size, 1)
+
+        seed_sequence = np.random.SeedSequence(seed)
+        initial_seeds = seed_sequence.spawn(execution_number)
+        rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+
+        for start in range(0, execution_number, batch_size):
+            stop = min(start + batch_size, execution_number)
+            runs = np.arange(start, stop)
+            # grid points with the same number of initial infected nodes start from the same state
+            states = np.zeros((self.num_nodes, len(num_initial_infected), len(runs)), dtype = self.status_dtype)
+            for num_infected in np.unique(num_initial_infected):
+                points = num_initial_infected == num_infected
+                for j, run in enumerate(runs):
+                    infected_nodes = infection_sets[run] if infection_sets is not None else None
+                    states[:, points, j] = self.initial_state(np.random.default_rng(initial_seeds[run]), infected_nodes,
+                                                              int(num_infected))[:, np.newaxis]
+            for i in range(iteration_number):
+                if i > 0:
+                    states = self.step(states, rng, grid_rules)
+                yield runs, i, self.count_statuses(states)
+
+    # performs multiple runs for every point of a grid from compile_grid, returning a
+    # (grid x runs x statuses x iterations) count array
+    def grid_runs(self, grid_rules, num_initial_infected, execution_number = 1, iteration_number = 50,
+                  infection_sets = None, nprocesses = None, seed = None, batch_size = None):
+        node_counts = np.zeros((len(num_initial_infected), execution_number, len(self.available_statuses),
+                                iteration_number), dtype = np.min_scalar_type(max(self.num_nodes, 1)))
+        for runs, i, counts in self.iter_grid_counts(grid_rules, num_initial_infected, execution_number,
+                                                     iteration_number, infection_sets, seed, batch_size):
+            node_counts[:, runs[0]:runs[-1] + 1, :, i] = counts.transpose(1, 2, 0)
+        return node_counts
+
+    # converts a (statuses x iterations) count array to ndlib's trend format
+    def build_trends(self, node_count, stopping_iteration = None):
+        return build_trends(node_count, list(self.available_statuses.values()), stopping_iteration)
+
+    # performs multiple runs one at a time, taking the same parameters as ndlib's multi_runs
+    # runs are seeded as in iter_batched_counts, so reduce_runs with a batch_size of 1 gives the same runs
+    def multi_runs(self, execution_number = 1, iteration_number = 50,
+                   infection_sets = None, nprocesses = None, seed = None, early_stopping = False):
+        return self.batched_runs(execution_number, iteration_number, infection_sets, nprocesses, seed,
+                                 batch_size = 1, early_stopping = early_stopping)
+
+    # performs multiple runs as batches of columns in a state matrix
+    # each run's initial infected set is seeded independently, batch_size bounds memory use
+    def batched_runs(self, execution_number = 1, iteration_number = 50, infection_sets = None,
+                     nprocesses = None, seed = None, batch_size = None, early_stopping = False):
+        node_count = np.zeros((len(self.available_statuses), execution_number, iteration_number),
+                              dtype = np.int64)
+        stopping_iterations = np.full(execution_number, iteration_number)
+        for runs, i, counts, batch_stopping_iterations in self.iter_batched_counts(execution_number, iteration_number,
+                                                                                   infection_sets, seed, batch_size,
+                                                                                   early_stopping):
+            node_count[:, runs, i] = counts
+            stopping_iterations[runs] = batch_stopping_iterations
+        return [self.build_trends(node_count[:, j, :], stopping_iterations[j] if early_stopping else None)
+                for j in range(execution_number)]
+
+    # performs multiple runs, updating the reducers in place as each iteration is produced
+    def reduce_runs(self, reducers, execution_number = 1, iteration_number = 50, infection_sets = None,
+                    nprocesses = None, seed = None, batch_size = None, early_stopping = False):
+        for reducer in reducers:
+            reducer.start(self.available_statuses, execution_number, iteration_number)
+        for runs, i, counts, stopping_iterations in self.iter_batched_counts(execution_number, iteration_number,
+                                                                             infection_sets, seed, batch_size,
+                                                                             early_stopping):
+            for reducer in reducers:
+                reducer.update(runs, i, counts)
+                if early_stopping and i == iteration_number - 1:
+                    reducer.stop(runs, stopping_iterations)
+        return reducers
@@ -6,10 +6,77 @@ Created on Fri Mar 18 11:13:13 2022
 -Doesn't support cascading or conditional compartments
 """
 
-import ndlib.models.ModelConfig as mc
-import ndlib.models.CompositeModel as gc
-import ndlib.models.compartments as cpm
-from ndlib.utils import multi_runs
+import copy
+import multiprocessing
+import numpy as np
+from nidmod.diffusionmodel.compiledmodel import CompiledDiffusionModel, build_trends, is_absorbed, is_deterministic
+
+# returns the rules of an ndlib CompositeModel as (status from, status to, compartment type,
+# value, trigger) tuples of status codes
+def get_model_rules(model):
+    statuses = model.available_statuses
+    rules = []
+    for status_from, status_to, rule in model.compartment.values():
+        trigger = getattr(rule, 'trigger', None)
+        rules.append((statuses[status_from], statuses[status_to], type(rule).__name__, None,
+                      statuses[trigger] if trigger is not None else None))
+    return rules
+
+# yields (iteration, statuses x 1 counts, stopping iteration) for a single ndlib run
+# with early stopping the run stops once no rule can fire, or once an iteration changes nothing when
+# all rules are deterministic, and the final counts are repeated for the remaining iterations
+def iter_ndlib_counts(model, iteration_number, infected_nodes = None, early_stopping = False):
+    run_model = copy.deepcopy(model)
+    if infected_nodes is not None:
+        run_model.reset(infected_nodes)
+    else:
+        run_model.reset()
+    codes = sorted(model.available_statuses.values())
+    rules = get_model_rules(model)
+    deterministic = is_deterministic(rules)
+    
+    stopping_iteration = iteration_number
+    for j in range(iteration_number):
+        if stopping_iteration == iteration_number:
+            iteration = run_model.iteration(early_stopping and deterministic)
+            counts = np.array([[iteration['node_count'][code]] for code in codes])
+            if early_stopping:
+                if j > 0 and deterministic and len(iteration['status']) == 0:
+                    stopping_iteration = j - 1
+                elif is_absorbed(counts, rules)[0]:
+                    stopping_iteration = j
+        yield j, counts, stopping_iteration
+
+# performs ndlib runs one after another in the current process
+def serial_multi_runs(model, execution_number = 1, iteration_number = 50, 
+                      infection_sets = None, nprocesses = None, early_stopping = False):
+    codes = sorted(model.available_statuses.values())
+    trends = []
+    for i in range(execution_number):
+        infected_nodes = infection_sets[i] if infection_sets is not None else None
+        node_count = np.zeros((len(codes), iteration_number), dtype = np.int64)
+        for j, counts, stopping_iteration in iter_ndlib_counts(model, iteration_number, infected_nodes,
+                                                               early_stopping):
+            node_count[:, j] = counts[:, 0]
+        trends.append(build_trends(node_count, codes, stopping_iteration if early_stopping else None))
+    return trends
+
+# performs ndlib runs one after another, updating the reducers in place as each iteration is produced
+def serial_reduce_runs(model, reducers, execution_number = 1, iteration_number = 50,
+                       infection_sets = None, nprocesses = None, early_stopping = False):
+    for reducer in reducers:
+        reducer.start(model.available_statuses, execution_number, iteration_number)
+    for i in range(execution_number):
+        infected_nodes = infection_sets[i] if infection_sets is not None else None
+        runs = np.array([i])
+        for j, counts, stopping_iteration in iter_ndlib_counts(model, iteration_number, infected_nodes,
+                                                               early_stopping):
+            for reducer in reducers:
+                reducer.update(runs, j, counts)
+        if early_stopping:
+            for reducer in reducers:
+                reducer.stop(runs, np.array([stopping_iteration]))
+    return reducers
 
 class CustomDiffusionModel:
     '''
@@ -28,6 +95,14 @@ class CustomDiffusionModel:
         if model_name is not None:
             self.model_name = model_name
     
+    # returns the status codes of the model, in the order ndlib assigns them as statuses are added
+    def get_available_statuses(self):
+        available_statuses = {}
+        for status in self.statuses:
+            if status not in available_statuses:
+                available_statuses[status] = len(available_statuses)
+        return available_statuses
+    
     # creates an SIR model with the given parameters
     @classmethod
     def SIR(cls, beta, gamma, fraction_infected):
@@ -50,43 +125,103 @@ class CustomDiffusionModel:
         return cls(statuses, compartments, transition_rules, model_parameters,
                    model_name)
         
+class ModelStatuses:
+    '''
+    Class holding the graph and status codes of a custom diffusion model, without initialising it
+    
+    Stands in for an initialised ndlib model where only its available_statuses and graph are
+    needed, e.g. for a ResultsAnalyser of trends simulated in another process
+    '''
+    def __init__(self, graph, custom_diffusion_model, available_statuses = None):
+        self.graph = graph
+        if available_statuses is None:
+            available_statuses = custom_diffusion_model.get_available_statuses()
+        self.available_statuses = available_statuses
+        # ndlib's comparison plots label each model by its name, which is empty for a CompositeModel
+        self.name = ''
+        
+# returns an ndlib CompositeModel of the custom diffusion model on the graph, with its initial status set
+def build_composite_model(graph, custom_diffusion_model):
+    # ndlib is slow to import, so it is only imported once a model is built
+    import ndlib.models.ModelConfig as mc
+    import ndlib.models.CompositeModel as gc
+    import ndlib.models.compartments as cpm
+    
+    model = gc.CompositeModel(graph)
+
+    # adding the model statuses
+    for status in custom_diffusion_model.statuses:
+        model.add_status(status)
+    
+    # adding the model compartments
+    set_compartments = {}
+    for compartment_type in custom_diffusion_model.compartments:
+        compartment_type_fun = getattr(cpm, compartment_type)
+        for compartment in custom_diffusion_model.compartments[compartment_type]:
+            set_compartments[compartment] = compartment_type_fun(*custom_diffusion_model.compartments
+                                            [compartment_type][compartment])
+    
+    # adding the model rules
+    for rule in custom_diffusion_model.transition_rules:
+        model.add_rule(rule[0], rule[1], set_compartments[rule[2]])
+     
+    # setting the model initial status parameters    
+    config = mc.Configuration()
+    for parameter in custom_diffusion_model.parameters:
+        config.add_model_parameter(*parameter)
+    model.set_initial_status(config)
+    return model
+
 class InitialisedDiffusionModel:
     '''
     Class to initialise and run the supplied custom diffusion model on the supplied graph
+    
+    The backend can be 'ndlib' (default), 'compiled' or 'batched'. The compiled backend runs
+    the model with vectorised NumPy operations on a CSR adjacency matrix, and the batched
+    backend also advances all runs together as one (nodes x runs) state matrix
+    
+    Only the ndlib backend builds an ndlib model (and imports ndlib). For the compiled and
+    batched backends, model is a ModelStatuses, which is all a ResultsAnalyser needs
     '''
-    def __init__(self, graph, custom_diffusion_model):
+    def __init__(self, graph, custom_diffusion_model, backend = 'ndlib'):
         self.graph = graph
-        self.model = gc.CompositeModel(self.graph)
+        self.backend = backend
+        if backend == 'ndlib':
+            self.model = build_composite_model(self.graph, custom_diffusion_model)
+        elif backend in ['compiled', 'batched']:
+            self.model = ModelStatuses(self.graph, custom_diffusion_model)
+            self.compiled_model = CompiledDiffusionModel(self.graph, custom_diffusion_model)
+        else:
+            raise ValueError('Unknown diffusion model backend: ' + str(backend))
     
-        # adding the model statuses
-        for status in custom_diffusion_model.statuses:
-            self.model.add_status(status)
-        
-        # adding the model compartments
-        set_compartments = {}
-        for compartment_type in custom_diffusion_model.compartments:
-            compartment_type_fun = getattr(cpm, compartment_type)
-            for compartment in custom_diffusion_model.compartments[compartment_type]:
-                set_compartments[compartment] = compartment_type_fun(*custom_diffusion_model.compartments
-                                                [compartment_type][compartment])
-        
-        # adding the model rules
-        for rule in custom_diffusion_model.transition_rules:
-            self.model.add_rule(rule[0], rule[1], set_compartments[rule[2]])
-         
-        # setting the model initial status parameters    
-        config = mc.Configuration()
-        for parameter in custom_diffusion_model.parameters:
-            config.add_model_parameter(*parameter)
-        self.model.set_initial_status(config)
-    
-    # returns the initialised diffusion model
+    # returns the initialised diffusion model (a ModelStatuses for the compiled and batched backends)
     def get_initialised_model(self):
         return self.model
     
-    # performs an ndlib multi_runs based on given parameters
-    def run_diffusion_model(self, parameters):
+    # performs an ndlib (or compiled/batched) multi_runs based on given parameters
+    # if reducers are given, statistics are accumulated as the runs progress instead of keeping
+    # the trends, and the updated reducers are returned
+    # with early stopping, converged runs stop and have their trends padded with their final counts
+    def run_diffusion_model(self, parameters, reducers = None, early_stopping = False):
+        if reducers is not None:
+            return self.reduce_diffusion_model(parameters, reducers, early_stopping)
+        if self.backend == 'compiled':
+            return self.compiled_model.multi_runs(*parameters, early_stopping = early_stopping)
+        if self.backend == 'batched':
+            return self.compiled_model.batched_runs(*parameters, early_stopping = early_stopping)
+        # pool workers are daemonic and cannot start the process pool multi_runs uses,
+        # and multi_runs cannot stop runs early
+        if multiprocessing.current_process().daemon or early_stopping:
+            return serial_multi_runs(self.model, *parameters, early_stopping = early_stopping)
+        from ndlib.utils import multi_runs
         trends = multi_runs(self.model, *parameters)
         return trends
-
-    
\ No newline at end of file
+    
+    # runs the model, updating the reducers in place as each iteration is produced
+    def reduce_diffusion_model(self, parameters, reducers, early_stopping = False):
+        if self.backend == 'compiled':
+            return self.compiled_model.reduce_runs(reducers, *parameters, batch_size = 1,
+                                                   early_stopping = early_stopping)
+        if self.backend == 'batched':
+            return self.compiled_model.reduce_runs(reducers, *parameters, early_stopping = early_stopping)
+        return serial_reduce_runs(self.model, reducers, *parameters, early_stopping = early_stopping)
\ No newline at end of file
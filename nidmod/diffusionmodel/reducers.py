@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:37:12 2026
+
+@author: jnevin
+"""
+
+'''
+Point for defining trend reducers.
+
+Reducers accumulate statistics while a diffusion model runs, so the per-iteration
+history of each run never needs to be kept.
+
+A reducer is started with the model's status map, the number of runs and the number of
+iterations. It is then updated with the run indices, the iteration number and a
+(statuses x runs) array of node counts, ordered by status code, as each iteration is produced.
+With early stopping, it is also told each run's stopping iteration once the run has finished.
+'''
+
+import numpy as np
+
+class TrendReducer:
+    '''
+    Base class for reducers, subclasses implement update and get_result
+    '''
+    def start(self, available_statuses, execution_number, iteration_number):
+        self.status_names = [k for k, v in sorted(available_statuses.items(), key = lambda item: item[1])]
+        self.execution_number = execution_number
+        self.iteration_number = iteration_number
+
+    def update(self, runs, iteration, node_count):
+        raise NotImplementedError
+
+    def stop(self, runs, stopping_iterations):
+        pass
+
+    def get_result(self):
+        raise NotImplementedError
+
+    # returns a dictionary of per-status arrays named status + suffix
+    def _named(self, values, suffix):
+        return dict((name + suffix, values[:, j]) for j, name in enumerate(self.status_names))
+
+class PeakReducer(TrendReducer):
+    '''
+    Reducer for the per-run peak count of each status and the iteration it is first reached
+    '''
+    def start(self, available_statuses, execution_number, iteration_number):
+        super().start(available_statuses, execution_number, iteration_number)
+        self.peak = np.full((execution_number, len(self.status_names)), -1, dtype = np.int64)
+        self.peak_time = np.zeros((execution_number, len(self.status_names)), dtype = np.int64)
+
+    def update(self, runs, iteration, node_count):
+        counts = node_count.T
+        higher = counts > self.peak[runs]
+        self.peak[runs] = np.where(higher, counts, self.peak[runs])
+        self.peak_time[runs] = np.where(higher, iteration, self.peak_time[runs])
+
+    def get_result(self):
+        result = self._named(self.peak, '_peak')
+        result.update(self._named(self.peak_time, '_peak_time'))
+        return result
+
+class FinalReducer(TrendReducer):
+    '''
+    Reducer for the per-run count of each status at the last iteration
+    '''
+    def start(self, available_statuses, execution_number, iteration_number):
+        super().start(available_statuses, execution_number, iteration_number)
+        self.final = np.zeros((execution_number, len(self.status_names)), dtype = np.int64)
+
+    def update(self, runs, iteration, node_count):
+        self.final[runs] = node_count.T
+
+    def get_result(self):
+        return self._named(self.final, '_final')
+
+class MeanVarianceReducer(TrendReducer):
+    '''
+    Reducer for the mean and variance over runs of each status count at each iteration
+
+    Uses Welford's running update, combining batches of runs with Chan's formula
+    '''
+    def __init__(self, ddof = 1):
+        self.ddof = ddof
+
+    def start(self, available_statuses, execution_number, iteration_number):
+        super().start(available_statuses, execution_number, iteration_number)
+        shape = (iteration_number, len(self.status_names))
+        self.count = np.zeros(iteration_number, dtype = np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, runs, iteration, node_count):
+        counts = np.asarray(node_count, dtype = np.float64)
+        batch_count = counts.shape[1]
+        batch_mean = counts.mean(axis = 1)
+        batch_m2 = ((counts - batch_mean[:, np.newaxis]) ** 2).sum(axis = 1)
+
+        count = self.count[iteration]
+        total = count + batch_count
+        delta = batch_mean - self.mean[iteration]
+        self.mean[iteration] += delta * batch_count / total
+        self.m2[iteration] += batch_m2 + delta ** 2 * count * batch_count / total
+        self.count[iteration] = total
+
+    def get_result(self):
+        denominator = np.maximum(self.count - self.ddof, 1)[:, np.newaxis]
+        result = self._named(self.mean, '_mean')
+        result.update(self._named(self.m2 / denominator, '_variance'))
+        return result
+
+class StoppingIterationReducer(TrendReducer):
+    '''
+    Reducer for the per-run iteration from which an early stopped run's counts stay final
+    
+    Runs that did not converge (or were run without early stopping) keep the iteration number
+    '''
+    def start(self, available_statuses, execution_number, iteration_number):
+        super().start(available_statuses, execution_number, iteration_number)
+        self.stopping_iteration = np.full(execution_number, iteration_number, dtype = np.int64)
+
+    def update(self, runs, iteration, node_count):
+        pass
+
+    def stop(self, runs, stopping_iterations):
+        self.stopping_iteration[runs] = stopping_iterations
+
+    def get_result(self):
+        return {'stopping_iteration': self.stopping_iteration}
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:12:40 2026
+
+@author: jnevin
+"""
+
+from contextlib import contextmanager
+import sys
+import time
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# returns the peak resident set size of the process in bytes, or None where it is unavailable
+def get_peak_rss():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+class Instrumentation:
+    '''
+    Class for recording the wall time, peak memory and sizes of pipeline stages
+
+    Each stage is run inside the stage context manager, which yields a record (a dictionary)
+    that the stage adds its input and output sizes to. Records also hold the stage's wall time,
+    its time excluding any stages nested inside it (self_time), the process peak RSS after the
+    stage and how much the stage raised it, and the current label (e.g. a setup index)
+
+    Callbacks are called as callback(event, record), with event 'start' or 'end' for stages
+    and 'progress' for progress updates, whose records hold the numbers done and in total
+    '''
+    def __init__(self, callbacks = None):
+        self.callbacks = list(callbacks) if callbacks is not None else []
+        self.records = []
+        self.label = None
+        self._stack = []
+
+    # callbacks are not sent to worker processes
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['callbacks'] = []
+        return state
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def _notify(self, event, record):
+        for callback in self.callbacks:
+            callback(event, record)
+
+    # sets the label of the records made inside the context
+    @contextmanager
+    def labelled(self, label):
+        previous_label = self.label
+        self.label = label
+        try:
+            yield
+        finally:
+            self.label = previous_label
+
+    # records a stage, yielding its record so sizes can be added to it
+    @contextmanager
+    def stage(self, name, **sizes):
+        record = {'stage': name, 'label': self.label}
+        record.update(sizes)
+        self._notify('start', record)
+        self._stack.append(0.0)
+        peak_rss_before = get_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['time'] = time.perf_counter() - start
+            record['self_time'] = record['time'] - self._stack.pop()
+            if len(self._stack) > 0:
+                self._stack[-1] += record['time']
+            record['peak_rss'] = get_peak_rss()
+            record['peak_rss_increase'] = None if peak_rss_before is None else record['peak_rss'] - peak_rss_before
+            self.records.append(record)
+            self._notify('end', record)
+
+    # reports progress to the callbacks
+    def progress(self, done, total, **details):
+        record = {'label': self.label, 'done': done, 'total': total}
+        record.update(details)
+        self._notify('progress', record)
+
+    # adds records made elsewhere (e.g. in a worker process), as if their stages just ended
+    def add_records(self, records):
+        for record in records:
+            self.records.append(record)
+            self._notify('end', record)
+
+    def clear(self):
+        self.records = []
+
+    # returns a dataframe with one row per recorded stage
+    def get_stage_table(self):
+        return pd.DataFrame(self.records)
+
+    # returns a dataframe of the time spent in each stage (excluding nested stages) per label,
+    # with a total column
+    def get_timing_table(self):
+        if len(self.records) == 0:
+            return pd.DataFrame()
+        stage_table = self.get_stage_table()
+        stage_table['label'] = stage_table['label'].astype(object).where(stage_table['label'].notna(), 'unlabelled')
+        stages = list(dict.fromkeys(stage_table['stage']))
+        timing_table = stage_table.pivot_table(index = 'label', columns = 'stage', values = 'self_time',
+                                               aggfunc = 'sum', dropna = False, sort = False)
+        timing_table = timing_table.reindex(columns = stages)
+        try:
+            timing_table = timing_table.sort_index()
+        except TypeError:
+            pass
+        timing_table['total'] = timing_table.sum(axis = 1)
+        return timing_table
@@ -5,21 +5,46 @@ Created on Thu Mar 24 13:32:12 2022
 @author: jnevin
 """
 
-from nidmod.datahandling.dataintegration import FeatureSetup, MatchClassifier, NetworkIntegrator
+from nidmod.datahandling.dataintegration import FeatureSetup, MatchClassifier, SourceLinker, NetworkIntegrator
 from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel
 from nidmod.analyser.networkanalysis import ResultsAnalyser
+from nidmod.instrumentation import Instrumentation
 import pandas as pd
 
 class IntegrationPipeline:
     '''
     Class for entire integration and diffusion model pipeline
-    
+
     Users can provide all the individual steps of the process and run in one go
+
+    The pipeline is a chain of lazily evaluated stages (attributes -> candidate links -> features
+    -> matches -> integrated network -> model -> trends -> analysis). Each stage is computed the
+    first time it (or a stage after it) is accessed, e.g. through results_analyser, and its
+    result is kept. Assigning a new value to a parameter (e.g. pipeline.simulation_parameters = ...)
+    discards only the stages downstream of it, so a new diffusion on the same integrated network
+    only reruns the diffusion. Parameters need to be assigned, not changed in place
+
+    The classifier can be fit on a sample of fit_sample_size features (drawn with fit_seed) and
+    predict in chunks of predict_chunk_size features
+
+    With more than two graphs, each graph is linked in turn against a running canonical entity
+    index (see SourceLinker) in a single linkage stage, and fit_model is a list with one model
+    per linked graph
+
+    Each stage is recorded by the (optional) instrumentation, with its sizes, and is available
+    as self.instrumentation
     '''
+    parameter_names = ['graphs', 'blocks', 'compares', 'classifier_name', 'clustering_alg', 'statuses',
+                       'compartments', 'transition_rules', 'model_parameters', 'simulation_parameters',
+                       'model_name', 'training_matches', 'fit_sample_size', 'predict_chunk_size',
+                       'fit_seed']
+
     def __init__(self, graphs, blocks, compares, classifier_name,
                  clustering_alg, statuses, compartments, transition_rules,
-                 model_parameters, simulation_parameters, model_name = None, 
-                 training_matches = None):
+                 model_parameters, simulation_parameters, model_name = None,
+                 training_matches = None, fit_sample_size = None, predict_chunk_size = None,
+                 instrumentation = None, fit_seed = 0):
+        self._stage_results = {}
         self.graphs = graphs
         self.blocks = blocks
         self.compares = compares
@@ -30,51 +55,209 @@ class IntegrationPipeline:
         self.transition_rules = transition_rules
         self.model_parameters = model_parameters
         self.simulation_parameters = simulation_parameters
+        self.model_name = model_name
         self.training_matches = training_matches
-        
-        # extracting the attributes of the individual graphs
-        self.num_graphs = len(graphs)
-        graph_attribute_dfs = {}
-        for i in range(self.num_graphs):
-            graph_attribute_dfs['graph_' + str(i)] = pd.DataFrame.from_dict(dict(graphs[i].nodes(data=True)), orient='index')
-        self.graph_attribute_dfs = graph_attribute_dfs
-        
-        # calculating the comparison features of the graph(s)
-        if len(graphs) == 1:
-            feature_setup = FeatureSetup(blocks, compares, graph_attribute_dfs['graph_0'])
-        else:
-            feature_setup = FeatureSetup(blocks, compares, graph_attribute_dfs['graph_0'], graph_attribute_dfs['graph_1'])
-        
-        self.features = feature_setup.calculate_features()
-        
-        # fitting the model and predicting matches
-        if training_matches is not None:
-            match_classifier = MatchClassifier(classifier_name, self.features, training_matches)
-        else:
-            match_classifier = MatchClassifier(classifier_name, self.features)
-            
-        self.fit_model = match_classifier.fit_model()
-        self.pred_matches = self.fit_model.predict(self.features)
-        
-        # integrating the network
-        if len(graphs) == 1:
-            network_integrator = NetworkIntegrator(graphs[0], self.pred_matches)
+        self.fit_sample_size = fit_sample_size
+        self.predict_chunk_size = predict_chunk_size
+        self.fit_seed = fit_seed
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+
+    # discards the stages downstream of a parameter when it is assigned
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.parameter_names:
+            self.invalidate(name)
+
+    # returns a dictionary of the parameters and stages each stage depends on
+    def get_stage_dependencies(self):
+        linkage_parameters = ['classifier_name', 'training_matches', 'fit_sample_size', 'predict_chunk_size',
+                              'fit_seed']
+        if self.num_graphs > 2:
+            linkage_dependencies = {
+                'source_linker': ['graph_attribute_dfs', 'blocks', 'compares'] + linkage_parameters,
+                'candidate_links': ['source_linker'],
+                'features': ['source_linker'],
+                'matches': ['source_linker']}
         else:
-            network_integrator = NetworkIntegrator(graphs, self.pred_matches)
-
-        self.integrated_network = network_integrator.integrate_network(clustering_alg)
-        
-        # running the diffusion model and storing the results
-        custom_diffusion_model = CustomDiffusionModel(statuses, compartments,
-                                             transition_rules, model_parameters)
-        
-        initialised_diffusion_model = InitialisedDiffusionModel(self.integrated_network, 
-                                                                custom_diffusion_model)
-        
-        self.model = initialised_diffusion_model.get_initialised_model()
-        self.trends = initialised_diffusion_model.run_diffusion_model(simulation_parameters)
-        
-        self.results_analyser = ResultsAnalyser(self.model, self.integrated_network, self.trends)
-        
-        
-        
\ No newline at end of file
+            linkage_dependencies = {
+                'candidate_links': ['graph_attribute_dfs', 'blocks'],
+                'features': ['candidate_links', 'compares'],
+                'matches': ['features'] + linkage_parameters}
+        stage_dependencies = {'graph_attribute_dfs': ['graphs']}
+        stage_dependencies.update(linkage_dependencies)
+        stage_dependencies.update({
+            'integrated_network': ['graphs', 'matches', 'clustering_alg'],
+            'diffusion_model': ['integrated_network', 'statuses', 'compartments', 'transition_rules',
+                                'model_parameters', 'model_name'],
+            'trends': ['diffusion_model', 'simulation_parameters'],
+            'results_analyser': ['trends']})
+        return stage_dependencies
+
+    # discards the results of all stages downstream of a parameter or stage
+    def invalidate(self, name):
+        if '_stage_results' not in self.__dict__ or 'graphs' not in self.__dict__:
+            return
+        stage_dependencies = self.get_stage_dependencies()
+        invalid = set([name])
+        for stage, dependencies in stage_dependencies.items():
+            if invalid.intersection(dependencies):
+                invalid.add(stage)
+        for stage in invalid:
+            self._stage_results.pop(stage, None)
+
+    # returns the result of a stage, computing it on first access
+    def get_stage(self, stage):
+        if stage not in self._stage_results:
+            self._stage_results[stage] = getattr(self, '_compute_' + stage)()
+        return self._stage_results[stage]
+
+    # returns whether a stage currently holds a result
+    def is_computed(self, stage):
+        return stage in self._stage_results
+
+    # computes every stage, returning the results analyser
+    def run(self):
+        return self.results_analyser
+
+    @property
+    def num_graphs(self):
+        return len(self.graphs)
+
+    # extracting the attributes of the individual graphs
+    def _compute_graph_attribute_dfs(self):
+        with self.instrumentation.stage('attributes'):
+            graph_attribute_dfs = {}
+            for i in range(self.num_graphs):
+                graph_attribute_dfs['graph_' + str(i)] = pd.DataFrame.from_dict(dict(self.graphs[i].nodes(data=True)), orient='index')
+            return graph_attribute_dfs
+
+    # linking more than two graphs against a running canonical entity index
+    def _compute_source_linker(self):
+        with self.instrumentation.stage('linkage') as record:
+            source_linker = SourceLinker(self.blocks, self.compares, self.classifier_name,
+                                         list(self.graph_attribute_dfs.values()), self.training_matches,
+                                         self.fit_sample_size, self.predict_chunk_size, fit_seed = self.fit_seed)
+            source_linker.link_sources()
+            record['candidate_links'] = len(source_linker.features) if source_linker.features is not None else 0
+            record['predicted_matches'] = len(source_linker.matches) if source_linker.matches is not None else 0
+            return source_linker
+
+    # returns a feature setup for the graph attribute dataframes
+    def _get_feature_setup(self, compares, candidate_links = None):
+        graph_attribute_dfs = self.graph_attribute_dfs
+        if self.num_graphs == 1:
+            return FeatureSetup(self.blocks, compares, graph_attribute_dfs['graph_0'],
+                                candidate_links = candidate_links)
+        return FeatureSetup(self.blocks, compares, graph_attribute_dfs['graph_0'],
+                            graph_attribute_dfs['graph_1'], candidate_links)
+
+    def _compute_candidate_links(self):
+        if self.num_graphs > 2:
+            features = self.get_stage('source_linker').features
+            return features.index if features is not None else None
+        with self.instrumentation.stage('candidate_links') as record:
+            candidate_links = self._get_feature_setup({}).candidate_links
+            record['candidate_links'] = len(candidate_links)
+            return candidate_links
+
+    # calculating the comparison features of the graph(s)
+    def _compute_features(self):
+        if self.num_graphs > 2:
+            return self.get_stage('source_linker').features
+        candidate_links = self.candidate_links
+        with self.instrumentation.stage('features') as record:
+            features = self._get_feature_setup(self.compares, candidate_links).calculate_features()
+            record['features'] = len(features)
+            return features
+
+    # fitting the model and predicting matches
+    def _compute_matches(self):
+        if self.num_graphs > 2:
+            source_linker = self.get_stage('source_linker')
+            return source_linker.fit_models, source_linker.matches
+        features = self.features
+        with self.instrumentation.stage('classification') as record:
+            match_classifier = MatchClassifier(self.classifier_name, features, self.training_matches,
+                                               sample_size = self.fit_sample_size, seed = self.fit_seed)
+            fit_model = match_classifier.fit_model()
+            pred_matches = match_classifier.predict(features, self.predict_chunk_size)
+            record['predicted_matches'] = len(pred_matches)
+            return fit_model, pred_matches
+
+    # integrating the network
+    def _compute_integrated_network(self):
+        pred_matches = self.pred_matches
+        with self.instrumentation.stage('integration') as record:
+            if self.num_graphs == 1:
+                network_integrator = NetworkIntegrator(self.graphs[0], pred_matches)
+            else:
+                network_integrator = NetworkIntegrator(self.graphs, pred_matches)
+            integrated_network = network_integrator.integrate_network(self.clustering_alg)
+            record.update({'nodes_before': sum(graph.number_of_nodes() for graph in self.graphs),
+                           'edges_before': sum(graph.number_of_edges() for graph in self.graphs),
+                           'nodes_after': integrated_network.number_of_nodes(),
+                           'edges_after': integrated_network.number_of_edges()})
+            return integrated_network
+
+    # initialising the diffusion model on the integrated network
+    def _compute_diffusion_model(self):
+        integrated_network = self.integrated_network
+        with self.instrumentation.stage('initialisation'):
+            custom_diffusion_model = CustomDiffusionModel(self.statuses, self.compartments,
+                                                          self.transition_rules, self.model_parameters,
+                                                          self.model_name)
+            return InitialisedDiffusionModel(integrated_network, custom_diffusion_model)
+
+    # running the diffusion model
+    def _compute_trends(self):
+        initialised_diffusion_model = self.initialised_diffusion_model
+        with self.instrumentation.stage('simulation') as record:
+            trends = initialised_diffusion_model.run_diffusion_model(self.simulation_parameters)
+            record['executions'] = self.simulation_parameters[0]
+            record['iterations'] = self.simulation_parameters[1]
+            return trends
+
+    def _compute_results_analyser(self):
+        trends = self.trends
+        with self.instrumentation.stage('analysis'):
+            return ResultsAnalyser(self.model, self.integrated_network, trends)
+
+    @property
+    def graph_attribute_dfs(self):
+        return self.get_stage('graph_attribute_dfs')
+
+    @property
+    def candidate_links(self):
+        return self.get_stage('candidate_links')
+
+    @property
+    def features(self):
+        return self.get_stage('features')
+
+    @property
+    def fit_model(self):
+        return self.get_stage('matches')[0]
+
+    @property
+    def pred_matches(self):
+        return self.get_stage('matches')[1]
+
+    @property
+    def integrated_network(self):
+        return self.get_stage('integrated_network')
+
+    @property
+    def initialised_diffusion_model(self):
+        return self.get_stage('diffusion_model')
+
+    @property
+    def model(self):
+        return self.initialised_diffusion_model.get_initialised_model()
+
+    @property
+    def trends(self):
+        return self.get_stage('trends')
+
+    @property
+    def results_analyser(self):
+        return self.get_stage('results_analyser')
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:09 2026
+
+@author: jnevin
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import networkx as nx
+import numpy as np
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel
+from nidmod.analyser.networkanalysis import get_graph_properties
+from nidmod.analyser.trendstore import TrendStore
+from nidmod.resultstore import ResultStore
+from nidmod.stagecache import StageCache, hash_inputs
+
+# returns a value with numpy types, tuples and non-string dictionary keys converted for json
+def _to_json(value):
+    if isinstance(value, dict):
+        return dict((key if isinstance(key, str) else str(key), _to_json(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+# loads a graph from a spec, either {'path': ...} to a .gml, .graphml or edge list file or
+# {'store': directory, 'key': key} for a network in a ResultStore
+def load_graph(graph_spec):
+    if 'store' in graph_spec:
+        return ResultStore(graph_spec['store']).load_network(graph_spec['key'])
+    path = graph_spec['path']
+    if path.endswith('.gml'):
+        return nx.read_gml(path)
+    if path.endswith('.graphml'):
+        return nx.read_graphml(path)
+    return nx.read_edgelist(path)
+
+class JobServer:
+    '''
+    Class for a local server that runs simulation and analysis jobs on warm graphs and models
+
+    Inputs are a Unix socket path (or a host and port, used when no path is given), the
+    numbers of graphs and initialised models to keep, and the number of worker threads
+
+    Requests and responses are single lines of json. A request has a 'job' ('simulate',
+    'analyse' or 'statistics'), an optional 'id' that is returned with the response, and a
+    'graph' spec (see load_graph). Simulations also take a 'model', the arguments of
+    CustomDiffusionModel (statuses, compartments, transition_rules, parameters and an
+    optional model_name), a 'simulation' setup as taken by multi_runs and a 'backend'
+    ('batched' by default), and return the average statistics of the runs. Analyses take the
+    options of get_graph_properties and return the graph properties. Responses hold a
+    'result' or an 'error'
+
+    Graphs and initialised models are kept in least recently used caches, and are loaded or
+    initialised once even when several requests need them at the same time. Jobs run on a
+    pool of threads sharing the caches (the compiled backends release the GIL in their NumPy
+    operations, and ndlib models, which hold their state, run one job at a time). Identical
+    requests that arrive while one is running wait for its result instead of running again,
+    except simulations without a seed (the fifth value of the simulation setup), which are
+    stochastic and so each run their own simulations. Analyses are cached by graph, metrics and
+    options, so sampled properties without a seed are also reused by later requests
+    '''
+    def __init__(self, path = None, host = '127.0.0.1', port = 0, max_graphs = 8, max_models = 16,
+                 n_workers = None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.graph_cache = StageCache(max_entries = max_graphs)
+        self.model_cache = StageCache(max_entries = max_models)
+        self.property_cache = StageCache(max_entries = 256)
+        self.executor = ThreadPoolExecutor(max_workers = n_workers)
+        self.in_flight = {}
+        self.num_requests = 0
+        self.num_coalesced = 0
+        self.server = None
+
+    # returns the running task for a key, starting it with start() if there is none, so
+    # identical work is only done once at a time
+    def _get_task(self, key, start):
+        if key not in self.in_flight:
+            task = asyncio.ensure_future(start())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda task: self.in_flight.pop(key) if self.in_flight.get(key) is task else None)
+            return task, False
+        return self.in_flight[key], True
+
+    # returns the value of a cache entry, loading it in the pool once if it is missing
+    async def _get_cached(self, cache, key, load):
+        if key in cache:
+            cache.hits += 1
+            return cache.get(key)
+        task, loading = self._get_task(('load', id(cache), key),
+                                       lambda: asyncio.get_running_loop().run_in_executor(self.executor, load))
+        if not loading:
+            cache.misses += 1
+        value = await asyncio.shield(task)
+        cache.put(key, value)
+        return value
+
+    # returns the cache key of a graph, including the modification time of graph files
+    def get_graph_key(self, graph_spec):
+        if 'path' in graph_spec:
+            return hash_inputs(graph_spec, os.path.getmtime(graph_spec['path']))
+        return hash_inputs(graph_spec)
+
+    async def get_graph(self, graph_spec):
+        return await self._get_cached(self.graph_cache, self.get_graph_key(graph_spec), lambda: load_graph(graph_spec))
+
+    # returns an initialised model of the graph and a lock for running it
+    async def get_model(self, graph_spec, model_spec, backend):
+        graph = await self.get_graph(graph_spec)
+        def initialise():
+            initialised_model = InitialisedDiffusionModel(graph, CustomDiffusionModel(**model_spec), backend)
+            return initialised_model, threading.Lock()
+        return await self._get_cached(self.model_cache, hash_inputs(self.get_graph_key(graph_spec), model_spec, backend),
+                                      initialise)
+
+    async def simulate(self, request):
+        backend = request.get('backend', 'batched')
+        graph = await self.get_graph(request['graph'])
+        initialised_model, lock = await self.get_model(request['graph'], request['model'], backend)
+        simulation_setup = request.get('simulation', [1, 50])
+        def run():
+            if backend == 'ndlib':
+                with lock:
+                    trends = initialised_model.run_diffusion_model(simulation_setup)
+            else:
+                trends = initialised_model.run_diffusion_model(simulation_setup)
+            trend_store = TrendStore.from_trends(trends, initialised_model.model.available_statuses,
+                                                 graph.number_of_nodes())
+            return trend_store.get_average_statistics()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+
+    async def analyse(self, request):
+        graph = await self.get_graph(request['graph'])
+        options = dict((option, request[option]) for option in ['betweenness_samples', 'closeness_samples',
+                                                                 'confidence', 'seed'] if option in request)
+        metrics = request.get('metrics', ['num_nodes', 'num_edges', 'connected'])
+        return await self._get_cached(self.property_cache,
+                                      hash_inputs(self.get_graph_key(request['graph']), metrics, options),
+                                      lambda: get_graph_properties(graph, metrics, **options))
+
+    # returns a dictionary of server and cache statistics
+    def get_statistics(self):
+        return {'requests': self.num_requests, 'coalesced': self.num_coalesced, 'in_flight': len(self.in_flight),
+                'graphs': self.graph_cache.get_statistics(), 'models': self.model_cache.get_statistics(),
+                'properties': self.property_cache.get_statistics()}
+
+    # returns whether a request is a simulation without a seed, whose results differ on every run
+    def is_unseeded_simulation(self, request):
+        simulation_setup = request.get('simulation', [1, 50])
+        return request.get('job') == 'simulate' and (len(simulation_setup) < 5 or simulation_setup[4] is None)
+
+    # runs a request, sharing the result with identical requests already running
+    async def submit(self, request):
+        self.num_requests += 1
+        job = request.get('job')
+        if job == 'statistics':
+            return self.get_statistics()
+        if job not in ['simulate', 'analyse']:
+            raise ValueError('Unknown job: ' + str(job))
+        if self.is_unseeded_simulation(request):
+            return await self.simulate(request)
+        key = hash_inputs(dict((name, value) for name, value in request.items() if name != 'id'))
+        task, coalesced = self._get_task(key, lambda: getattr(self, job)(request))
+        if coalesced:
+            self.num_coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _respond(self, line, writer, write_lock):
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Requests need to be json objects')
+            response['id'] = request.get('id')
+            response['result'] = _to_json(await self.submit(request))
+        except Exception as error:
+            response['error'] = type(error).__name__ + ': ' + str(error)
+        async with write_lock:
+            writer.write((json.dumps(response) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    # reads requests from a connection, responding to each as it completes
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tasks.append(asyncio.ensure_future(self._respond(line, writer, write_lock)))
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def start(self):
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.server = await asyncio.start_unix_server(self.handle_connection, path = self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait = False)
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+class JobClient:
+    '''
+    Class for sending jobs to a JobServer over its Unix socket (or host and port)
+
+    Each call to submit sends one request and waits for its response, returning the result
+    and raising a RuntimeError with the server's message if the job failed
+    '''
+    def __init__(self, path = None, host = '127.0.0.1', port = None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rb')
+
+    def submit(self, request):
+        self.socket.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        response = json.loads(self.file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = 'Run a local nidmod job server')
+    parser.add_argument('--socket', default = None, help = 'Unix socket path (serves on localhost otherwise)')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--max-graphs', type = int, default = 8)
+    parser.add_argument('--max-models', type = int, default = 16)
+    parser.add_argument('--workers', type = int, default = None)
+    args = parser.parse_args(args)
+
+    job_server = JobServer(args.socket, args.host, args.port, args.max_graphs, args.max_models, args.workers)
+    try:
+        asyncio.run(job_server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job_server.close()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:41:17 2026
+
+@author: jnevin
+"""
+
+import multiprocessing
+
+# returns a process pool context, forking where possible so worker state is shared copy-on-write
+def get_pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+# splits a list into at most num_chunks contiguous chunks of near equal size
+def split_into_chunks(items, num_chunks):
+    num_chunks = max(min(num_chunks, len(items)), 1)
+    chunk_size, remainder = divmod(len(items), num_chunks)
+    chunks = []
+    start = 0
+    for i in range(num_chunks):
+        stop = start + chunk_size + (1 if i < remainder else 0)
+        chunks.append(items[start:stop])
+        start = stop
+    return chunks
+
+# yields the results of function over tasks in order, keeping at most max_pending tasks
+# submitted to the pool so results (and any task inputs) never pile up in memory
+def imap_bounded(pool, function, tasks, max_pending):
+    pending = []
+    for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= max_pending:
+            yield pending.pop(0).get()
+    for result in pending:
+        yield result.get()
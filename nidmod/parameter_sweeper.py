@@ -7,9 +7,56 @@ Created on Tue Mar 29 10:28:04 2022
 
 import itertools
 import pandas as pd
-from nidmod.datahandling.dataintegration import FeatureSetup, MatchClassifier, NetworkIntegrator
-from nidmod.diffusionmodel.diffusionmodel import InitialisedDiffusionModel
+from nidmod.datahandling.dataintegration import FeatureSetup, MatchClassifier, SourceLinker, NetworkIntegrator
+from nidmod.diffusionmodel.diffusionmodel import InitialisedDiffusionModel, ModelStatuses
+from nidmod.diffusionmodel.compiledmodel import CompiledDiffusionModel
+from nidmod.analyser.trendstore import TrendStore
 from nidmod.analyser.networkanalysis import ResultsAnalyser, MultiResultsAnalyser
+from nidmod.stagecache import StageCache, hash_inputs, graph_fingerprint, frame_fingerprint, contraction_fingerprint
+from nidmod.resultstore import ResultStore
+from nidmod.parallel import get_pool_context
+from nidmod.instrumentation import Instrumentation
+
+# the sweeper used by pool workers, set once per worker process
+_worker_sweeper = None
+
+def _init_sweep_worker(parameter_sweeper):
+    global _worker_sweeper
+    _worker_sweeper = parameter_sweeper
+    # stages are recorded in the worker and sent back, callbacks only run in the main process
+    _worker_sweeper.instrumentation = Instrumentation()
+
+def _integrate_setups(setup_indices):
+    results = []
+    for setup_index in setup_indices:
+        setup = _worker_sweeper.integration_setups[setup_index]
+        _worker_sweeper.instrumentation.clear()
+        with _worker_sweeper.instrumentation.labelled(setup_index):
+            integrated_network = _worker_sweeper.get_integrated_network(setup)
+        # stored networks are loaded from the store by the main process rather than sent back
+        if _worker_sweeper.result_store is not None:
+            integrated_network = None
+        results.append((setup_index, integrated_network, _worker_sweeper.instrumentation.records))
+    return results
+
+# the multi network diffusion used by pool workers, set once per worker process
+_worker_diffusion = None
+
+def _init_diffusion_worker(multi_network_diffusion):
+    global _worker_diffusion
+    _worker_diffusion = multi_network_diffusion
+    _worker_diffusion.instrumentation = Instrumentation()
+
+def _run_graph_diffusion(task):
+    graph_index, simulation_setup, statistics_only = task
+    _worker_diffusion.instrumentation.clear()
+    with _worker_diffusion.instrumentation.labelled(graph_index):
+        result = _worker_diffusion.run_graph(graph_index, simulation_setup, statistics_only)
+    if not statistics_only and _worker_diffusion.result_store is not None:
+        result = None
+    elif not statistics_only:
+        result = result.trends
+    return graph_index, result, _worker_diffusion.instrumentation.records
 
 class CombinationBuilder:
     '''
@@ -36,45 +83,288 @@ class ParameterSweeper:
     Input is a list of integration setups, a list of graphs, and (optionally) a set of training matches
     
     Output is a list of integrated networks
+    
+    Setups are treated as stages (blocking -> features -> fit/predict -> clustering), with each
+    stage result cached under a hash of its inputs so shared stages only run once.
+    cache_size bounds the cache memory in bytes (None for unbounded)
+    
+    Classifiers can be fit on a sample of fit_sample_size features (drawn with fit_seed) and
+    predict in chunks of predict_chunk_size features, with fit models cached by their classifier,
+    features and sampling options
+    
+    With more than two graphs, each graph is linked in turn against a running canonical entity
+    index (see SourceLinker) in a single linkage stage, with one fit model per linked graph
+    
+    Setups can be run over a pool of n_workers processes. The graphs and attribute dataframes
+    are passed to each worker once (copy-on-write where processes can be forked). Setups sharing
+    their blocking, comparison and classifier stages are sent to the same worker, as each worker
+    has its own stage cache
+    
+    Every stage is recorded by the (optional) instrumentation, labelled with its setup index and
+    whether it was cached, and get_timing_table returns the time per stage for each setup
+    
+    With a result_store (a ResultStore or a directory), each integrated network is saved to disk
+    under a hash of the input graphs, setup and linkage parameters as soon as it is computed.
+    Setups already in the store are skipped, so an interrupted sweep can be resumed, and
+    get_integrated_networks returns a list that loads each network from the store when accessed
+    
+    Setups often give identical integrated networks. get_duplicate_groups groups the setups by
+    a fingerprint of their network's contraction mapping and edges, which can be passed to
+    MultiNetworkDiffusion so each unique network is simulated once, and get_duplicate_report
+    lists the setups that collapsed together
     '''
-    def __init__(self, integration_setups, graphs, training_matches = None):
+    def __init__(self, integration_setups, graphs, training_matches = None, cache_size = None,
+                 fit_sample_size = None, predict_chunk_size = None, instrumentation = None,
+                 result_store = None, fit_seed = 0):
         self.integration_setups = integration_setups
         self.graphs = graphs
         self.training_matches = training_matches
+        self.fit_sample_size = fit_sample_size
+        self.fit_seed = fit_seed
+        self.predict_chunk_size = predict_chunk_size
+        self.stage_cache = StageCache(cache_size)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.result_store = ResultStore(result_store) if isinstance(result_store, str) else result_store
+        self._input_fingerprint = None
             
         self.num_graphs = len(graphs)
         graph_attribute_dfs = {}
         for i in range(self.num_graphs):
             graph_attribute_dfs['graph_' + str(i)] = pd.DataFrame.from_dict(dict(graphs[i].nodes(data=True)), orient='index')
         self.graph_attribute_dfs = graph_attribute_dfs
-        
-    def get_integrated_networks(self):
-        integrated_networks = []
-        for setup in self.integration_setups:
-            blocks, compares, classifier_name, clustering_alg = setup
+    
+    # returns a feature setup for the graph attribute dataframes
+    def _get_feature_setup(self, blocks, compares, candidate_links = None):
+        if len(self.graphs) == 1:
+            return FeatureSetup(blocks, compares, self.graph_attribute_dfs['graph_0'],
+                                candidate_links = candidate_links)
+        return FeatureSetup(blocks, compares, self.graph_attribute_dfs['graph_0'],
+                            self.graph_attribute_dfs['graph_1'], candidate_links)
+    
+    # returns the cached result of a stage, computing it if needed, and records the stage
+    # sizes is a function returning a dictionary of sizes from the result
+    def _run_stage(self, name, key, compute, sizes = None):
+        with self.instrumentation.stage(name, cached = key in self.stage_cache) as record:
+            result = self.stage_cache.get_or_compute(key, compute)
+            if sizes is not None:
+                record.update(sizes(result))
+        return result
+    
+    # blocking stage, returns the candidate links for the blocks
+    def get_candidate_links(self, blocks):
+        return self._run_stage('candidate_links', hash_inputs('candidate_links', blocks),
+                               lambda: self._get_feature_setup(blocks, {}).candidate_links,
+                               lambda candidate_links: {'candidate_links': len(candidate_links)})
+    
+    # linkage stage for more than two graphs, returns the source linker once it has linked all graphs
+    def get_source_linker(self, blocks, compares, classifier_name):
+        def compute():
+            source_linker = SourceLinker(blocks, compares, classifier_name, list(self.graph_attribute_dfs.values()),
+                                         self.training_matches, self.fit_sample_size, self.predict_chunk_size,
+                                         model_cache = self.stage_cache, fit_seed = self.fit_seed)
+            source_linker.link_sources()
+            return source_linker
+        return self._run_stage('linkage', hash_inputs('source_linker', blocks, compares, classifier_name), compute,
+                               lambda source_linker: {'candidate_links': 0 if source_linker.features is None
+                                                      else len(source_linker.features),
+                                                      'predicted_matches': 0 if source_linker.matches is None
+                                                      else len(source_linker.matches)})
+    
+    # feature stage, returns the comparison features for the blocks and compares
+    def get_features(self, blocks, compares):
+        def compute():
+            candidate_links = self.get_candidate_links(blocks)
+            return self._get_feature_setup(blocks, compares, candidate_links).calculate_features()
+        return self._run_stage('features', hash_inputs('features', blocks, compares), compute,
+                               lambda features: {'features': len(features)})
+    
+    # fit/predict stage, returns the fit model and predicted matches
+    # the features, fit model and predicted matches of the last setup are kept as attributes
+    def get_predicted_matches(self, blocks, compares, classifier_name):
+        if self.num_graphs > 2:
+            source_linker = self.get_source_linker(blocks, compares, classifier_name)
+            self.features = source_linker.features
+            self.fit_model, self.pred_matches = source_linker.fit_models, source_linker.matches
+            return source_linker.fit_models, source_linker.matches
+        def compute():
+            features = self.get_features(blocks, compares)
+            match_classifier = MatchClassifier(classifier_name, features, self.training_matches,
+                                               sample_size = self.fit_sample_size, seed = self.fit_seed,
+                                               model_cache = self.stage_cache)
+            fit_model = match_classifier.fit_model()
+            return fit_model, match_classifier.predict(features, self.predict_chunk_size)
+        fit_model, pred_matches = self._run_stage('classification',
+                                                  hash_inputs('predicted_matches', blocks, compares, classifier_name),
+                                                  compute, lambda result: {'predicted_matches': len(result[1])})
+        # features are not computed again just to keep them, so are None once evicted from the cache
+        features_key = hash_inputs('features', blocks, compares)
+        self.features = self.stage_cache.get(features_key) if features_key in self.stage_cache else None
+        self.fit_model, self.pred_matches = fit_model, pred_matches
+        return fit_model, pred_matches
+    
+    # returns the key of a setup's integrated network in the result store
+    def get_store_key(self, setup):
+        if self._input_fingerprint is None:
+            training_fingerprint = None if self.training_matches is None else frame_fingerprint(self.training_matches)
+            self._input_fingerprint = hash_inputs([graph_fingerprint(graph, data = True) for graph in self.graphs],
+                                                  training_fingerprint, self.fit_sample_size, self.fit_seed,
+                                                  self.predict_chunk_size)
+        return self.result_store.get_key('integrated_network', self._input_fingerprint, *setup)
+    
+    # returns whether a setup's integrated network is in the result store
+    def is_stored(self, setup):
+        return self.result_store is not None and self.result_store.has_network(self.get_store_key(setup))
+    
+    # clustering stage, returns the integrated network for a full setup
+    def get_integrated_network(self, setup):
+        blocks, compares, classifier_name, clustering_alg = setup
+        def compute():
+            fit_model, pred_matches = self.get_predicted_matches(blocks, compares, classifier_name)
             if len(self.graphs) == 1:
-                feature_setup = FeatureSetup(blocks, compares, self.graph_attribute_dfs['graph_0'])
+                network_integrator = NetworkIntegrator(self.graphs[0], pred_matches)
             else:
-                feature_setup = FeatureSetup(blocks, compares, self.graph_attribute_dfs['graph_0'], self.graph_attribute_dfs['graph_1'])
-            
-            self.features = feature_setup.calculate_features()
-            
-            if self.training_matches is not None:
-                match_classifier = MatchClassifier(classifier_name, self.features, self.training_matches)
+                network_integrator = NetworkIntegrator(self.graphs, pred_matches)
+            return network_integrator.integrate_network(clustering_alg)
+        def sizes(integrated_network):
+            return {'nodes_before': sum(graph.number_of_nodes() for graph in self.graphs),
+                    'edges_before': sum(graph.number_of_edges() for graph in self.graphs),
+                    'nodes_after': integrated_network.number_of_nodes(),
+                    'edges_after': integrated_network.number_of_edges()}
+        if self.result_store is None:
+            return self._run_stage('integration', hash_inputs('integrated_network', *setup), compute, sizes)
+        
+        # stored networks are kept on disk rather than in the stage cache
+        store_key = self.get_store_key(setup)
+        stored = self.result_store.has_network(store_key)
+        with self.instrumentation.stage('integration', cached = stored) as record:
+            if stored:
+                integrated_network = self.result_store.load_network(store_key)
             else:
-                match_classifier = MatchClassifier(classifier_name, self.features)
-                
-            self.fit_model = match_classifier.fit_model()
-            self.pred_matches = self.fit_model.predict(self.features)
-            
-            if len(self.graphs) == 1:
-                network_integrator = NetworkIntegrator(self.graphs[0], self.pred_matches)
+                integrated_network = compute()
+                self.result_store.save_network(store_key, integrated_network)
+            record.update(sizes(integrated_network))
+        return integrated_network
+        
+    # returns lists of the setup indices sharing their blocks, compares and classifier, so the
+    # shared stages of each group are computed by a single worker
+    def group_by_shared_stages(self, setup_indices):
+        groups = {}
+        for setup_index in setup_indices:
+            blocks, compares, classifier_name, clustering_alg = self.integration_setups[setup_index]
+            groups.setdefault(hash_inputs(blocks, compares, classifier_name), []).append(setup_index)
+        return list(groups.values())
+    
+    # yields (setup index, integrated network) pairs as the setups complete
+    def iter_integrated_networks(self, n_workers = None):
+        num_setups = len(self.integration_setups)
+        num_done = 0
+        if n_workers is None or n_workers <= 1:
+            for setup_index, setup in enumerate(self.integration_setups):
+                with self.instrumentation.labelled(setup_index):
+                    integrated_network = self.get_integrated_network(setup)
+                num_done += 1
+                self.instrumentation.progress(num_done, num_setups, setup_index = setup_index)
+                yield setup_index, integrated_network
+            return
+        
+        # setups that are already cached (or stored) are yielded straight away
+        pending_indices = []
+        for setup_index, setup in enumerate(self.integration_setups):
+            if hash_inputs('integrated_network', *setup) in self.stage_cache or self.is_stored(setup):
+                with self.instrumentation.labelled(setup_index):
+                    integrated_network = self.get_integrated_network(setup)
+                num_done += 1
+                self.instrumentation.progress(num_done, num_setups, setup_index = setup_index)
+                yield setup_index, integrated_network
             else:
-                network_integrator = NetworkIntegrator(self.graphs, self.pred_matches)
+                pending_indices.append(setup_index)
+        if len(pending_indices) == 0:
+            return
+        
+        context = get_pool_context()
+        with context.Pool(processes = n_workers, initializer = _init_sweep_worker,
+                          initargs = (self,)) as pool:
+            for results in pool.imap_unordered(_integrate_setups, self.group_by_shared_stages(pending_indices)):
+                for setup_index, integrated_network, records in results:
+                    setup = self.integration_setups[setup_index]
+                    if self.result_store is not None:
+                        integrated_network = self.result_store.load_network(self.get_store_key(setup))
+                    else:
+                        self.stage_cache.put(hash_inputs('integrated_network', *setup), integrated_network)
+                    self.instrumentation.add_records(records)
+                    num_done += 1
+                    self.instrumentation.progress(num_done, num_setups, setup_index = setup_index)
+                    yield setup_index, integrated_network
+        
+    # computes and stores the setups missing from the result store
+    def store_integrated_networks(self, n_workers = None):
+        pending_indices = [setup_index for setup_index, setup in enumerate(self.integration_setups)
+                           if not self.is_stored(setup)]
+        num_setups = len(self.integration_setups)
+        num_done = num_setups - len(pending_indices)
+        if n_workers is None or n_workers <= 1 or len(pending_indices) == 0:
+            for setup_index in pending_indices:
+                with self.instrumentation.labelled(setup_index):
+                    self.get_integrated_network(self.integration_setups[setup_index])
+                num_done += 1
+                self.instrumentation.progress(num_done, num_setups, setup_index = setup_index)
+            return
+        
+        context = get_pool_context()
+        with context.Pool(processes = n_workers, initializer = _init_sweep_worker,
+                          initargs = (self,)) as pool:
+            for results in pool.imap_unordered(_integrate_setups, self.group_by_shared_stages(pending_indices)):
+                for setup_index, integrated_network, records in results:
+                    self.instrumentation.add_records(records)
+                    num_done += 1
+                    self.instrumentation.progress(num_done, num_setups, setup_index = setup_index)
+        
+    def get_integrated_networks(self, n_workers = None):
+        if self.result_store is not None:
+            self.store_integrated_networks(n_workers)
+            return self.result_store.get_lazy_networks([self.get_store_key(setup) for setup in self.integration_setups])
+        
+        if n_workers is not None and n_workers > 1:
+            integrated_networks = [None] * len(self.integration_setups)
+            for setup_index, integrated_network in self.iter_integrated_networks(n_workers):
+                integrated_networks[setup_index] = integrated_network
+            return integrated_networks
+        
+        return [integrated_network for setup_index, integrated_network in self.iter_integrated_networks()]
     
-            integrated_networks.append(network_integrator.integrate_network(clustering_alg))
-            
-        return integrated_networks
+    # returns the contraction fingerprint of each setup's integrated network
+    def get_network_fingerprints(self, integrated_networks = None, n_workers = None):
+        if integrated_networks is None:
+            integrated_networks = self.get_integrated_networks(n_workers)
+        return [contraction_fingerprint(integrated_network) for integrated_network in integrated_networks]
+    
+    # returns lists of the indices of setups with identical integrated networks, ordered by their first setup
+    def get_duplicate_groups(self, integrated_networks = None, n_workers = None):
+        duplicate_groups = {}
+        for setup_index, fingerprint in enumerate(self.get_network_fingerprints(integrated_networks, n_workers)):
+            duplicate_groups.setdefault(fingerprint, []).append(setup_index)
+        return list(duplicate_groups.values())
+    
+    # returns a dataframe with a row for each unique integrated network (indexed by its first setup),
+    # listing the setups that give it
+    def get_duplicate_report(self, integrated_networks = None, n_workers = None):
+        if integrated_networks is None:
+            integrated_networks = self.get_integrated_networks(n_workers)
+        duplicate_groups = self.get_duplicate_groups(integrated_networks)
+        report = pd.DataFrame({'setups': duplicate_groups,
+                               'num_setups': [len(setup_indices) for setup_indices in duplicate_groups],
+                               'clustering_algs': [sorted(set(self.integration_setups[setup_index][3]
+                                                              for setup_index in setup_indices))
+                                                   for setup_indices in duplicate_groups]},
+                              index = pd.Index([setup_indices[0] for setup_indices in duplicate_groups], name = 'network'))
+        first_networks = [integrated_networks[setup_index] for setup_index in report.index]
+        report['nodes'] = [integrated_network.number_of_nodes() for integrated_network in first_networks]
+        report['edges'] = [integrated_network.number_of_edges() for integrated_network in first_networks]
+        return report
+    
+    # returns a dataframe of the time spent in each stage per setup
+    def get_timing_table(self):
+        return self.instrumentation.get_timing_table()
     
 class MultiNetworkDiffusion:
     '''
@@ -83,32 +373,213 @@ class MultiNetworkDiffusion:
     Input is a set of graphs and a custom diffusion model
     
     Output is a MultiResultsAnalyser object
+    
+    Models are initialised when each graph is first simulated. By default they are kept for
+    later runs, and with lazy = True they are initialised again for every run instead of being
+    held in memory. Graphs can also be simulated over a pool of n_workers processes, with models
+    initialised inside the workers (and never in the parent process) and results streamed back
+    as each graph completes. graph_assc_diff_models initialises and returns every graph's model
+    
+    Initialisation, simulation and analysis of each graph are recorded by the (optional)
+    instrumentation, labelled with the graph index, and get_timing_table returns the time per
+    stage for each graph
+    
+    With a result_store (a ResultStore or a directory), the trends of each graph are saved to
+    disk under a hash of the graph, model definition, backend and simulation setup. Stored
+    trends are not simulated again, and are memory-mapped from the store by the analysers
+    
+    Every graph is simulated separately by default. With deduplicate = True, graphs are grouped
+    by their contraction fingerprint (see ParameterSweeper.get_duplicate_groups, whose groups
+    can also be given as deduplicate) and only the first graph of each group is initialised and
+    simulated. Its results are given to every graph in the group, sharing one results analyser,
+    so identical graphs get identical results rather than independent simulations
     '''
-    def __init__(self, graphs, custom_diffusion_model):
+    def __init__(self, graphs, custom_diffusion_model, backend = 'ndlib', lazy = False,
+                 instrumentation = None, result_store = None, deduplicate = False):
         self.graphs = graphs
         self.custom_diffusion_model = custom_diffusion_model
+        self.backend = backend
+        self.lazy = lazy
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.result_store = ResultStore(result_store) if isinstance(result_store, str) else result_store
+        self._graph_fingerprints = {}
         
-        graph_assc_diff_models = []
-        for graph in graphs:
-            initialised_diffusion_model = InitialisedDiffusionModel(graph, custom_diffusion_model)
-            graph_assc_diff_models.append(initialised_diffusion_model)
-            
-        self.graph_assc_diff_models = graph_assc_diff_models
+        if deduplicate is True:
+            duplicate_groups = {}
+            for graph_index, graph in enumerate(graphs):
+                duplicate_groups.setdefault(contraction_fingerprint(graph), []).append(graph_index)
+            self.duplicate_groups = list(duplicate_groups.values())
+        elif deduplicate:
+            self.duplicate_groups = [list(graph_indices) for graph_indices in deduplicate]
+        else:
+            self.duplicate_groups = [[graph_index] for graph_index in range(len(graphs))]
         
-    def run_diffusion_model(self, simulation_setup):
-        graph_assc_trends = []
-        for model in self.graph_assc_diff_models:
-            trends = model.run_diffusion_model(simulation_setup)
-            graph_assc_trends.append(trends)
-            
-        graph_assc_results_analysers = []
-        for i in range(len(self.graphs)):
-            results_analyser = ResultsAnalyser(self.graph_assc_diff_models[i].model, self.graphs[i],
-                                           graph_assc_trends[i])
-            graph_assc_results_analysers.append(results_analyser)
+        self._group_first_indices = dict((graph_index, graph_indices[0]) for graph_indices in self.duplicate_groups
+                                         for graph_index in graph_indices)
+        self._diffusion_models = {}
+    
+    def _initialise_model(self, graph):
+        with self.instrumentation.stage('initialisation', nodes = graph.number_of_nodes(),
+                                        edges = graph.number_of_edges()):
+            return InitialisedDiffusionModel(graph, self.custom_diffusion_model, self.backend)
+    
+    # returns the initialised diffusion model of the indexed graph, initialising it if it is not kept
+    # graphs in a duplicate group share the model of the group's first graph
+    def get_diffusion_model(self, graph_index):
+        first_index = self._group_first_indices[graph_index]
+        if self.lazy:
+            return self._initialise_model(self.graphs[first_index])
+        if first_index not in self._diffusion_models:
+            with self.instrumentation.labelled(first_index):
+                self._diffusion_models[first_index] = self._initialise_model(self.graphs[first_index])
+        return self._diffusion_models[first_index]
+    
+    @property
+    def graph_assc_diff_models(self):
+        return [self.get_diffusion_model(graph_index) for graph_index in range(len(self.graphs))]
+    
+    # returns the key of the indexed graph's trends in the result store
+    def get_store_key(self, graph_index, simulation_setup):
+        if graph_index not in self._graph_fingerprints:
+            self._graph_fingerprints[graph_index] = graph_fingerprint(self.graphs[graph_index])
+        custom_diffusion_model = self.custom_diffusion_model
+        return self.result_store.get_key('trends', self._graph_fingerprints[graph_index],
+                                         custom_diffusion_model.statuses, custom_diffusion_model.compartments,
+                                         custom_diffusion_model.transition_rules, custom_diffusion_model.parameters,
+                                         self.backend, simulation_setup)
+    
+    # simulates the indexed graph, returning its results analyser or (if statistics_only) its average statistics
+    def run_graph(self, graph_index, simulation_setup, statistics_only = False):
+        graph = self.graphs[graph_index]
+        store_key = None if self.result_store is None else self.get_store_key(graph_index, simulation_setup)
+        stored = store_key is not None and self.result_store.has_trends(store_key)
+        # stored trends are not simulated again, so their model is never initialised
+        if stored:
+            analyser_model = ModelStatuses(graph, self.custom_diffusion_model)
+        else:
+            model = self.get_diffusion_model(graph_index)
+            analyser_model = model.model
+        with self.instrumentation.stage('simulation', executions = simulation_setup[0],
+                                        iterations = simulation_setup[1], cached = stored):
+            if store_key is None:
+                trends = model.run_diffusion_model(simulation_setup)
+            else:
+                if not stored:
+                    self.result_store.save_trends(store_key, model.run_diffusion_model(simulation_setup),
+                                                  analyser_model.available_statuses, graph.number_of_nodes())
+                trends = self.result_store.load_trends(store_key)
+        with self.instrumentation.stage('analysis'):
+            results_analyser = ResultsAnalyser(analyser_model, graph, trends)
+            if statistics_only:
+                return results_analyser.get_average_statistics()
+        return results_analyser
+    
+    # yields (graph index, results analyser) or (graph index, average statistics) pairs as graphs complete
+    # only the first graph of each duplicate group is simulated, and its result is yielded for the whole group
+    def _iter_graph_results(self, simulation_setup, n_workers, statistics_only):
+        num_unique = len(self.duplicate_groups)
+        duplicate_group = dict((graph_indices[0], graph_indices) for graph_indices in self.duplicate_groups)
+        if n_workers is None or n_workers <= 1:
+            for num_done, graph_indices in enumerate(self.duplicate_groups):
+                with self.instrumentation.labelled(graph_indices[0]):
+                    result = self.run_graph(graph_indices[0], simulation_setup, statistics_only)
+                self.instrumentation.progress(num_done + 1, num_unique, graph_index = graph_indices[0])
+                for graph_index in graph_indices:
+                    yield graph_index, result
+            return
+        
+        context = get_pool_context()
+        available_statuses = self.custom_diffusion_model.get_available_statuses()
+        tasks = [(graph_indices[0], simulation_setup, statistics_only) for graph_indices in self.duplicate_groups]
+        with context.Pool(processes = n_workers, initializer = _init_diffusion_worker,
+                          initargs = (self,)) as pool:
+            for num_done, (graph_index, result, records) in enumerate(pool.imap_unordered(_run_graph_diffusion, tasks)):
+                self.instrumentation.add_records(records)
+                self.instrumentation.progress(num_done + 1, num_unique, graph_index = graph_index)
+                if not statistics_only:
+                    if result is None:
+                        result = self.result_store.load_trends(self.get_store_key(graph_index, simulation_setup))
+                    # models stay in the workers, so the analyser only gets the model's status codes
+                    model = ModelStatuses(self.graphs[graph_index], self.custom_diffusion_model, available_statuses)
+                    result = ResultsAnalyser(model, self.graphs[graph_index], result)
+                for duplicate_index in duplicate_group[graph_index]:
+                    yield duplicate_index, result
+    
+    # yields (graph index, results analyser) pairs as each graph's simulations complete
+    def iter_results_analysers(self, simulation_setup, n_workers = None):
+        return self._iter_graph_results(simulation_setup, n_workers, False)
+    
+    # yields (graph index, average statistics) pairs, discarding the trends as each graph completes
+    def iter_average_statistics(self, simulation_setup, n_workers = None):
+        return self._iter_graph_results(simulation_setup, n_workers, True)
+    
+    # returns a dataframe of average trend statistics for all graphs without keeping the trends
+    def get_average_stat_comparison(self, simulation_setup, n_workers = None):
+        graph_stats = dict(self.iter_average_statistics(simulation_setup, n_workers))
+        indices = sorted(graph_stats)
+        return pd.DataFrame([graph_stats[idx] for idx in indices], index = indices)
+        
+    def run_diffusion_model(self, simulation_setup, n_workers = None):
+        graph_assc_results_analysers = [None] * len(self.graphs)
+        for graph_index, results_analyser in self.iter_results_analysers(simulation_setup, n_workers):
+            graph_assc_results_analysers[graph_index] = results_analyser
             
         return MultiResultsAnalyser(graph_assc_results_analysers)
-            
+    
+    # returns a dataframe of the time spent in each stage per graph
+    def get_timing_table(self):
+        return self.instrumentation.get_timing_table()
+
+class ParameterGridDiffusion:
+    '''
+    Class for running a custom diffusion model over a grid of parameter values on one graph
+    
+    Inputs are a graph, a function returning a custom diffusion model (e.g. CustomDiffusionModel.SIR)
+    and a dictionary mapping its argument names to lists of values, e.g. {'beta': [...], 'gamma': [...],
+    'fraction_infected': [0.05]}, with every combination of values being a grid point
+    
+    Output is a dataframe of average trend statistics indexed by the grid point values
+    
+    The graph is compiled once and all grid points are simulated together, with the parameter
+    values as an extra dimension of the state array. Grid points use common random numbers: each
+    run starts from the same infected nodes (for the same number infected) and uses the same random
+    draws at every grid point, so differences between grid points come from the parameters rather
+    than sampling noise. Each grid point gives the same trends as the batched backend with the same
+    seed. The models need the same statuses and transition rules, and compartments supported by
+    the compiled model
+    
+    Compilation and simulation are recorded by the (optional) instrumentation
+    '''
+    def __init__(self, graph, model_function, parameter_grid, instrumentation = None):
+        self.graph = graph
+        self.parameter_names = list(parameter_grid)
+        self.grid_points = list(itertools.product(*parameter_grid.values()))
+        self.custom_diffusion_models = [model_function(**dict(zip(self.parameter_names, grid_point)))
+                                        for grid_point in self.grid_points]
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
         
-            
-    
\ No newline at end of file
+        with self.instrumentation.stage('initialisation', nodes = graph.number_of_nodes(),
+                                        edges = graph.number_of_edges(), grid_points = len(self.grid_points)):
+            self.compiled_model = CompiledDiffusionModel(graph, self.custom_diffusion_models[0])
+            self.grid_rules, self.num_initial_infected = self.compiled_model.compile_grid(self.custom_diffusion_models)
+    
+    # returns the index of grid point values
+    def get_grid_index(self):
+        return pd.MultiIndex.from_tuples(self.grid_points, names = self.parameter_names)
+    
+    # simulates every grid point, returning a list with a TrendStore of the runs of each grid point
+    # the simulation setup takes the same parameters as multi_runs, and batch_size bounds memory use
+    def run_grid(self, simulation_setup, batch_size = None):
+        with self.instrumentation.stage('simulation', executions = simulation_setup[0], iterations = simulation_setup[1],
+                                        grid_points = len(self.grid_points)):
+            node_counts = self.compiled_model.grid_runs(self.grid_rules, self.num_initial_infected, *simulation_setup,
+                                                        batch_size = batch_size)
+        statuses = dict((code, status) for status, code in self.compiled_model.available_statuses.items())
+        return [TrendStore(node_counts[j], statuses, self.compiled_model.num_nodes) for j in range(len(self.grid_points))]
+    
+    # returns a dataframe of average trend statistics for every grid point
+    def get_average_stat_comparison(self, simulation_setup, batch_size = None):
+        trend_stores = self.run_grid(simulation_setup, batch_size)
+        with self.instrumentation.stage('analysis'):
+            return pd.DataFrame([trend_store.get_average_statistics() for trend_store in trend_stores],
+                                index = self.get_grid_index())
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:02:26 2026
+
+@author: jnevin
+"""
+
+import json
+import os
+import uuid
+import networkx as nx
+import numpy as np
+import pandas as pd
+from nidmod.analyser.trendstore import TrendStore
+from nidmod.stagecache import hash_inputs
+
+# returns a table of attribute dictionaries, recording which attributes were missing in the
+# table's attrs (as opposed to being present with a missing value such as NaN)
+def _attribute_table(records, index):
+    table = pd.DataFrame(records, index = index, dtype = object)
+    columns = list(table.columns)
+    table.attrs['missing'] = [(int(row), int(column)) for row, column in np.argwhere(table.isna().values)
+                              if columns[column] not in records[row]]
+    return table
+
+# returns the attribute dictionaries of a table made by _attribute_table
+def _attribute_records(table):
+    if len(table.columns) == 0:
+        return [{} for row in range(len(table))]
+    records = [dict(zip(table.columns, values)) for values in table.itertuples(index = False, name = None)]
+    for row, column in table.attrs.get('missing', []):
+        del records[row][table.columns[column]]
+    return records
+
+class LazyResultList:
+    '''
+    Class for a read-only list of stored results, loaded from the store each time they are accessed
+    '''
+    def __init__(self, load, keys):
+        self.load = load
+        self.keys = list(keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyResultList(self.load, self.keys[index])
+        return self.load(self.keys[index])
+
+    def __iter__(self):
+        for key in self.keys:
+            yield self.load(key)
+
+class ResultStore:
+    '''
+    Class for storing integrated networks and diffusion trends on disk
+
+    Input is the directory of the store, which is created if needed
+
+    Results are stored under keys, e.g. from get_key, a hash of the inputs that produced them.
+    Networks are stored as a binary edge list of node indices (.npy) with tables of the node and
+    edge attributes (.pkl), and trends as TrendStore arrays (.npy). Each result's metadata file
+    (.json) is written last, and a result only counts as stored once its metadata exists, so a
+    run that stops part way can be resumed by skipping the stored keys
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        for kind in ['networks', 'trends']:
+            os.makedirs(os.path.join(directory, kind), exist_ok = True)
+
+    # returns a key identifying the given (json-like) inputs
+    def get_key(self, *inputs):
+        return hash_inputs(*inputs)
+
+    def _path(self, kind, key, suffix = ''):
+        return os.path.join(self.directory, kind, key + suffix)
+
+    # writes a file through a temporary file, so it is either complete or missing
+    def _write(self, path, write):
+        temporary_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        write(temporary_path)
+        os.replace(temporary_path, path)
+
+    def has_network(self, key):
+        return os.path.exists(self._path('networks', key, '.json'))
+
+    def has_trends(self, key):
+        return os.path.exists(self._path('trends', key, '.json'))
+
+    def __contains__(self, key):
+        return self.has_network(key) or self.has_trends(key)
+
+    # returns the keys of all stored results of a kind ('networks' or 'trends')
+    def keys(self, kind = 'networks'):
+        return sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.directory, kind))
+                      if name.endswith('.json'))
+
+    # stores a graph as an edge list of node indices plus node and edge attribute tables
+    def save_network(self, key, graph):
+        nodes = list(graph.nodes())
+        node_index = dict(zip(nodes, range(len(nodes))))
+        if graph.is_multigraph():
+            edges = list(graph.edges(keys = True, data = True))
+            edge_keys = [edge_key for u, v, edge_key, edge_data in edges]
+            edge_data = [edge_data for u, v, edge_key, edge_data in edges]
+        else:
+            edges = list(graph.edges(data = True))
+            edge_keys = None
+            edge_data = [edge_data for u, v, edge_data in edges]
+        edge_array = np.array([(node_index[edge[0]], node_index[edge[1]]) for edge in edges],
+                              dtype = np.min_scalar_type(max(len(nodes), 1))).reshape(-1, 2)
+
+        # object columns keep the attribute values as they are (e.g. integers with missing values)
+        node_table = _attribute_table([node_data for node, node_data in graph.nodes(data = True)],
+                                      pd.Index(nodes, dtype = object, tupleize_cols = False))
+        node_table.attrs['graph'] = dict(graph.graph)
+        has_edge_data = graph.is_multigraph() or any(len(data) > 0 for data in edge_data)
+
+        def save_edges(path):
+            with open(path, 'wb') as edges_file:
+                np.save(edges_file, edge_array)
+        self._write(self._path('networks', key, '.edges.npy'), save_edges)
+        self._write(self._path('networks', key, '.nodes.pkl'), node_table.to_pickle)
+        if has_edge_data:
+            edge_table = _attribute_table(edge_data, range(len(edge_data)))
+            edge_table.attrs['edge_keys'] = edge_keys
+            self._write(self._path('networks', key, '.edge_data.pkl'), edge_table.to_pickle)
+
+        metadata = {'directed': graph.is_directed(), 'multigraph': graph.is_multigraph(),
+                    'num_nodes': len(nodes), 'num_edges': len(edges), 'edge_data': has_edge_data}
+        def save_metadata(path):
+            with open(path, 'w') as metadata_file:
+                json.dump(metadata, metadata_file)
+        self._write(self._path('networks', key, '.json'), save_metadata)
+
+    # loads a stored graph
+    def load_network(self, key):
+        with open(self._path('networks', key, '.json')) as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata['multigraph']:
+            graph = nx.MultiDiGraph() if metadata['directed'] else nx.MultiGraph()
+        else:
+            graph = nx.DiGraph() if metadata['directed'] else nx.Graph()
+
+        node_table = pd.read_pickle(self._path('networks', key, '.nodes.pkl'))
+        graph.graph.update(node_table.attrs.get('graph', {}))
+        graph.add_nodes_from(zip(node_table.index, _attribute_records(node_table)))
+
+        nodes = list(node_table.index)
+        edge_array = np.load(self._path('networks', key, '.edges.npy')).tolist()
+        if metadata['edge_data']:
+            edge_table = pd.read_pickle(self._path('networks', key, '.edge_data.pkl'))
+            edge_keys = edge_table.attrs.get('edge_keys')
+            edge_data = _attribute_records(edge_table)
+        else:
+            edge_keys = None
+            edge_data = ({} for edge in edge_array)
+        if metadata['multigraph']:
+            graph.add_edges_from((nodes[u], nodes[v], edge_key, data) for (u, v), edge_key, data
+                                 in zip(edge_array, edge_keys, edge_data))
+        else:
+            graph.add_edges_from((nodes[u], nodes[v], data) for (u, v), data in zip(edge_array, edge_data))
+        return graph
+
+    # stores trends (in ndlib's format or as a TrendStore)
+    def save_trends(self, key, trends, available_statuses = None, num_nodes = None):
+        if not isinstance(trends, TrendStore):
+            trends = TrendStore.from_trends(trends, available_statuses, num_nodes)
+        temporary_name = self._path('trends', key, '.' + uuid.uuid4().hex + '.tmp')
+        trends.save(temporary_name)
+        os.replace(temporary_name + '.npy', self._path('trends', key, '.npy'))
+        os.replace(temporary_name + '.json', self._path('trends', key, '.json'))
+
+    # loads stored trends as a TrendStore, memory-mapping the counts unless mmap_mode is None
+    def load_trends(self, key, mmap_mode = 'r'):
+        return TrendStore.load(self._path('trends', key), mmap_mode)
+
+    # returns a list of stored networks that are only loaded when accessed
+    def get_lazy_networks(self, keys):
+        return LazyResultList(self.load_network, keys)
+
+    # removes a stored result
+    def remove(self, key):
+        for kind in ['networks', 'trends']:
+            for name in os.listdir(os.path.join(self.directory, kind)):
+                if name.startswith(key + '.'):
+                    os.remove(os.path.join(self.directory, kind, name))
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:24:05 2026
+
+@author: jnevin
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+# returns a hex digest identifying the given (json-like) stage inputs
+def hash_inputs(*inputs):
+    serialised = json.dumps(inputs, sort_keys = True, default = repr)
+    return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+# returns a hex digest identifying the structure (nodes and edges) of a graph, and also
+# the graph, node and edge attributes if data is True
+def graph_fingerprint(graph, data = False):
+    if data:
+        def describe(item, item_data):
+            return repr((item, sorted(item_data.items(), key = repr)))
+    else:
+        def describe(item, item_data):
+            return repr(item)
+    if graph.is_directed():
+        edges = sorted(describe((u, v), edge_data) for u, v, edge_data in graph.edges(data = True))
+    else:
+        edges = sorted(describe(tuple(sorted((u, v), key = repr)), edge_data)
+                       for u, v, edge_data in graph.edges(data = True))
+    nodes = sorted(describe(node, node_data) for node, node_data in graph.nodes(data = True))
+    if data:
+        return hash_inputs(graph.is_directed(), graph.is_multigraph(), nodes, edges,
+                           repr(sorted(graph.graph.items(), key = repr)))
+    return hash_inputs(graph.is_directed(), graph.is_multigraph(), nodes, edges)
+
+# returns a hex digest identifying an integrated graph by its contraction mapping (the nodes
+# merged into each node) and its structure, so graphs integrated from the same communities share it
+def contraction_fingerprint(graph):
+    contraction_mapping = sorted((repr(node), sorted(repr(merged_node) for merged_node in merged_nodes))
+                                 for node, merged_nodes in graph.nodes(data = 'contraction')
+                                 if merged_nodes is not None)
+    return hash_inputs(graph_fingerprint(graph), contraction_mapping)
+
+# returns a hex digest identifying the contents (index and values) of a pandas object
+def frame_fingerprint(frame):
+    hashes = pd.util.hash_pandas_object(frame, index = True).values
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+# returns an estimate of the memory used by a stage result, in bytes
+def estimate_size(value):
+    if hasattr(value, 'memory_usage'):
+        return int(np.sum(value.memory_usage(deep = True)))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return len(pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL))
+
+class StageCache:
+    '''
+    Class for caching the results of pipeline stages under a hash of their inputs
+
+    Inputs are an (optional) memory bound in bytes and an (optional) bound on the number of
+    results, None meaning unbounded
+
+    Least recently used results are evicted once a bound is exceeded, and results larger
+    than the memory bound are never stored
+    '''
+    def __init__(self, max_bytes = None, max_entries = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns the cached result for the key, raising KeyError if it is not cached
+    def get(self, key):
+        value, size = self.entries[key]
+        self.entries.move_to_end(key)
+        return value
+
+    # stores a result, evicting the least recently used results if over the bound
+    def put(self, key, value):
+        size = estimate_size(value) if self.max_bytes is not None else 0
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.current_bytes += size
+        while (self.max_bytes is not None and self.current_bytes > self.max_bytes) or \
+                (self.max_entries is not None and len(self.entries) > self.max_entries):
+            evicted_key, (evicted_value, evicted_size) = self.entries.popitem(last = False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    # returns the cached result for the key, computing and storing it if needed
+    def get_or_compute(self, key, compute):
+        if key in self.entries:
+            self.hits += 1
+            return self.get(key)
+        self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    # removes all cached results
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    # returns a dictionary of cache usage statistics
+    def get_statistics(self):
+        return {'entries': len(self.entries), 'bytes': self.current_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:21:07 2026
+
+@author: jnevin
+"""
+
+import pytest
+from nidmod.benchmarking.benchmarks import scaling_benchmark, get_scaling_curves, get_scaling_exponents
+
+def test_linear_stages_have_non_negative_exponents():
+    pytest.importorskip('ndlib')
+    records = scaling_benchmark([200, 400, 800], benchmark_options = {'backend': 'batched',
+                                                                      'simulation_parameters': (4, 20)})
+    exponents = get_scaling_exponents(get_scaling_curves(records))
+    
+    # initialisation pays for importing ndlib the first time it runs, unless warmed up
+    assert exponents['initialisation'] >= 0
+    assert exponents['integration'] >= 0
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:41 2026
+
+@author: jnevin
+"""
+
+import random
+import networkx as nx
+import pytest
+from nidmod.datahandling import clustering_algorithms
+
+# the contraction used before _contract_communities, one copy of the graph per merged node
+def contract_by_copying(graph, communities):
+    adj_graph = graph.copy()
+    for community in communities:
+        for node in community[1:]:
+            if node in adj_graph.nodes() and community[0] in adj_graph.nodes():
+                adj_graph = nx.contracted_nodes(adj_graph, community[0], node, self_loops = False)
+    return adj_graph
+
+def random_graph(seed, directed = False):
+    rng = random.Random(seed)
+    graph = nx.gnp_random_graph(40, 0.15, seed = seed, directed = directed)
+    for node in graph:
+        graph.nodes[node]['name'] = 'node' + str(node)
+    for u, v in graph.edges():
+        graph.edges[u, v]['weight'] = rng.random()
+    for node in rng.sample(list(graph), 3):
+        graph.add_edge(node, node, weight = rng.random())
+    return graph
+
+def random_communities(seed, nodes):
+    rng = random.Random(seed)
+    nodes = list(nodes) + ['missing']
+    rng.shuffle(nodes)
+    communities = []
+    while len(nodes) > 0:
+        size = rng.randint(1, 6)
+        communities.append(nodes[:size])
+        nodes = nodes[size:]
+    return communities
+
+def edge_data(graph):
+    if graph.is_directed():
+        return dict(((u, v), data) for u, v, data in graph.edges(data = True))
+    return dict((frozenset((u, v)), data) for u, v, data in graph.edges(data = True))
+
+def partition(graph):
+    return set(frozenset([node] + list(data.get('contraction', {}))) for node, data in graph.nodes(data = True))
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_contract_communities_matches_contracted_nodes(directed):
+    for seed in range(100):
+        graph = random_graph(seed, directed)
+        communities = random_communities(seed, graph)
+        expected = contract_by_copying(graph, communities)
+        contracted = clustering_algorithms._contract_communities(graph, communities)
+        
+        assert dict(contracted.nodes(data = True)) == dict(expected.nodes(data = True))
+        assert edge_data(contracted) == edge_data(expected)
+        assert partition(contracted) == partition(expected)
+        assert graph.number_of_nodes() == 40
+
+# the walktrap integration before trivial components were shortcut, contracting by copying,
+# with the nodes (and so the representatives) of each component in repr order
+def walktrap_by_copying(graph, matches):
+    import numpy as np
+    from cdlib import algorithms
+    
+    match_graph = nx.Graph()
+    match_graph.add_edges_from(list(matches))
+    S_com = []
+    for component in nx.connected_components(match_graph):
+        node_names = sorted(component, key = repr)
+        rename = dict(zip((node_names), np.arange(len(node_names))))
+        rev_rename = { v:k for k,v in rename.items()}
+        s_subgraph = nx.Graph()
+        s_subgraph.add_nodes_from(rename.values())
+        s_subgraph.add_edges_from(sorted(tuple(sorted((rename[u], rename[v]))) for u, v in match_graph.edges(component)))
+        for community in algorithms.walktrap(s_subgraph).communities:
+            S_com.append([rev_rename.get(item,item) for item in sorted(community)])
+    return contract_by_copying(graph, S_com)
+
+def random_matches(seed, nodes):
+    rng = random.Random(seed)
+    nodes = list(nodes)
+    matches = []
+    for component in random_communities(seed, nodes):
+        component = [node for node in component if node != 'missing']
+        for i in range(1, len(component)):
+            matches.append((component[i], component[rng.randrange(i)]))
+        if len(component) > 3:
+            matches.extend((rng.choice(component), rng.choice(component)) for j in range(2))
+    matches.extend((rng.choice(nodes), rng.choice(nodes)) for j in range(5))
+    return matches
+
+def test_walktrap_integration_matches_previous_integration():
+    pytest.importorskip('cdlib')
+    for seed in range(50):
+        graph = random_graph(seed)
+        matches = random_matches(seed, graph)
+        expected = walktrap_by_copying(graph, matches)
+        integrated = clustering_algorithms.walktrap_integration(graph, matches)
+        
+        assert dict(integrated.nodes(data = True)) == dict(expected.nodes(data = True))
+        assert edge_data(integrated) == edge_data(expected)
+
+@pytest.mark.parametrize('clustering_alg', ['connected_components_integration', 'center_integration',
+                                            'merge_center_integration'])
+def test_integration_matches_contracted_communities(clustering_alg):
+    community_alg = clustering_algorithms.COMMUNITY_ALGORITHMS[clustering_alg]
+    for seed in range(50):
+        graph = random_graph(seed)
+        matches = random_matches(seed, graph)
+        expected = contract_by_copying(graph, community_alg(matches))
+        integrated = getattr(clustering_algorithms, clustering_alg)(graph, matches)
+        
+        assert dict(integrated.nodes(data = True)) == dict(expected.nodes(data = True))
+        assert edge_data(integrated) == edge_data(expected)
+
+def community_map(communities):
+    return dict((community[0], frozenset(community)) for community in communities)
+
+@pytest.mark.parametrize('community_alg', [clustering_algorithms.center_communities,
+                                           clustering_algorithms.merge_center_communities])
+def test_center_communities_do_not_depend_on_match_order(community_alg):
+    for seed in range(20):
+        rng = random.Random(seed)
+        matches = random_matches(seed, range(40))
+        expected = community_map(community_alg(matches))
+        for repeat in range(3):
+            shuffled = [match if rng.random() < 0.5 else match[::-1] for match in rng.sample(matches, len(matches))]
+            assert community_map(community_alg(shuffled)) == expected
+
+@pytest.mark.parametrize('clustering_alg', ['connected_components_integration', 'center_integration',
+                                            'merge_center_integration', 'walktrap_integration'])
+@pytest.mark.parametrize('num_graphs', [1, 2])
+def test_update_matches_full_integration(clustering_alg, num_graphs):
+    from nidmod.datahandling.dataintegration import NetworkIntegrator
+    if clustering_alg == 'walktrap_integration':
+        pytest.importorskip('cdlib')
+    
+    for seed in range(20):
+        rng = random.Random(seed)
+        graphs = [random_graph(seed)]
+        if num_graphs == 2:
+            graphs.append(nx.relabel_nodes(random_graph(seed + 100), lambda node: 'b' + str(node)))
+            old_nodes = list(range(30)) + ['b' + str(node) for node in range(30)]
+        else:
+            old_nodes = list(range(30))
+        network = graphs if num_graphs == 2 else graphs[0]
+        matches = random_matches(seed, old_nodes)
+        integrator = NetworkIntegrator(network, matches)
+        integrator.integrate_network(clustering_alg)
+        state = integrator.get_state()
+        
+        # nodes 30 to 39 of the first graph gain matches, which are found afterwards
+        new_nodes = list(range(30, 40))
+        new_matches = [(node, rng.choice(old_nodes)) for node in new_nodes for j in range(rng.randint(0, 2))]
+        updated = NetworkIntegrator(network, new_matches).update_network(state, new_nodes)
+        
+        # the full integration sees the matches in another order
+        all_matches = [match[::-1] for match in matches + new_matches]
+        rng.shuffle(all_matches)
+        full = NetworkIntegrator(network, all_matches).integrate_network(clustering_alg)
+        
+        assert dict(updated.nodes(data = True)) == dict(full.nodes(data = True))
+        assert set(map(frozenset, updated.edges())) == set(map(frozenset, full.edges()))
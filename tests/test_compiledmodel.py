@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:32:50 2026
+
+@author: jnevin
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel
+from nidmod.diffusionmodel.reducers import PeakReducer, FinalReducer, MeanVarianceReducer
+
+@pytest.mark.parametrize('backend', ['compiled', 'batched'])
+@pytest.mark.parametrize('early_stopping', [False, True])
+def test_reduced_runs_match_materialised_runs(backend, early_stopping):
+    pytest.importorskip('ndlib')
+    graph = nx.gnp_random_graph(100, 0.05, seed = 3)
+    initialised_model = InitialisedDiffusionModel(graph, CustomDiffusionModel.SIR(0.1, 0.05, 0.05), backend)
+    parameters = [12, 40, None, None, 11]
+    
+    trends = initialised_model.run_diffusion_model(parameters, early_stopping = early_stopping)
+    reducers = initialised_model.run_diffusion_model(parameters, [PeakReducer(), FinalReducer(), MeanVarianceReducer()],
+                                                     early_stopping)
+    peak_result, final_result, mean_variance_result = [reducer.get_result() for reducer in reducers]
+    
+    available_statuses = initialised_model.model.available_statuses
+    for status, code in available_statuses.items():
+        counts = np.array([trend['trends']['node_count'][code] for trend in trends])
+        assert np.array_equal(peak_result[status + '_peak'], counts.max(axis = 1))
+        assert np.array_equal(final_result[status + '_final'], counts[:, -1])
+        assert np.allclose(mean_variance_result[status + '_mean'], counts.mean(axis = 0))
+
+@pytest.mark.parametrize('batch_size', [None, 3])
+def test_grid_runs_match_batched_runs(batch_size):
+    from nidmod.diffusionmodel.compiledmodel import CompiledDiffusionModel
+    from nidmod.parameter_sweeper import ParameterGridDiffusion
+    graph = nx.gnp_random_graph(80, 0.06, seed = 5)
+    parameter_grid = {'beta': [0.05, 0.3], 'gamma': [0.02, 0.2], 'fraction_infected': [0.05, 0.1]}
+    parameter_grid_diffusion = ParameterGridDiffusion(graph, CustomDiffusionModel.SIR, parameter_grid)
+    simulation_setup = [7, 25, None, None, 13]
+    trend_stores = parameter_grid_diffusion.run_grid(simulation_setup, batch_size)
+    
+    # each grid point gives the same runs as the batched backend with its own model and the same seed
+    for custom_diffusion_model, trend_store in zip(parameter_grid_diffusion.custom_diffusion_models, trend_stores):
+        trends = CompiledDiffusionModel(graph, custom_diffusion_model).batched_runs(*simulation_setup,
+                                                                                    batch_size = batch_size)
+        for code, status in trend_store.statuses.items():
+            counts = np.array([trend['trends']['node_count'][code] for trend in trends])
+            assert np.array_equal(trend_store.node_counts[:, code, :], counts), status
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:58:19 2026
+
+@author: jnevin
+"""
+
+import numpy as np
+import pandas as pd
+from nidmod.datahandling.dataintegration import MatchClassifier
+
+def test_stratified_sample_does_not_exceed_sample_size():
+    # one large group and many small ones, each of which is given at least one row
+    rng = np.random.default_rng(0)
+    values = np.concatenate([np.zeros(900), rng.integers(1, 40, 100) / 10])
+    index = pd.MultiIndex.from_arrays([np.arange(1000), np.arange(1000) + 1000])
+    features = pd.DataFrame({'given_name': values, 'surname': values[::-1]}, index = index)
+    num_groups = len(features.round(1).drop_duplicates())
+    
+    for sample_size in [num_groups, num_groups + 5, 150, 400]:
+        sample = MatchClassifier('KMeansClassifier', features, sample_size = sample_size, seed = 1).get_training_sample()
+        assert len(sample) <= sample_size
+        assert len(sample.round(1).drop_duplicates()) == num_groups
+        assert sample.index.is_unique
+
+def test_models_predict_on_chunked_and_unchunked_features():
+    from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+    from nidmod.datahandling.dataintegration import FeatureSetup
+    
+    graphs, true_matches = SyntheticNetworkGenerator(200, seed = 2).generate(2)
+    dfs = [pd.DataFrame.from_dict(dict(graph.nodes(data = True)), orient = 'index') for graph in graphs]
+    features = FeatureSetup(BLOCKS, COMPARES, *dfs).calculate_features()
+    chunked_setup = FeatureSetup(BLOCKS, COMPARES, *dfs, chunk_size = 100)
+    chunked_features = chunked_setup.calculate_features()
+    assert (chunked_features.dtypes == np.float32).all()
+    
+    # a model fit on one kind of features predicts on the other, directly or as a match filter
+    for fit_features, predict_features in [(features, chunked_features), (chunked_features, features)]:
+        match_classifier = MatchClassifier('KMeansClassifier', fit_features)
+        model = match_classifier.fit_model()
+        matches = match_classifier.predict(predict_features)
+        assert set(matches) == set(match_classifier.predict(fit_features))
+        assert set(chunked_setup.calculate_matches(model.predict)) == set(matches)
+
+def test_sampled_fit_is_cached():
+    from nidmod.stagecache import StageCache
+    
+    rng = np.random.default_rng(3)
+    index = pd.MultiIndex.from_arrays([np.arange(1000), np.arange(1000) + 1000])
+    features = pd.DataFrame({'given_name': rng.integers(0, 2, 1000), 'surname': rng.integers(0, 2, 1000)},
+                            index = index).astype(float)
+    model_cache = StageCache()
+    
+    # the same features and sampling options give the same (cached) model, without sampling again
+    for sampling in ['stratified', 'random']:
+        model = MatchClassifier('KMeansClassifier', features, sample_size = 100, sampling = sampling,
+                                model_cache = model_cache).fit_model()
+        match_classifier = MatchClassifier('KMeansClassifier', features, sample_size = 100, sampling = sampling,
+                                           model_cache = model_cache)
+        match_classifier.get_training_sample = None
+        assert match_classifier.fit_model() is model
+    assert len(model_cache) == 2
+    
+    # another seed draws another sample
+    MatchClassifier('KMeansClassifier', features, sample_size = 100, seed = 1, model_cache = model_cache).fit_model()
+    assert len(model_cache) == 3
+
+# returns the sets of records linked together by a set of matches
+def get_entities(records, matches):
+    import networkx as nx
+    match_graph = nx.Graph()
+    match_graph.add_nodes_from(records)
+    match_graph.add_edges_from(matches)
+    return set(frozenset(component) for component in nx.connected_components(match_graph))
+
+def test_source_linker_matches_pairwise_linking():
+    from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+    from nidmod.datahandling.dataintegration import FeatureSetup, SourceLinker
+    
+    for seed in range(4):
+        graphs, truth = SyntheticNetworkGenerator(150, attribute_noise = 0, seed = seed).generate(3)
+        dfs = [pd.DataFrame.from_dict(dict(graph.nodes(data = True)), orient = 'index') for graph in graphs]
+        records = [record for df in dfs for record in df.index]
+        source_linker = SourceLinker(BLOCKS, COMPARES, 'KMeansClassifier', dfs)
+        source_linker.link_sources()
+        
+        # linking every pair of sources separately finds the same entities as the running index
+        pairwise_matches = []
+        for i in range(len(dfs)):
+            for j in range(i + 1, len(dfs)):
+                features = FeatureSetup(BLOCKS, COMPARES, dfs[i], dfs[j]).calculate_features()
+                pairwise_matches.extend(MatchClassifier('KMeansClassifier', features).predict(features))
+        entity_index = source_linker.entity_index
+        entities = set(frozenset(group.index) for entity, group in entity_index.groupby(entity_index))
+        assert entities == get_entities(records, pairwise_matches)
+        assert get_entities(records, source_linker.matches) == entities
+        
+        # records of one source are never compared, so a duplicate of a new entity stays apart
+        matched = set(source_linker.matches.get_level_values(0)).union(source_linker.matches.get_level_values(1))
+        unmatched = [record for record in dfs[1].index if record not in matched]
+        duplicated_df = pd.concat([dfs[1], dfs[1].loc[[unmatched[0]]].rename(index = {unmatched[0]: 'duplicate'})])
+        source_linker = SourceLinker(BLOCKS, COMPARES, 'KMeansClassifier', [dfs[0], duplicated_df, dfs[2]])
+        source_linker.link_sources()
+        assert source_linker.entity_index['duplicate'] != source_linker.entity_index[unmatched[0]]
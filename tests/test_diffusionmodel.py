@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:41:55 2026
+
+@author: jnevin
+"""
+
+import networkx as nx
+import pytest
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel
+from nidmod.parameter_sweeper import MultiNetworkDiffusion
+
+def test_available_statuses_match_ndlib():
+    pytest.importorskip('ndlib')
+    custom_diffusion_model = CustomDiffusionModel(['Susceptible', 'Infected', 'Susceptible', 'Removed'],
+                                                  {'NodeStochastic': {'c1': [0.2, 'Infected'], 'c2': [0.1]}},
+                                                  [['Susceptible', 'Infected', 'c1'], ['Infected', 'Removed', 'c2']],
+                                                  [['fraction_infected', 0.2]])
+    model = InitialisedDiffusionModel(nx.path_graph(5), custom_diffusion_model).model
+    assert list(custom_diffusion_model.get_available_statuses().items()) == list(model.available_statuses.items())
+
+def test_parallel_analysers_have_the_model_statuses():
+    pytest.importorskip('ndlib')
+    graphs = [nx.gnp_random_graph(30, 0.1, seed = seed) for seed in range(3)]
+    custom_diffusion_model = CustomDiffusionModel.SIR(0.2, 0.1, 0.1)
+    multi_network_diffusion = MultiNetworkDiffusion(graphs, custom_diffusion_model, backend = 'batched', lazy = True)
+    multi_results_analyser = multi_network_diffusion.run_diffusion_model([4, 10], n_workers = 2)
+    serial_statistics = multi_network_diffusion.run_graph(0, [4, 10], statistics_only = True)
+    
+    expected = InitialisedDiffusionModel(graphs[0], custom_diffusion_model).model.available_statuses
+    for graph, results_analyser in zip(graphs, multi_results_analyser.results_analysers):
+        assert results_analyser.model.available_statuses == expected
+        assert results_analyser.model.graph is graph
+        assert set(results_analyser.get_average_statistics()) == set(serial_statistics)
+
+def test_identical_graphs_are_simulated_separately_by_default():
+    graphs = [nx.path_graph(10), nx.path_graph(10)]
+    custom_diffusion_model = CustomDiffusionModel.SIR(0.2, 0.1, 0.2)
+    assert MultiNetworkDiffusion(graphs, custom_diffusion_model, lazy = True).duplicate_groups == [[0], [1]]
+    assert MultiNetworkDiffusion(graphs, custom_diffusion_model, lazy = True,
+                                 deduplicate = True).duplicate_groups == [[0, 1]]
+
+def test_compiled_backends_do_not_build_an_ndlib_model():
+    import subprocess
+    import sys
+    code = ('import sys, networkx as nx\n'
+            'from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel, InitialisedDiffusionModel\n'
+            'for backend in ["compiled", "batched"]:\n'
+            '    model = InitialisedDiffusionModel(nx.path_graph(5), CustomDiffusionModel.SIR(0.2, 0.1, 0.2), backend)\n'
+            '    model.run_diffusion_model([2, 5])\n'
+            'print(any(module.startswith("ndlib") for module in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, check = True)
+    assert output.stdout.strip() == 'False'
+
+def test_models_are_only_initialised_where_graphs_are_simulated():
+    graphs = [nx.gnp_random_graph(30, 0.1, seed = seed) for seed in range(3)]
+    multi_network_diffusion = MultiNetworkDiffusion(graphs, CustomDiffusionModel.SIR(0.2, 0.1, 0.1), backend = 'batched')
+    
+    # a parallel run initialises the models in the workers only
+    multi_network_diffusion.run_diffusion_model([2, 5], n_workers = 2)
+    stage_table = multi_network_diffusion.instrumentation.get_stage_table()
+    assert sorted(stage_table[stage_table['stage'] == 'initialisation']['label']) == [0, 1, 2]
+    assert multi_network_diffusion._diffusion_models == {}
+    
+    # a serial run initialises them once and keeps them
+    multi_network_diffusion.instrumentation.clear()
+    multi_network_diffusion.run_diffusion_model([2, 5])
+    multi_network_diffusion.run_diffusion_model([2, 5])
+    stage_table = multi_network_diffusion.instrumentation.get_stage_table()
+    assert list(stage_table[stage_table['stage'] == 'initialisation']['label']) == [0, 1, 2]
+    assert [model.graph for model in multi_network_diffusion.graph_assc_diff_models] == graphs
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:47:33 2026
+
+@author: jnevin
+"""
+
+from nidmod.benchmarking.benchmarks import IMPORT_MODULES, DEFERRED_MODULES, measure_import_times
+
+# seconds, well above the import times of the modules once their heavy dependencies are deferred
+IMPORT_BUDGET = 1.5
+
+def test_imports_defer_optional_dependencies():
+    import_times = measure_import_times(['nidmod'] + IMPORT_MODULES + ['nidmod.jobserver'], repeats = 2)
+    for module, measurements in import_times.items():
+        assert measurements['deferred_loaded'] == [], module
+        assert measurements['time'] < IMPORT_BUDGET, module
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:08:41 2026
+
+@author: jnevin
+"""
+
+import pytest
+from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel
+from nidmod.integration_pipeline import IntegrationPipeline
+
+STAGES = ['graph_attribute_dfs', 'candidate_links', 'features', 'matches', 'integrated_network',
+          'diffusion_model', 'trends', 'results_analyser']
+
+# returns a pipeline running an SIR model on the integration of the graphs
+def get_pipeline(graphs):
+    custom_diffusion_model = CustomDiffusionModel.SIR(0.2, 0.1, 0.1)
+    return IntegrationPipeline(graphs, BLOCKS, COMPARES, 'KMeansClassifier', 'connected_components_integration',
+                               custom_diffusion_model.statuses, custom_diffusion_model.compartments,
+                               custom_diffusion_model.transition_rules, custom_diffusion_model.parameters,
+                               [2, 10])
+
+# returns the names of the stages run since the given number of records
+def get_stages_run(pipeline, num_records):
+    return [record['stage'] for record in pipeline.instrumentation.records[num_records:]]
+
+def test_parameters_invalidate_their_downstream_stages():
+    pytest.importorskip('ndlib')
+    graphs, truth = SyntheticNetworkGenerator(100, seed = 6).generate(2)
+    pipeline = get_pipeline(graphs)
+    pipeline.run()
+    assert all(pipeline.is_computed(stage) for stage in STAGES)
+
+    # every parameter is an input of some stage
+    stage_dependencies = pipeline.get_stage_dependencies()
+    dependencies = set(dependency for stage_inputs in stage_dependencies.values() for dependency in stage_inputs)
+    assert set(pipeline.parameter_names) <= dependencies
+    assert set(stage_dependencies) == set(STAGES)
+
+    # a new simulation setup only reruns the simulation and analysis
+    num_records = len(pipeline.instrumentation.records)
+    pipeline.simulation_parameters = [3, 10]
+    assert [stage for stage in STAGES if not pipeline.is_computed(stage)] == ['trends', 'results_analyser']
+    pipeline.run()
+    assert get_stages_run(pipeline, num_records) == ['simulation', 'analysis']
+    assert len(pipeline.trends) == 3
+
+    # a new clustering algorithm reruns everything from the integration
+    num_records = len(pipeline.instrumentation.records)
+    pipeline.clustering_alg = 'center_integration'
+    pipeline.run()
+    assert get_stages_run(pipeline, num_records) == ['integration', 'initialisation', 'simulation', 'analysis']
+
+    # assigning an attribute that is not a parameter keeps every stage
+    pipeline.label = 'center'
+    assert all(pipeline.is_computed(stage) for stage in STAGES)
+    pipeline.compares = COMPARES
+    assert [stage for stage in STAGES if pipeline.is_computed(stage)] == ['graph_attribute_dfs', 'candidate_links']
+
+def test_linked_sources_are_one_stage():
+    graphs, truth = SyntheticNetworkGenerator(60, seed = 7).generate(3)
+    pipeline = get_pipeline(graphs)
+    stage_dependencies = pipeline.get_stage_dependencies()
+    assert set(stage_dependencies) == set(STAGES + ['source_linker'])
+    assert set(pipeline.parameter_names) <= set(dependency for stage_inputs in stage_dependencies.values()
+                                                for dependency in stage_inputs)
+
+    pipeline.integrated_network
+    num_records = len(pipeline.instrumentation.records)
+    # the features come from the source linker, so a new classifier setting relinks the sources
+    pipeline.fit_seed = 1
+    assert not pipeline.is_computed('source_linker') and not pipeline.is_computed('features')
+    assert pipeline.is_computed('graph_attribute_dfs')
+    pipeline.integrated_network
+    assert get_stages_run(pipeline, num_records) == ['linkage', 'integration']
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:52:06 2026
+
+@author: jnevin
+"""
+
+import asyncio
+import networkx as nx
+import pytest
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel
+from nidmod.jobserver import JobServer, JobClient
+
+# returns a simulation request for a graph file
+def simulate_request(path, simulation_setup):
+    custom_diffusion_model = CustomDiffusionModel.SIR(0.2, 0.1, 0.1)
+    return {'job': 'simulate', 'graph': {'path': path}, 'simulation': simulation_setup,
+            'model': {'statuses': custom_diffusion_model.statuses, 'compartments': custom_diffusion_model.compartments,
+                      'transition_rules': custom_diffusion_model.transition_rules,
+                      'parameters': custom_diffusion_model.parameters}}
+
+def test_jobs_round_trip(tmp_path):
+    path = str(tmp_path / 'graph.edgelist')
+    nx.write_edgelist(nx.gnp_random_graph(60, 0.08, seed = 2), path)
+
+    async def run_jobs():
+        job_server = JobServer(port = 0, n_workers = 2)
+        await job_server.start()
+        loop = asyncio.get_running_loop()
+        client = await loop.run_in_executor(None, lambda: JobClient(port = job_server.port))
+        def submit(request):
+            return loop.run_in_executor(None, client.submit, request)
+        try:
+            # a cold request loads the graph and initialises the model, a warm one reuses them
+            cold = await submit(dict(simulate_request(path, [5, 20, None, None, 1]), id = 'cold'))
+            warm = await submit(simulate_request(path, [5, 20, None, None, 1]))
+            other_seed = await submit(simulate_request(path, [5, 20, None, None, 2]))
+            assert warm == cold and other_seed != cold
+            statistics = await submit({'job': 'statistics'})
+            assert statistics['models']['misses'] == 1 and statistics['models']['hits'] == 2
+            assert statistics['graphs']['misses'] == 1
+
+            analysis = await submit({'job': 'analyse', 'graph': {'path': path}, 'metrics': ['num_nodes']})
+            assert analysis['num_nodes'] == 60
+
+            # errors are returned to the client rather than stopping the server
+            with pytest.raises(RuntimeError, match = 'Unknown job'):
+                await submit({'job': 'train'})
+            with pytest.raises(RuntimeError):
+                await submit(simulate_request(str(tmp_path / 'missing.edgelist'), [1, 5]))
+
+            # identical seeded requests in flight share one result, unseeded ones run separately
+            num_coalesced = job_server.num_coalesced
+            results = await asyncio.gather(*[job_server.submit(simulate_request(path, [5, 20, None, None, 3]))
+                                             for i in range(3)])
+            assert results[0] == results[1] == results[2]
+            assert job_server.num_coalesced == num_coalesced + 2
+            await asyncio.gather(*[job_server.submit(simulate_request(path, [5, 20])) for i in range(3)])
+            assert job_server.num_coalesced == num_coalesced + 2
+            assert len(job_server.in_flight) == 0
+        finally:
+            client.close()
+            job_server.close()
+
+    asyncio.run(run_jobs())
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:06:12 2026
+
+@author: jnevin
+"""
+
+import networkx as nx
+from nidmod.analyser.networkanalysis import get_graph_properties
+
+def test_closeness_error_bounds_the_closeness_estimates():
+    for seed in range(5):
+        graph = nx.connected_watts_strogatz_graph(300, 6, 0.2, seed = seed)
+        properties = get_graph_properties(graph, ['closeness'], closeness_samples = 100, seed = seed)
+        closeness = nx.closeness_centrality(graph)
+        
+        assert 0 < properties['closeness_error'] < 1
+        assert max(abs(properties['closeness'][node] - closeness[node]) for node in graph) <= properties['closeness_error']
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:03:27 2026
+
+@author: jnevin
+"""
+
+import pytest
+from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+from nidmod.parameter_sweeper import ParameterSweeper
+
+CLUSTERING_ALGS = ['connected_components_integration', 'center_integration', 'merge_center_integration']
+
+@pytest.fixture(scope = 'module')
+def graphs():
+    graphs, truth = SyntheticNetworkGenerator(200, seed = 1).generate(2)
+    return graphs
+
+# returns the number of times each stage was computed rather than taken from the cache
+def count_computed(parameter_sweeper):
+    stage_table = parameter_sweeper.instrumentation.get_stage_table()
+    return stage_table[~stage_table['cached']].groupby('stage').size().to_dict()
+
+@pytest.mark.parametrize('cache_size', [None, 1])
+def test_shared_stages_are_not_computed_again(graphs, cache_size):
+    setups = [(BLOCKS, COMPARES, 'KMeansClassifier', clustering_alg) for clustering_alg in CLUSTERING_ALGS]
+    parameter_sweeper = ParameterSweeper(setups, graphs, cache_size = cache_size)
+    parameter_sweeper.get_integrated_networks()
+    
+    # without a cache every setup computes its stages once, otherwise they are shared
+    num_computed = len(setups) if cache_size == 1 else 1
+    assert count_computed(parameter_sweeper) == {'candidate_links': num_computed, 'features': num_computed,
+                                                 'classification': num_computed, 'integration': len(setups)}
+    # the only cached stages are the classifications of the setups sharing one
+    stage_table = parameter_sweeper.instrumentation.get_stage_table()
+    assert list(stage_table[stage_table['cached']]['stage']) == ['classification'] * (len(setups) - num_computed)
+    assert parameter_sweeper.pred_matches is not None
+
+def test_parallel_setups_share_their_stages(graphs):
+    block_setups = [BLOCKS, {'Block': [['suburb', 'suburb']]}]
+    setups = [(blocks, COMPARES, 'KMeansClassifier', clustering_alg)
+              for blocks in block_setups for clustering_alg in CLUSTERING_ALGS]
+    parameter_sweeper = ParameterSweeper(setups, graphs)
+    integrated_networks = parameter_sweeper.get_integrated_networks(n_workers = 4)
+    
+    # each worker computes the stages shared by its group of setups once
+    assert count_computed(parameter_sweeper) == {'candidate_links': 2, 'features': 2, 'classification': 2,
+                                                 'integration': len(setups)}
+    serial_networks = ParameterSweeper(setups, graphs).get_integrated_networks()
+    assert [sorted(network.edges()) for network in integrated_networks] == \
+        [sorted(network.edges()) for network in serial_networks]
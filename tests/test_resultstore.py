@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:52 2026
+
+@author: jnevin
+"""
+
+import math
+import os
+import networkx as nx
+import numpy as np
+from nidmod.benchmarking.generator import SyntheticNetworkGenerator, BLOCKS, COMPARES
+from nidmod.diffusionmodel.diffusionmodel import CustomDiffusionModel
+from nidmod.parameter_sweeper import ParameterSweeper, MultiNetworkDiffusion
+from nidmod.resultstore import ResultStore, LazyResultList
+
+# returns the nodes or edges of a graph with NaN replaced, as NaN is not equal to itself
+def describe(items):
+    return sorted((repr(item[:-1]), dict((name, 'nan' if isinstance(value, float) and math.isnan(value) else value)
+                                         for name, value in item[-1].items())) for item in items)
+
+def test_networks_round_trip(tmp_path):
+    result_store = ResultStore(str(tmp_path))
+    graph = nx.MultiDiGraph(name = 'integrated')
+    graph.add_node(('a', 1), given_name = 'ann', age = 30)
+    graph.add_node('b', given_name = float('nan'))
+    graph.add_node(3)
+    graph.add_edge(('a', 1), 'b', weight = 1.5)
+    graph.add_edge(('a', 1), 'b', key = 'second', weight = float('nan'))
+    graph.add_edge(3, 3)
+    simple_graph = nx.Graph(nx.path_graph(4))
+
+    for key, stored_graph in [('multigraph', graph), ('graph', simple_graph)]:
+        result_store.save_network(key, stored_graph)
+        loaded = result_store.load_network(key)
+        assert type(loaded) is type(stored_graph)
+        assert loaded.graph == stored_graph.graph
+        assert list(loaded.nodes()) == list(stored_graph.nodes())
+        assert describe(loaded.nodes(data = True)) == describe(stored_graph.nodes(data = True))
+        if stored_graph.is_multigraph():
+            assert describe(loaded.edges(keys = True, data = True)) == describe(stored_graph.edges(keys = True, data = True))
+        else:
+            assert describe(loaded.edges(data = True)) == describe(stored_graph.edges(data = True))
+    # attributes missing from a node stay missing rather than becoming NaN
+    assert result_store.load_network('multigraph').nodes[3] == {}
+
+    lazy_networks = result_store.get_lazy_networks(['graph', 'multigraph'])
+    assert isinstance(lazy_networks[1:], LazyResultList) and len(lazy_networks[1:]) == 1
+    assert [loaded.number_of_edges() for loaded in lazy_networks] == [3, 3]
+    assert result_store.keys('networks') == ['graph', 'multigraph']
+
+def test_metadata_is_written_last(tmp_path, monkeypatch):
+    result_store = ResultStore(str(tmp_path))
+    written = []
+    replace = os.replace
+    def record_replace(source, destination):
+        written.append(os.path.basename(destination))
+        replace(source, destination)
+    monkeypatch.setattr(os, 'replace', record_replace)
+
+    graph = nx.Graph()
+    graph.add_edge(0, 1, weight = 2)
+    result_store.save_network('network', graph)
+    result_store.save_trends('trends', [{'trends': {'node_count': {0: [2, 1], 1: [0, 1]}}}], {'S': 0, 'I': 1}, 2)
+    assert written[-1] == 'trends.json' and written[-2] == 'trends.npy'
+    assert written.index('network.json') == len(written) - 3
+
+    # a result missing its metadata, e.g. from an interrupted run, is not stored
+    os.remove(os.path.join(str(tmp_path), 'networks', 'network.json'))
+    assert not result_store.has_network('network') and 'network' not in result_store
+    assert result_store.has_trends('trends')
+
+def test_resumed_runs_skip_stored_results(tmp_path):
+    graphs, truth = SyntheticNetworkGenerator(100, seed = 4).generate(2)
+    setups = [(BLOCKS, COMPARES, 'KMeansClassifier', clustering_alg)
+              for clustering_alg in ['connected_components_integration', 'center_integration']]
+    expected = ParameterSweeper(setups, graphs).get_integrated_networks()
+    ParameterSweeper(setups[:1], graphs, result_store = str(tmp_path)).get_integrated_networks()
+
+    # only the setup that was not stored is integrated
+    parameter_sweeper = ParameterSweeper(setups, graphs, result_store = str(tmp_path))
+    integrated_networks = parameter_sweeper.get_integrated_networks()
+    assert isinstance(integrated_networks, LazyResultList)
+    stage_table = parameter_sweeper.instrumentation.get_stage_table()
+    assert list(stage_table[stage_table['stage'] == 'integration']['label']) == [1]
+    for network, expected_network in zip(integrated_networks, expected):
+        assert describe(network.nodes(data = True)) == describe(expected_network.nodes(data = True))
+        assert sorted(map(repr, network.edges())) == sorted(map(repr, expected_network.edges()))
+
+    # stored trends are loaded without initialising or simulating the model again
+    custom_diffusion_model = CustomDiffusionModel.SIR(0.2, 0.1, 0.1)
+    first = MultiNetworkDiffusion(integrated_networks[:1], custom_diffusion_model, backend = 'batched',
+                                  lazy = True, result_store = str(tmp_path))
+    first_statistics = first.get_average_stat_comparison([3, 10])
+    multi_network_diffusion = MultiNetworkDiffusion([integrated_networks[0], graphs[0]], custom_diffusion_model,
+                                                    backend = 'batched', lazy = True, result_store = str(tmp_path))
+    statistics = multi_network_diffusion.get_average_stat_comparison([3, 10])
+    stage_table = multi_network_diffusion.instrumentation.get_stage_table()
+    assert list(stage_table[stage_table['stage'] == 'initialisation']['label']) == [1]
+    assert list(stage_table[stage_table['stage'] == 'simulation']['cached']) == [True, False]
+    assert np.allclose(statistics.iloc[:1].values.astype(float), first_statistics.values.astype(float), equal_nan = True)
+    assert len(ResultStore(str(tmp_path)).keys('trends')) == 2